@@ -47,6 +47,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Профилирование запросов, включается переменной окружения RECIPE_PROFILING=1 (см. recipeapp.profiling)
+    'recipeapp.profiling.ProfilingMiddleware',
+    # Выбор реплики для чтения, если заданы реплики (см. recipeapp.routers)
+    'recipeapp.routers.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -60,7 +64,8 @@ ROOT_URLCONF = 'mysite.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с замером времени рендеринга для профилирования (см. recipeapp.profiling)
+        'BACKEND': 'recipeapp.profiling.ProfilingDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -80,13 +85,122 @@ WSGI_APPLICATION = 'mysite.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Настройки SQLite для локального развертывания. Журнал WAL позволяет читать во время записи,
+# synchronous=NORMAL в режиме WAL сохраняет целостность базы при сбое, не синхронизируя диск
+# на каждой транзакции. Транзакции начинаются с BEGIN IMMEDIATE: блокировка записи берется сразу,
+# и одновременные записи ждут друг друга до timeout секунд, а не падают с "database is locked"
+SQLITE_PRAGMAS = [
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA temp_store = MEMORY',
+    # 64 МБ страничного кеша и 256 МБ файла, отображенного в память, на подключение
+    'PRAGMA cache_size = -65536',
+    'PRAGMA mmap_size = 268435456',
+]
+
+# Подключения живут CONN_MAX_AGE секунд и переиспользуются следующими запросами;
+# перед переиспользованием Django проверяет, что подключение еще работает
+CONN_MAX_AGE = int(os.environ.get('RECIPE_CONN_MAX_AGE', 60))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': ';'.join(SQLITE_PRAGMAS),
+        },
     }
 }
 
+# Реплики для чтения: пути к файлам SQLite через запятую в RECIPE_DB_REPLICAS. Локально реплики -
+# копии основной базы, которые обновляет команда sync_replicas (см. recipeapp.routers)
+RECIPE_DB_REPLICAS = []
+for number, path in enumerate(filter(None, os.environ.get('RECIPE_DB_REPLICAS', '').split(',')), 1):
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path.strip(),
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+            # Случайная запись в реплику завершится ошибкой, а не разойдется с основной базой
+            'init_command': ';'.join(SQLITE_PRAGMAS + ['PRAGMA query_only = ON']),
+        },
+        # В тестах реплики читают тестовую основную базу
+        'TEST': {'MIRROR': 'default'},
+    }
+    RECIPE_DB_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['recipeapp.routers.ReplicaRouter']
+
+# Сколько секунд после изменения данных читать из основной базы: оценка отставания реплик
+RECIPE_DB_REPLICA_LAG = 5
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Бэкенд выбирается переменной окружения RECIPE_CACHE_BACKEND: locmem, file или redis.
+# Версии ключей кеша (recipeapp.cache) должны быть общими для всех процессов сервера, поэтому
+# locmem подходит только для разработки с одним процессом: в рабочем окружении нужен redis
+# (file - только для одного сервера). manage.py check --deploy сообщает об ошибке при locmem
+
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'recipeapp',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('RECIPE_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('RECIPE_CACHE_LOCATION', 'redis://127.0.0.1:6379/1'),
+    },
+}
+
+CACHES = {
+    'default': CACHE_BACKENDS[os.environ.get('RECIPE_CACHE_BACKEND', 'locmem')],
+}
+
+# Время жизни закешированных страниц и фрагментов в секундах (см. recipeapp.cache)
+RECIPE_CACHE_TIMEOUT = 600
+
+# Максимальное число результатов полнотекстового поиска (см. recipeapp.search)
+RECIPE_SEARCH_MAX_RESULTS = 1000
+
+# Профилирование запросов: заголовок Server-Timing и метрики по адресу /recipe/metrics/
+RECIPE_PROFILING = os.environ.get('RECIPE_PROFILING') == '1'
+
+# Сколько раз одинаковый SQL-запрос может выполниться за запрос, прежде чем будет записано предупреждение о N+1
+RECIPE_PROFILING_DUPLICATE_THRESHOLD = 3
+
+# Ограничение частоты POST-запросов: область -> (запросов подряд, за сколько секунд восстанавливаются).
+# Считается отдельно по пользователю и по IP-адресу (см. recipeapp.ratelimit)
+RECIPE_RATE_LIMITS = {
+    'comment': (5, 60),
+    'rating': (10, 60),
+}
+
+# Где хранятся счетчики лимитов: local - в памяти процесса, cache - в кеше Django (общий для процессов
+# при RECIPE_CACHE_BACKEND=file или redis)
+RECIPE_RATELIMIT_BACKEND = os.environ.get('RECIPE_RATELIMIT_BACKEND', 'cache')
+
+# Накопление оценок: оценки, поступившие за это число секунд, записываются одной транзакцией
+# (см. recipeapp.ratings). 0 - каждая оценка записывается сразу
+RECIPE_RATING_COALESCE_SECONDS = float(os.environ.get('RECIPE_RATING_COALESCE_SECONDS', 0))
+
+# Фоновые задачи (см. recipeapp.tasks) выполняет команда run_worker. RECIPE_TASKS_EAGER=1 выполняет их
+# сразу после фиксации транзакции в процессе веб-сервера, без воркера
+RECIPE_TASKS_EAGER = os.environ.get('RECIPE_TASKS_EAGER') == '1'
+
+# Задержка перед первым повтором упавшей задачи, секунд; каждая следующая вдвое больше
+RECIPE_TASKS_RETRY_DELAY = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -128,3 +242,7 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Рецепты и ингредиенты, пролежавшие в архиве больше этого числа дней, команда archive_cold_storage
+# переносит в архивные таблицы (см. recipeapp.coldstorage)
+RECIPE_COLD_STORAGE_DAYS = 180
@@ -1,9 +1,14 @@
 from django.contrib import admin
 from django.db.models import QuerySet
 from django.http import HttpRequest
+from django.utils import timezone
 
+from . import cache as recipe_cache
+from . import facets, pantry, recommendations
 from .admin_mixins import ExportAsCSVMixin
-from .models import Recipe, Ingredient, Category, RecipeIngredient
+from .export import RECIPE_FIELDS, iter_recipe_records
+from .models import Recipe, Ingredient, Category, RecipeIngredient, Task, RecipeArchive, IngredientArchive
+from .templatetags.recipe_images import recipe_image
 
 
 class RecipeIngredientInline(admin.TabularInline):
@@ -11,14 +16,30 @@ class RecipeIngredientInline(admin.TabularInline):
     extra = 1  # Количество пустых форм для добавления ингредиентов
 
 
+def archived_changed(queryset: QuerySet, recipe_ids):
+    # UPDATE идет мимо сигналов: сбрасываем кеш страниц самих рецептов, а не только списков
+    if queryset.model is Recipe:
+        recipe_cache.bump(recipe_cache.INGREDIENTS)
+        recipe_cache.invalidate_recipes(recipe_ids)
+        recommendations.schedule_refresh(recipe_ids)
+        pantry.record_changes()
+        facets.refresh_counts()
+    else:
+        recipe_cache.bump(recipe_cache.RECIPES, recipe_cache.INGREDIENTS)
+
+
 @admin.action(description='Archive Recipe')
 def mark_archived(modeladmin: admin.ModelAdmin, request: HttpRequest, queryset: QuerySet):
-    queryset.update(archived=True)
+    recipe_ids = list(queryset.filter(archived=False).values_list('pk', flat=True))
+    queryset.archive()
+    archived_changed(queryset, recipe_ids)
 
 
 @admin.action(description='Unarchive Recipe')
 def mark_unarchived(modeladmin: admin.ModelAdmin, request: HttpRequest, queryset: QuerySet):
-    queryset.update(archived=False)
+    recipe_ids = list(queryset.filter(archived=True).values_list('pk', flat=True))
+    queryset.unarchive()
+    archived_changed(queryset, recipe_ids)
 
 
 @admin.register(Ingredient)
@@ -29,13 +50,14 @@ class IngredientAdmin(admin.ModelAdmin):
     search_fields = ('name', 'description')
     list_filter = ('archived',)
     actions = [mark_archived, mark_unarchived]
+    readonly_fields = ('archived_at',)
 
     fieldsets = [
         (None, {
             'fields': ('name', 'description', 'measure')
         }),
         ('Extra options', {
-            'fields': ('archived',),
+            'fields': ('archived', 'archived_at'),
             'classes': ('collapse',),
             'description': 'Поле для переноса записи в архив',
         })
@@ -51,13 +73,14 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin, ExportAsCSVMixin):
-    actions = ['mark_archived', 'mark_unarchived', 'export_csv']
+    actions = [mark_archived, mark_unarchived, 'export_csv', 'export_jsonl']
     inlines = [RecipeIngredientInline]
-    list_display = ('pk', 'name', 'description_short', 'categories_list', 'rate', 'created_by_verbose', 'archived')
+    list_display = ('pk', 'image_preview', 'name', 'description_short', 'categories_list', 'rate', 'rating_count', 'created_by_verbose', 'archived')
     list_display_links = ('pk', 'name')
     ordering = ('-rate',)
     search_fields = ('name', 'description')
     list_filter = ('archived', 'categories', 'created_by')
+    readonly_fields = ('archived_at',)
     fieldsets = [
         (None, {
             'fields': ('name', 'description', 'instructions', 'cooking_time', 'image')
@@ -67,7 +90,7 @@ class RecipeAdmin(admin.ModelAdmin, ExportAsCSVMixin):
             'classes': ('collapse', 'wide')
         }),
         ('Extra options', {
-            'fields': ('archived',),
+            'fields': ('archived', 'archived_at'),
             'classes': ('collapse',),
             'description': 'Поле для переноса записи в архив',
         })
@@ -78,6 +101,10 @@ class RecipeAdmin(admin.ModelAdmin, ExportAsCSVMixin):
             return obj.description
         return obj.description[:48] + '...'
 
+    def image_preview(self, obj: Recipe) -> str:
+        return recipe_image(obj, 'admin', style='max-width: 60px; height: auto;')
+    image_preview.short_description = 'Image'
+
     def categories_list(self, obj):
         return ", ".join([category.name for category in obj.categories.all()])
     categories_list.short_description = 'Categories'
@@ -86,4 +113,47 @@ class RecipeAdmin(admin.ModelAdmin, ExportAsCSVMixin):
         return Recipe.objects.select_related('created_by').prefetch_related('recipe_ingredients__ingredient', 'categories')
 
     def created_by_verbose(self, obj: Recipe) -> str:
-        return obj.created_by.first_name or obj.created_by.username
\ No newline at end of file
+        return obj.created_by.first_name or obj.created_by.username
+
+    def get_export_fields(self):
+        return RECIPE_FIELDS
+
+    def get_export_headers(self):
+        return RECIPE_FIELDS
+
+    def get_export_records(self, queryset):
+        # Категории и ингредиенты подгружаются пакетно для каждой порции записей
+        return iter_recipe_records(queryset, self.export_chunk_size)
+
+
+@admin.action(description='Retry Task')
+def retry_tasks(modeladmin: admin.ModelAdmin, request: HttpRequest, queryset: QuerySet):
+    queryset.exclude(status=Task.RUNNING).update(
+        status=Task.PENDING, attempts=0, run_at=timezone.now(), finished_at=None, last_error=''
+    )
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'name', 'status', 'attempts', 'max_attempts', 'run_at', 'locked_by', 'finished_at')
+    list_filter = ('status', 'name')
+    search_fields = ('name',)
+    ordering = ('-pk',)
+    actions = [retry_tasks]
+    readonly_fields = ('name', 'payload', 'attempts', 'locked_by', 'locked_at', 'last_error', 'created_at', 'finished_at')
+
+
+@admin.register(RecipeArchive)
+class RecipeArchiveAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'name', 'archived_at', 'moved_at')
+    search_fields = ('name',)
+    ordering = ('-moved_at',)
+    readonly_fields = ('id', 'name', 'data', 'archived_at', 'moved_at')
+
+
+@admin.register(IngredientArchive)
+class IngredientArchiveAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'name', 'measure', 'archived_at', 'moved_at')
+    search_fields = ('name',)
+    ordering = ('-moved_at',)
+    readonly_fields = ('id', 'name', 'description', 'measure', 'archived_at', 'moved_at')
@@ -1,36 +1,51 @@
-import csv
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from django.utils.encoding import smart_str
 
+from .export import EXPORT_CHUNK_SIZE, csv_lines, jsonl_lines
+
 
 class ExportAsCSVMixin:
     """
-    Миксин для экспорта данных в CSV-файл.
+    Миксин для потокового экспорта данных в CSV-файл и JSON Lines.
     """
+    export_chunk_size = EXPORT_CHUNK_SIZE
 
-    def export_csv(self, request, queryset):
+    def get_export_fields(self):
+        return [field.name for field in self.model._meta.fields]
+
+    def get_export_headers(self):
+        return [smart_str(field.verbose_name) for field in self.model._meta.fields]
+
+    def get_export_records(self, queryset):
         """
-        Экспортирует выбранные объекты в CSV-файл.
+        Возвращает генератор словарей {поле: значение}. Записи читаются пачками по export_chunk_size.
         """
+        fields = self.get_export_fields()
+        for obj in queryset.order_by('pk').iterator(chunk_size=self.export_chunk_size):
+            yield {name: smart_str(getattr(obj, name)) for name in fields}
+
+    def _streaming_response(self, lines, content_type, extension):
         # Название модели
         model_name = self.model._meta.verbose_name_plural
+        response = StreamingHttpResponse(lines, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{model_name}.{extension}"'
+        return response
 
-        # Создаем HTTP-ответ с типом содержимого CSV
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="{model_name}.csv"'
-
-        # Создаем CSV-писатель
-        writer = csv.writer(response, delimiter=';')
-
-        # Заголовки столбцов
-        headers = [smart_str(field.verbose_name) for field in self.model._meta.fields]
-        writer.writerow(headers)
+    def export_csv(self, request, queryset):
+        """
+        Экспортирует выбранные объекты в CSV-файл.
+        """
+        lines = csv_lines(self.get_export_records(queryset), self.get_export_fields(), self.get_export_headers())
+        return self._streaming_response(lines, 'text/csv', 'csv')
 
-        # Данные
-        for obj in queryset:
-            row = [smart_str(getattr(obj, field.name)) for field in self.model._meta.fields]
-            writer.writerow(row)
+    export_csv.short_description = "Экспортировать выбранные объекты в CSV"
 
-        return response
+    def export_jsonl(self, request, queryset):
+        """
+        Экспортирует выбранные объекты в JSON Lines (один JSON-объект на строку).
+        """
+        return self._streaming_response(
+            jsonl_lines(self.get_export_records(queryset)), 'application/x-ndjson', 'jsonl'
+        )
 
-    export_csv.short_description = "Экспортировать выбранные объекты в CSV"
+    export_jsonl.short_description = "Экспортировать выбранные объекты в JSON Lines"
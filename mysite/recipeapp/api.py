@@ -0,0 +1,368 @@
+"""
+JSON API для чтения рецептов и ингредиентов.
+
+Записи сериализуются из .values() без создания экземпляров моделей, а
+параметр ?fields= ограничивает набор полей и связанных данных. Каждый
+ответ получает строгий ETag (версии групп кеша из recipeapp.cache, время
+изменения записей и адрес запроса) и Last-Modified по updated_at, поэтому
+клиент с If-None-Match получает 304 без выборки данных. Готовое тело
+ответа кешируется по ETag.
+
+Удаление записей не меняет Last-Modified, его учитывает только ETag.
+"""
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from django.views import View
+
+from recipeapp import cache as recipe_cache
+from recipeapp import pantry, shopping
+from recipeapp.filters import filter_recipes
+from recipeapp.models import Ingredient, Rating, Recipe, RecipeIngredient
+from recipeapp.pagination import KeysetPaginator
+
+RECIPE_FIELDS = (
+    'id', 'name', 'description', 'instructions', 'cooking_time', 'image', 'rate', 'rating_count',
+    'created_at', 'updated_at', 'created_by', 'categories',
+)
+INGREDIENT_FIELDS = ('id', 'name', 'description', 'measure', 'updated_at')
+
+# Поля, которые берутся из связанных таблиц, а не из столбцов .values()
+COLUMNS = {'created_by': 'created_by__username'}
+
+DEFAULT_LIMIT = 30
+MAX_LIMIT = 100
+
+TYPEAHEAD_LIMIT = 10
+TYPEAHEAD_MAX_LIMIT = 30
+# Верхняя граница диапазона строк с заданным префиксом
+PREFIX_END = '\U0010ffff'
+
+
+class InvalidParameter(Exception):
+    pass
+
+
+def _image_url(name):
+    return default_storage.url(name) if name else None
+
+
+def recipe_categories(recipe_ids):
+    """
+    Названия категорий рецептов одним запросом: {recipe_id: [название, ...]}.
+    """
+    categories = {recipe_id: [] for recipe_id in recipe_ids}
+    rows = (Recipe.categories.through.objects.filter(recipe_id__in=recipe_ids)
+            .order_by('category__name').values_list('recipe_id', 'category__name'))
+    for recipe_id, name in rows:
+        categories[recipe_id].append(name)
+    return categories
+
+
+class JSONAPIView(View):
+    """
+    Базовое представление JSON API с выбором полей и условными GET-запросами.
+    """
+    fields = ()
+    related_fields = ()
+    cache_namespaces = ()
+
+    def get_fields(self):
+        requested = self.request.GET.get('fields')
+        if not requested:
+            return list(self.fields)
+        fields = list(dict.fromkeys(name.strip() for name in requested.split(',') if name.strip()))
+        unknown = [name for name in fields if name not in self.fields]
+        if unknown:
+            raise InvalidParameter(f'Неизвестные поля: {", ".join(unknown)}. Доступны: {", ".join(self.fields)}')
+        return fields
+
+    def get_columns(self, fields, extra=()):
+        columns = [COLUMNS.get(name, name) for name in fields if name not in self.related_fields]
+        return list(dict.fromkeys([*columns, *extra]))
+
+    def serialize(self, row, fields):
+        record = {name: row[COLUMNS.get(name, name)] for name in fields if name not in self.related_fields}
+        if 'image' in record:
+            record['image'] = _image_url(record['image'])
+        return record
+
+    def get_cache_namespaces(self):
+        return self.cache_namespaces
+
+    def get_last_modified(self):
+        return None
+
+    def get_payload(self, fields):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        try:
+            fields = self.get_fields()
+            last_modified = self.get_last_modified()
+        except InvalidParameter as error:
+            return JsonResponse({'error': str(error)}, status=400, json_dumps_params={'ensure_ascii': False})
+        except Http404:
+            return JsonResponse({'error': 'Не найдено'}, status=404, json_dumps_params={'ensure_ascii': False})
+
+        versions = recipe_cache.get_versions(*self.get_cache_namespaces())
+        digest = hashlib.md5(repr((versions, last_modified, request.get_full_path())).encode()).hexdigest()
+        etag = quote_etag(digest)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            key = f'api:{type(self).__name__}:{digest}'
+            content = cache.get(key)
+            if content is None:
+                try:
+                    payload = self.get_payload(fields)
+                except InvalidParameter as error:
+                    return JsonResponse({'error': str(error)}, status=400, json_dumps_params={'ensure_ascii': False})
+                content = json.dumps(payload, cls=DjangoJSONEncoder, ensure_ascii=False)
+                cache.set(key, content, recipe_cache.cache_timeout())
+            response = HttpResponse(content, content_type='application/json')
+
+        response.headers['ETag'] = etag
+        if timestamp is not None:
+            response.headers['Last-Modified'] = http_date(timestamp)
+        return response
+
+
+class KeysetListAPIView(JSONAPIView):
+    """
+    Список с курсорной пагинацией: ?cursor=, ?limit= (не больше MAX_LIMIT).
+    """
+    model = None
+
+    def get_queryset(self):
+        return self.model.objects.all()
+
+    def get_ordering(self, queryset):
+        raise NotImplementedError
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.GET.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            raise InvalidParameter('limit должен быть числом')
+        return min(max(limit, 1), MAX_LIMIT)
+
+    def get_last_modified(self):
+        # По всей таблице: в выборке уже нет записей, которые из нее выпали (например, архивированных)
+        return self.model.objects.aggregate(last=Max('updated_at'))['last']
+
+    def add_related(self, records, rows, fields):
+        pass
+
+    def get_payload(self, fields):
+        queryset = self.get_queryset()
+        ordering = self.get_ordering(queryset)
+        paginator = KeysetPaginator(ordering, self.get_limit())
+        queryset, direction, has_cursor = paginator.prepare(queryset, self.request.GET.get('cursor'))
+
+        keys = [name.lstrip('-') for name in ordering]
+        rows = list(queryset.values(*self.get_columns(fields, extra=keys)))
+        page = paginator.build_page(rows, direction, has_cursor)
+
+        records = [self.serialize(row, fields) for row in page.object_list]
+        self.add_related(records, page.object_list, fields)
+        return {'results': records, 'next': page.next_cursor, 'previous': page.previous_cursor}
+
+
+class RecipeListAPIView(KeysetListAPIView):
+    """
+    Лента рецептов с фильтрами главной страницы (см. recipeapp.filters).
+    """
+    model = Recipe
+    fields = RECIPE_FIELDS
+    related_fields = ('categories',)
+    cache_namespaces = (recipe_cache.RECIPES, recipe_cache.CATEGORIES)
+
+    def get_queryset(self):
+        try:
+            return filter_recipes(Recipe.active.all(), self.request.GET)
+        except ValueError as error:
+            raise InvalidParameter(str(error))
+
+    def get_ordering(self, queryset):
+        if 'search_rank' in queryset.query.annotations:
+            return 'search_rank', 'id'
+        return '-created_at', '-id'
+
+    def add_related(self, records, rows, fields):
+        if 'categories' in fields:
+            categories = recipe_categories([row['id'] for row in rows])
+            for record, row in zip(records, rows):
+                record['categories'] = categories[row['id']]
+
+
+class RecipeDetailAPIView(JSONAPIView):
+    """
+    Рецепт с категориями, ингредиентами и распределением оценок.
+    """
+    fields = RECIPE_FIELDS + ('ingredients', 'ratings')
+    related_fields = ('categories', 'ingredients', 'ratings')
+
+    def get_cache_namespaces(self):
+        return recipe_cache.recipe_namespace(self.kwargs['pk']), recipe_cache.CATEGORIES, recipe_cache.INGREDIENTS
+
+    def get_last_modified(self):
+        updated_at = Recipe.active.filter(pk=self.kwargs['pk']).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            raise Http404
+        return updated_at
+
+    def get_payload(self, fields):
+        pk = self.kwargs['pk']
+        extra = ['rate', 'rating_count'] if 'ratings' in fields else []
+        row = Recipe.active.filter(pk=pk).values(*self.get_columns(fields, extra=['id', *extra])).get()
+        record = self.serialize(row, fields)
+
+        if 'categories' in fields:
+            record['categories'] = recipe_categories([pk])[pk]
+        if 'ingredients' in fields:
+            record['ingredients'] = [
+                {'id': ingredient_id, 'name': name, 'quantity': quantity, 'measure': measure or ''}
+                for ingredient_id, name, quantity, measure in
+                RecipeIngredient.objects.filter(recipe=pk).order_by('ingredient__name').values_list(
+                    'ingredient_id', 'ingredient__name', 'quantity', 'ingredient__measure'
+                )
+            ]
+        if 'ratings' in fields:
+            # Распределение читается из индекса (recipe, value) без обращения к таблице
+            distribution = (Rating.objects.filter(recipe=pk).order_by('value')
+                            .values_list('value').annotate(count=Count('value')))
+            record['ratings'] = {
+                'average': row['rate'] if row['rating_count'] else None,
+                'count': row['rating_count'],
+                'distribution': {value: count for value, count in distribution},
+            }
+        return record
+
+
+class IngredientListAPIView(KeysetListAPIView):
+    """
+    Активные ингредиенты по названию: ?sort=name или ?sort=-name.
+    """
+    model = Ingredient
+    fields = INGREDIENT_FIELDS
+    cache_namespaces = (recipe_cache.INGREDIENTS,)
+
+    def get_queryset(self):
+        return Ingredient.active.all()
+
+    def get_ordering(self, queryset):
+        if self.request.GET.get('sort') == '-name':
+            return '-name', '-id'
+        return 'name', 'id'
+
+
+def prefix_variants(query):
+    """
+    Варианты регистра префикса: как введен, строчными и с заглавной буквы. SQLite сравнивает
+    кириллицу с учетом регистра, а диапазон по name использует индекс только при точном сравнении.
+    """
+    return list(dict.fromkeys([query, query.lower(), query[:1].upper() + query[1:].lower()]))
+
+
+class IngredientSearchAPIView(JSONAPIView):
+    """
+    Поиск ингредиентов по началу названия для выбора в форме рецепта: ?q=, ?limit=.
+    Каждый вариант префикса — отдельный запрос по диапазону индекса (name, id) активных
+    ингредиентов: с условием OR SQLite просматривает индекс целиком.
+    """
+    fields = ('id', 'name', 'measure')
+    cache_namespaces = (recipe_cache.INGREDIENTS,)
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.GET.get('limit', TYPEAHEAD_LIMIT))
+        except ValueError:
+            raise InvalidParameter('limit должен быть числом')
+        return min(max(limit, 1), TYPEAHEAD_MAX_LIMIT)
+
+    def get_payload(self, fields):
+        query = ' '.join(self.request.GET.get('q', '').split())
+        limit = self.get_limit()
+        if not query:
+            return {'results': []}
+
+        columns = self.get_columns(fields, extra=['id', 'name'])
+        rows = []
+        for prefix in prefix_variants(query):
+            rows += (Ingredient.active.filter(name__gte=prefix, name__lt=prefix + PREFIX_END)
+                     .order_by('name', 'id').values(*columns)[:limit])
+        rows = sorted(rows, key=lambda row: (row['name'], row['id']))[:limit]
+        return {'results': [self.serialize(row, fields) for row in rows]}
+
+
+def parse_ids(value, name):
+    try:
+        return [int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise InvalidParameter(f'{name}: ожидается список идентификаторов через запятую')
+
+
+class PantryAPIView(JSONAPIView):
+    """
+    Рецепты по имеющимся ингредиентам: ?ingredients=1,2,3, ?exclude=, ?min_coverage= (0..1), ?limit=.
+    """
+    fields = ('id', 'name', 'coverage', 'covered', 'total', 'missing')
+    cache_namespaces = (recipe_cache.PANTRY, recipe_cache.RECIPES, recipe_cache.INGREDIENTS)
+
+    def get_payload(self, fields):
+        params = self.request.GET
+        ingredients = parse_ids(params.get('ingredients', ''), 'ingredients')
+        exclude = parse_ids(params.get('exclude', ''), 'exclude')
+        try:
+            min_coverage = min(max(float(params.get('min_coverage', 0.5)), 0.01), 1)
+            limit = min(max(int(params.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+        except ValueError:
+            raise InvalidParameter('min_coverage и limit должны быть числами')
+        if not ingredients:
+            raise InvalidParameter('Не указаны ингредиенты: ?ingredients=1,2,3')
+
+        results = []
+        for row in pantry.describe(pantry.find_recipes(ingredients, exclude, min_coverage, limit)):
+            row.update(id=row['recipe'].pk, name=row['recipe'].name)
+            results.append({name: row[name] for name in fields})
+        return {'results': results}
+
+
+class ShoppingListAPIView(JSONAPIView):
+    """
+    Список покупок по плану меню: ?recipe=1&servings=2&recipe=5 (см. recipeapp.shopping).
+    """
+    fields = ('name', 'quantity', 'unit', 'ingredient_ids', 'recipe_ids')
+    cache_namespaces = (recipe_cache.RECIPES, recipe_cache.INGREDIENTS)
+
+    def get_payload(self, fields):
+        try:
+            plan = shopping.parse_plan(self.request.GET.getlist('recipe'), self.request.GET.getlist('servings'))
+        except ValueError as error:
+            raise InvalidParameter(str(error))
+        if not plan:
+            raise InvalidParameter('Не указаны рецепты: ?recipe=1&servings=2')
+
+        shopping_list = shopping.build_shopping_list(plan)
+        items = []
+        for item in shopping_list.items:
+            record = {name: getattr(item, name) for name in fields}
+            if 'quantity' in record:
+                record['quantity'] = float(shopping.format_quantity(item.quantity))
+            items.append(record)
+        return {
+            'recipes': [
+                {'id': recipe_id, 'name': name, 'servings': float(servings)}
+                for recipe_id, name, servings in shopping_list.recipes
+            ],
+            'items': items,
+        }
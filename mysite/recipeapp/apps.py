@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class RecipeappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipeapp'
+
+    def ready(self):
+        # Подключаем обработчики сигналов
+        from recipeapp import signals  # noqa: F401
+        # Проверки настроек для manage.py check --deploy
+        from recipeapp import checks  # noqa: F401
@@ -0,0 +1,172 @@
+"""
+Кеширование страниц и фрагментов с версионированными ключами.
+
+Каждой группе данных (все рецепты, отдельный рецепт, категории,
+ингредиенты) соответствует номер версии в кеше. Версии входят в ключи
+закешированных страниц и фрагментов, а сигналы моделей увеличивают их
+при изменении данных, после чего старые записи просто перестают
+использоваться и вытесняются по таймауту.
+"""
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+RECIPES = 'recipes'
+CATEGORIES = 'categories'
+INGREDIENTS = 'ingredients'
+# Таблица похожих рецептов целиком (после полного пересчета)
+NEIGHBORS = 'neighbors'
+# Индекс «что приготовить» (см. recipeapp.pantry)
+PANTRY = 'pantry'
+
+
+def recipe_namespace(recipe_id):
+    return f'recipe:{recipe_id}'
+
+
+# Время последнего изменения данных (см. recipeapp.routers)
+LAST_CHANGE_KEY = 'cache_last_change'
+
+
+def _version_key(namespace):
+    return f'cache_version:{namespace}'
+
+
+def _initial_version():
+    # Версия, появившаяся после вытеснения ключа, не должна совпасть с одной из старых
+    return int(time.time() * 1000)
+
+
+def cache_timeout():
+    return getattr(settings, 'RECIPE_CACHE_TIMEOUT', 600)
+
+
+def get_versions(*namespaces):
+    """
+    Возвращает текущие версии групп одной операцией чтения из кеша.
+    """
+    keys = [_version_key(namespace) for namespace in namespaces]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, _initial_version(), None)
+            found[key] = cache.get(key)
+    return tuple(found[key] for key in keys)
+
+
+def bump(*namespaces):
+    """
+    Увеличивает версии групп, делая недействительными все зависящие от них записи.
+    Возвращает новые версии.
+    """
+    versions = []
+    cache.set(LAST_CHANGE_KEY, time.time(), None)
+    for namespace in namespaces:
+        key = _version_key(namespace)
+        try:
+            versions.append(cache.incr(key))
+        except ValueError:
+            versions.append(_initial_version())
+            cache.set(key, versions[-1], None)
+    return versions
+
+
+def last_change():
+    """
+    Время последнего вызова bump (секунды от эпохи) или 0, если оно неизвестно.
+    """
+    return cache.get(LAST_CHANGE_KEY, 0)
+
+
+def invalidate_recipes(recipe_ids=()):
+    bump(RECIPES, *[recipe_namespace(recipe_id) for recipe_id in recipe_ids])
+
+
+def make_key(prefix, namespaces, *parts):
+    versions = '.'.join(str(version) for version in get_versions(*namespaces))
+    digest = hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'{prefix}:{versions}:{digest}'
+
+
+class CachedPageMixin:
+    """
+    Кеширует страницу целиком для анонимных GET-запросов.
+    Страницы с CSRF-токеном или flash-сообщениями не кешируются.
+    """
+    cache_namespaces = ()
+
+    def get_cache_namespaces(self):
+        return self.cache_namespaces
+
+    def get_cache_filter_key(self):
+        # Параметры запроса, от которых зависит страница
+        return self.request.GET.urlencode()
+
+    def get_cache_context(self):
+        # Версии и ключ фильтров для тегов {% cache %} в шаблонах
+        return {
+            'cache_timeout': cache_timeout(),
+            'cache_version': '.'.join(str(v) for v in get_versions(*self.get_cache_namespaces())),
+            'cache_filter_key': hashlib.md5(self.get_cache_filter_key().encode()).hexdigest(),
+        }
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(self.get_cache_context())
+        return context
+
+    def is_page_cacheable(self, request):
+        return (
+            request.method in ('GET', 'HEAD')
+            and not request.user.is_authenticated
+            and 'messages' not in request.COOKIES
+        )
+
+    def get_page_key(self, request):
+        return make_key(f'page:{type(self).__name__}', self.get_cache_namespaces(), request.path,
+                        self.get_cache_filter_key())
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.view_is_async:
+            return self._async_dispatch(request, *args, **kwargs)
+        if not self.is_page_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        key = self.get_page_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            if hasattr(response, 'render'):
+                response.render()
+            if not request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+                cache.set(key, (response.content, response['Content-Type']), cache_timeout())
+        return response
+
+    async def _async_dispatch(self, request, *args, **kwargs):
+        # В асинхронном представлении пользователь загружается заранее: ленивый request.user
+        # обратился бы к базе данных синхронно
+        request.user = await request.auser()
+        if not self.is_page_cacheable(request):
+            return await super().dispatch(request, *args, **kwargs)
+
+        key = await sync_to_async(self.get_page_key)(request)
+        cached = await cache.aget(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = await super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            if hasattr(response, 'render'):
+                await sync_to_async(response.render)()
+            if not request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+                await cache.aset(key, (response.content, response['Content-Type']), cache_timeout())
+        return response
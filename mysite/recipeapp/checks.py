@@ -0,0 +1,28 @@
+"""
+Проверки настроек (manage.py check --deploy).
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Кеши, которые не видны другим процессам сервера
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Версии ключей кеша (recipeapp.cache) должны быть общими для всех процессов: иначе изменение
+    рецепта сбросит кеш только в одном процессе, а остальные будут отдавать устаревшие страницы.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PROCESS_LOCAL_CACHES:
+        return [Error(
+            f'Кеш {backend} не общий для процессов сервера: версии ключей recipeapp.cache '
+            f'и счетчики лимитов расходятся между процессами',
+            hint='Задайте RECIPE_CACHE_BACKEND=redis (или file для одного сервера)',
+            id='recipeapp.E001',
+        )]
+    return []
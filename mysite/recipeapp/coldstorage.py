@@ -0,0 +1,92 @@
+"""
+Перенос давно архивированных записей в архивные таблицы.
+
+Архивные рецепты и ингредиенты не показываются на сайте, но остаются
+в основных таблицах и связанных с ними (оценки, комментарии, связи
+с категориями и ингредиентами). Записи, пролежавшие в архиве дольше
+RECIPE_COLD_STORAGE_DAYS дней, переносятся в RecipeArchive
+и IngredientArchive и удаляются из основных таблиц вместе со связями.
+Рецепт сохраняется в формате recipeapp.export (его принимает
+import_recipes) вместе с комментариями.
+
+Отбор идет по частичным индексам archived_at WHERE archived, порциями
+в отдельных транзакциях. Ингредиенты, которые еще есть в рецептах,
+не переносятся.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch
+from django.utils import timezone
+
+from recipeapp.export import recipe_export_queryset, recipe_to_record
+from recipeapp.models import Comment, Ingredient, IngredientArchive, Recipe, RecipeArchive, RecipeIngredient
+
+COLD_STORAGE_BATCH_SIZE = 500
+
+
+def cold_storage_cutoff(days=None):
+    if days is None:
+        days = getattr(settings, 'RECIPE_COLD_STORAGE_DAYS', 180)
+    return timezone.now() - timedelta(days=days)
+
+
+def recipes_to_move(before):
+    return Recipe.objects.filter(archived=True, archived_at__lt=before)
+
+
+def ingredients_to_move(before):
+    used = RecipeIngredient.objects.filter(ingredient=OuterRef('pk'))
+    return Ingredient.objects.filter(archived=True, archived_at__lt=before).filter(~Exists(used))
+
+
+def archive_record(recipe):
+    record = recipe_to_record(recipe)
+    record['image'] = recipe.image.name or ''
+    record['comments'] = [
+        {'user': comment.user.username, 'text': comment.text, 'created_at': comment.created_at}
+        for comment in recipe.comments.all()
+    ]
+    return record
+
+
+def move_recipes(before, batch_size=COLD_STORAGE_BATCH_SIZE):
+    """
+    Переносит рецепты, архивированные раньше before. Выдает число перенесенных рецептов в каждой порции.
+    """
+    comments = Prefetch('comments', queryset=Comment.objects.select_related('user').order_by('created_at', 'id'))
+    while True:
+        with transaction.atomic():
+            ids = list(recipes_to_move(before).order_by('archived_at').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return
+            recipes = recipe_export_queryset(Recipe.objects.filter(pk__in=ids)).prefetch_related(comments)
+            RecipeArchive.objects.bulk_create(
+                [RecipeArchive(id=recipe.pk, name=recipe.name, data=archive_record(recipe),
+                               archived_at=recipe.archived_at) for recipe in recipes],
+                update_conflicts=True, unique_fields=['id'], update_fields=['name', 'data', 'archived_at'],
+            )
+            # Удаление отправляет сигналы: поисковый индекс, индекс «что приготовить» и кеши обновляются
+            Recipe.objects.filter(pk__in=ids).delete()
+        yield len(ids)
+
+
+def move_ingredients(before, batch_size=COLD_STORAGE_BATCH_SIZE):
+    """
+    Переносит неиспользуемые ингредиенты, архивированные раньше before. Выдает размеры порций.
+    """
+    while True:
+        with transaction.atomic():
+            ingredients = list(ingredients_to_move(before).order_by('archived_at')[:batch_size])
+            if not ingredients:
+                return
+            IngredientArchive.objects.bulk_create(
+                [IngredientArchive(id=ingredient.pk, name=ingredient.name, description=ingredient.description,
+                                   measure=ingredient.measure, archived_at=ingredient.archived_at)
+                 for ingredient in ingredients],
+                update_conflicts=True, unique_fields=['id'],
+                update_fields=['name', 'description', 'measure', 'archived_at'],
+            )
+            Ingredient.objects.filter(pk__in=[ingredient.pk for ingredient in ingredients]).delete()
+        yield len(ingredients)
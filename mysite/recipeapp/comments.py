@@ -0,0 +1,56 @@
+"""
+Комментарии к рецептам.
+
+Число комментариев хранится в Recipe.comment_count: add_comment
+увеличивает его в одной транзакции с созданием комментария, а удаление
+комментария (сигнал post_delete) уменьшает. Комментарии отдаются
+страницами фиксированного размера с курсорной пагинацией по
+(created_at, id) по индексу comment_recipe_created_idx, поэтому
+страница рецепта не зависит от числа комментариев: первая страница
+встроена в нее, следующие подгружаются по кнопке «Показать еще».
+"""
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipeapp.models import Comment, Recipe
+from recipeapp.pagination import KeysetPaginator
+
+COMMENTS_PER_PAGE = 20
+
+
+def comment_paginator():
+    return KeysetPaginator(('created_at', 'id'), COMMENTS_PER_PAGE)
+
+
+def comment_page(recipe_id, cursor=None):
+    """
+    Страница комментариев рецепта в порядке добавления вместе с авторами, один запрос.
+    """
+    queryset = Comment.objects.filter(recipe_id=recipe_id).select_related('user')
+    return comment_paginator().paginate(queryset, cursor)
+
+
+def apply_comment_delta(recipe_id, delta):
+    Recipe.objects.filter(pk=recipe_id).update(comment_count=F('comment_count') + delta)
+
+
+def add_comment(recipe_id, user, text):
+    """
+    Создает комментарий и в той же транзакции увеличивает счетчик комментариев рецепта.
+    """
+    with transaction.atomic():
+        comment = Comment.objects.create(recipe_id=recipe_id, user=user, text=text)
+        apply_comment_delta(recipe_id, 1)
+    return comment
+
+
+def rebuild_comment_counts(queryset=None):
+    """
+    Пересчитывает счетчики комментариев по таблице комментариев. Возвращает число обновленных рецептов.
+    """
+    if queryset is None:
+        queryset = Recipe.objects.all()
+    comments = Comment.objects.filter(recipe=OuterRef('pk')).order_by().values('recipe')
+    count = Coalesce(Subquery(comments.annotate(c=Count('pk')).values('c')), 0, output_field=IntegerField())
+    return queryset.update(comment_count=count)
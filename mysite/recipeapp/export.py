@@ -0,0 +1,94 @@
+"""
+Потоковый экспорт рецептов в CSV и JSON Lines.
+
+Записи читаются через queryset.iterator(chunk_size=...) с пакетной
+подгрузкой связанных данных, а строки файла отдаются генератором,
+поэтому расход памяти не зависит от размера выгрузки. Формат совпадает
+с форматом команды import_recipes.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+
+from recipeapp.models import RecipeIngredient
+
+EXPORT_CHUNK_SIZE = 2000
+
+CSV_DELIMITER = ';'
+# Разделители списков внутри ячейки CSV: категории и ингредиенты (название:количество:мера)
+LIST_SEPARATOR = '|'
+PART_SEPARATOR = ':'
+
+RECIPE_FIELDS = [
+    'id', 'name', 'description', 'instructions', 'cooking_time', 'rate', 'rating_count',
+    'created_at', 'created_by', 'archived', 'categories', 'ingredients',
+]
+
+
+class Echo:
+    """
+    Псевдо-буфер для csv.writer: возвращает записанную строку вместо ее сохранения.
+    """
+
+    def write(self, value):
+        return value
+
+
+def recipe_export_queryset(queryset):
+    return queryset.select_related('created_by').prefetch_related(None).prefetch_related(
+        'categories',
+        Prefetch('recipe_ingredients', queryset=RecipeIngredient.objects.select_related('ingredient')),
+    ).order_by('pk')
+
+
+def recipe_to_record(recipe):
+    return {
+        'id': recipe.pk,
+        'name': recipe.name,
+        'description': recipe.description,
+        'instructions': recipe.instructions,
+        'cooking_time': recipe.cooking_time,
+        'rate': recipe.rate,
+        'rating_count': recipe.rating_count,
+        'created_at': recipe.created_at,
+        'created_by': recipe.created_by.username,
+        'archived': recipe.archived,
+        'categories': [category.name for category in recipe.categories.all()],
+        'ingredients': [
+            {
+                'name': recipe_ingredient.ingredient.name,
+                'quantity': recipe_ingredient.quantity,
+                'measure': recipe_ingredient.ingredient.measure or '',
+            }
+            for recipe_ingredient in recipe.recipe_ingredients.all()
+        ],
+    }
+
+
+def iter_recipe_records(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    for recipe in recipe_export_queryset(queryset).iterator(chunk_size=chunk_size):
+        yield recipe_to_record(recipe)
+
+
+def _csv_value(value):
+    if isinstance(value, list):
+        return LIST_SEPARATOR.join(
+            PART_SEPARATOR.join(str(item[key]) for key in ('name', 'quantity', 'measure'))
+            if isinstance(item, dict) else str(item)
+            for item in value
+        )
+    return value
+
+
+def csv_lines(records, fields, headers=None):
+    writer = csv.writer(Echo(), delimiter=CSV_DELIMITER)
+    yield writer.writerow(headers or fields)
+    for record in records:
+        yield writer.writerow([_csv_value(record[field]) for field in fields])
+
+
+def jsonl_lines(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False, cls=DjangoJSONEncoder) + '\n'
@@ -0,0 +1,128 @@
+"""
+Счетчики рецептов по категориям для панели фильтров.
+
+Число неархивированных рецептов каждой категории хранится в таблице
+CategoryRecipeCount и поддерживается сигналами: изменением связей
+Recipe.categories (m2m_changed в обе стороны), переносом рецепта в архив
+и обратно и удалением рецепта. Поэтому панель категорий с количеством
+рецептов - одно чтение по первичному ключу категорий. Массовые операции
+без сигналов (update() в админке, импорт) вызывают refresh_counts.
+
+При поиске и других фильтрах количество считается по отобранным рецептам
+и кешируется по ключу фильтров (RecipeFilters.key) до изменения рецептов
+или категорий.
+"""
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db.models import Count, F
+from django.db.models.functions import Coalesce
+
+from recipeapp import cache as recipe_cache
+from recipeapp.filters import apply_filters
+from recipeapp.models import Category, CategoryRecipeCount, Recipe
+
+RecipeCategory = Recipe.categories.through
+
+
+def apply_deltas(deltas):
+    """
+    Изменяет счетчики категорий на {category_id: delta}. Отсутствующие строки пересчитываются.
+    """
+    by_delta = defaultdict(list)
+    for category_id, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(category_id)
+    missing = []
+    for delta, category_ids in by_delta.items():
+        updated = CategoryRecipeCount.objects.filter(category_id__in=category_ids).update(count=F('count') + delta)
+        if updated < len(category_ids):
+            missing.extend(category_ids)
+    if missing:
+        refresh_counts(missing)
+
+
+def refresh_counts(category_ids=None):
+    """
+    Пересчитывает счетчики по таблице связей (все категории или только указанные).
+    """
+    categories = Category.objects.all()
+    links = RecipeCategory.objects.filter(recipe__archived=False)
+    if category_ids is not None:
+        categories = categories.filter(pk__in=category_ids)
+        links = links.filter(category__in=category_ids)
+    counts = dict(links.values('category').annotate(c=Count('pk')).values_list('category', 'c'))
+    CategoryRecipeCount.objects.bulk_create(
+        [CategoryRecipeCount(category_id=pk, count=counts.get(pk, 0))
+         for pk in categories.values_list('pk', flat=True)],
+        update_conflicts=True, unique_fields=['category'], update_fields=['count'],
+    )
+
+
+def linked_counts(instance, reverse, pk_set=None):
+    """
+    Сколько неархивированных рецептов связано с категориями: {category_id: число}.
+    instance - рецепт (или категория при reverse), pk_set ограничивает вторую сторону связи.
+    """
+    if reverse:
+        links = RecipeCategory.objects.filter(category=instance.pk, recipe__archived=False)
+        if pk_set is not None:
+            links = links.filter(recipe__in=pk_set)
+        count = links.count()
+        return {instance.pk: count} if count else {}
+    if instance.archived:
+        return {}
+    links = RecipeCategory.objects.filter(recipe=instance.pk)
+    if pk_set is not None:
+        links = links.filter(category__in=pk_set)
+    return {category_id: 1 for category_id in links.values_list('category_id', flat=True)}
+
+
+def links_changed(instance, action, reverse, pk_set):
+    """
+    Обновляет счетчики по сигналу m2m_changed связи Recipe.categories.
+    """
+    if action in ('pre_remove', 'pre_clear'):
+        # После удаления связей уже не узнать, какие из pk_set действительно были связаны
+        instance._facet_removed = linked_counts(instance, reverse, pk_set)
+    elif action in ('post_remove', 'post_clear'):
+        removed = instance.__dict__.pop('_facet_removed', {})
+        apply_deltas({category_id: -count for category_id, count in removed.items()})
+    elif action == 'post_add' and pk_set:
+        # В pk_set передаются только действительно добавленные связи
+        if reverse:
+            apply_deltas({instance.pk: Recipe.active.filter(pk__in=pk_set).count()})
+        elif not instance.archived:
+            apply_deltas({category_id: 1 for category_id in pk_set})
+
+
+def archived_changed(recipe):
+    """
+    Переносит рецепт в счетчиках его категорий после смены признака archived.
+    """
+    delta = -1 if recipe.archived else 1
+    apply_deltas({category_id: delta for category_id in
+                  RecipeCategory.objects.filter(recipe=recipe.pk).values_list('category_id', flat=True)})
+
+
+def category_facets(filters=None):
+    """
+    Категории по названию с числом рецептов [{'id', 'name', 'recipe_total'}] при фильтрах
+    filters (RecipeFilters без категорий). Без фильтров - одно чтение счетчиков,
+    с фильтрами - подсчет по отобранным рецептам с кешированием по ключу фильтров.
+    """
+    if filters is None or filters.is_empty():
+        return list(Category.objects.order_by('name').values(
+            'id', 'name', recipe_total=Coalesce(F('facet__count'), 0)
+        ))
+
+    key = recipe_cache.make_key('facets', (recipe_cache.RECIPES, recipe_cache.CATEGORIES), filters.key)
+    facets = cache.get(key)
+    if facets is None:
+        found = apply_filters(Recipe.active.all(), filters).order_by().values('pk')
+        counts = dict(RecipeCategory.objects.filter(recipe__in=found).values('category')
+                      .annotate(c=Count('pk')).values_list('category', 'c'))
+        facets = [{**category, 'recipe_total': counts.get(category['id'], 0)}
+                  for category in Category.objects.order_by('name').values('id', 'name')]
+        cache.set(key, facets, recipe_cache.cache_timeout())
+    return facets
@@ -0,0 +1,177 @@
+"""
+Фильтры ленты рецептов (главная страница, список рецептов, JSON API).
+
+Параметры запроса:
+    ?category=1&category=3 или ?category=1,3   категории;
+    ?category_match=all                        рецепт во всех категориях (по умолчанию - в любой);
+    ?time_min=, ?time_max=                     время приготовления в минутах;
+    ?rating_min=                               минимальный рейтинг;
+    ?author=                                   авторы (id пользователей);
+    ?ingredient=, ?exclude_ingredient=         с ингредиентами (всеми) и без ингредиентов;
+    ?search=                                   полнотекстовый поиск.
+
+Условия на связанные таблицы строятся как EXISTS по индексам связей,
+а не JOIN: рецепт попадает в выборку один раз, DISTINCT не нужен,
+и лента по-прежнему читается по индексу created_at без сортировки
+во временном B-дереве.
+
+RecipeFilters.key - нормализованная строка фильтров: одинаковые наборы
+фильтров, записанные по-разному (порядок категорий, повторы, пробелы
+в поиске, лишние параметры), дают одну строку. Ее используют ключи
+кеша страниц, фрагментов и панели категорий.
+"""
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+from urllib.parse import urlencode
+
+from django.db.models import Exists, OuterRef
+
+from recipeapp.models import Recipe, RecipeIngredient
+from recipeapp.search import search_recipes
+
+CATEGORY_MATCHES = ('any', 'all')
+# Больше значений одного параметра не принимается: каждое дает отдельное условие EXISTS
+MAX_VALUES = 20
+
+RecipeCategory = Recipe.categories.through
+
+
+class RecipeFilters(namedtuple('RecipeFilters', 'categories category_match time_min time_max rating_min '
+                                                'authors ingredients exclude_ingredients search')):
+    __slots__ = ()
+
+    def params(self):
+        """
+        Заданные фильтры в каноническом виде: [(параметр, значение)] в фиксированном порядке.
+        """
+        params = []
+        if self.categories:
+            params.append(('category', ','.join(str(pk) for pk in self.categories)))
+            # Для одной категории способ сопоставления ничего не меняет
+            if len(self.categories) > 1 and self.category_match != 'any':
+                params.append(('category_match', self.category_match))
+        if self.time_min is not None:
+            params.append(('time_min', str(self.time_min)))
+        if self.time_max is not None:
+            params.append(('time_max', str(self.time_max)))
+        if self.rating_min is not None:
+            params.append(('rating_min', f'{self.rating_min.normalize():f}'))
+        for name, ids in (('author', self.authors), ('ingredient', self.ingredients),
+                          ('exclude_ingredient', self.exclude_ingredients)):
+            if ids:
+                params.append((name, ','.join(str(pk) for pk in ids)))
+        if self.search:
+            params.append(('search', self.search))
+        return params
+
+    @property
+    def key(self):
+        return urlencode(self.params())
+
+    def is_empty(self):
+        return not self.params()
+
+    def without_categories(self):
+        return self._replace(categories=(), category_match='any')
+
+
+EMPTY_FILTERS = RecipeFilters((), 'any', None, None, None, (), (), (), '')
+
+
+def parse_ids(params, name):
+    ids = set()
+    for value in params.getlist(name):
+        for part in value.split(','):
+            part = part.strip()
+            if not part:
+                continue
+            if not part.isdigit():
+                raise ValueError(f'{name}: ожидаются числовые id, получено {part!r}')
+            ids.add(int(part))
+    if len(ids) > MAX_VALUES:
+        raise ValueError(f'{name}: не больше {MAX_VALUES} значений')
+    return tuple(sorted(ids))
+
+
+def parse_minutes(params, name):
+    value = params.get(name, '').strip()
+    if not value:
+        return None
+    if not value.isdigit():
+        raise ValueError(f'{name}: ожидается число минут, получено {value!r}')
+    return int(value)
+
+
+def parse_filters(params):
+    """
+    Разбирает параметры запроса (QueryDict) в RecipeFilters. Неверные значения - ValueError.
+    """
+    category_match = params.get('category_match', '').strip() or 'any'
+    if category_match not in CATEGORY_MATCHES:
+        raise ValueError(f'category_match: одно из {", ".join(CATEGORY_MATCHES)}')
+
+    time_min = parse_minutes(params, 'time_min')
+    time_max = parse_minutes(params, 'time_max')
+    if time_min is not None and time_max is not None and time_min > time_max:
+        raise ValueError('time_min не может быть больше time_max')
+
+    rating_min = params.get('rating_min', '').strip().replace(',', '.')
+    if rating_min:
+        try:
+            rating_min = Decimal(rating_min)
+        except InvalidOperation:
+            raise ValueError(f'rating_min: ожидается число, получено {rating_min!r}')
+        if not rating_min.is_finite() or rating_min < 0:
+            raise ValueError('rating_min должен быть неотрицательным числом')
+    else:
+        rating_min = None
+
+    return RecipeFilters(
+        categories=parse_ids(params, 'category'),
+        category_match=category_match,
+        time_min=time_min,
+        time_max=time_max,
+        rating_min=rating_min,
+        authors=parse_ids(params, 'author'),
+        ingredients=parse_ids(params, 'ingredient'),
+        exclude_ingredients=parse_ids(params, 'exclude_ingredient'),
+        search=' '.join(params.get('search', '').split()),
+    )
+
+
+def apply_filters(queryset, filters):
+    """
+    Применяет фильтры к выборке рецептов одним запросом. С поиском выборка упорядочена по релевантности.
+    """
+    if filters.categories:
+        links = RecipeCategory.objects.filter(recipe=OuterRef('pk'))
+        if filters.category_match == 'all':
+            queryset = queryset.filter(*[Exists(links.filter(category=pk)) for pk in filters.categories])
+        else:
+            queryset = queryset.filter(Exists(links.filter(category__in=filters.categories)))
+
+    if filters.time_min is not None:
+        queryset = queryset.filter(cooking_time__gte=filters.time_min)
+    if filters.time_max is not None:
+        queryset = queryset.filter(cooking_time__lte=filters.time_max)
+    if filters.rating_min is not None:
+        queryset = queryset.filter(rate__gte=filters.rating_min)
+    if filters.authors:
+        queryset = queryset.filter(created_by__in=filters.authors)
+
+    recipe_ingredients = RecipeIngredient.objects.filter(recipe=OuterRef('pk'))
+    if filters.ingredients:
+        queryset = queryset.filter(*[Exists(recipe_ingredients.filter(ingredient=pk)) for pk in filters.ingredients])
+    if filters.exclude_ingredients:
+        queryset = queryset.filter(~Exists(recipe_ingredients.filter(ingredient__in=filters.exclude_ingredients)))
+
+    if filters.search:
+        queryset = search_recipes(queryset, filters.search)
+    return queryset
+
+
+def filter_recipes(queryset, params):
+    """
+    Фильтры ленты рецептов по параметрам запроса (общие для HTML-страниц и JSON API).
+    """
+    return apply_filters(queryset, parse_filters(params))
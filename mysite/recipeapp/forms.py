@@ -20,29 +20,95 @@ class IngredientForm(forms.ModelForm):
         }
 
 
-class IngredientSelectionForm(forms.Form):
+class RecipeIngredientRowForm(forms.Form):
+    """
+    Строка ингредиента рецепта. Ингредиент передается идентификатором, выбранным через поиск,
+    а не списком вариантов: размер формы не зависит от размера каталога.
+    """
+    ingredient = forms.IntegerField(widget=forms.HiddenInput())
+    quantity = forms.IntegerField(
+        min_value=1,
+        initial=1,
+        label='Количество',
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'style': 'width: 100px;'})
+    )
+
+
+class BaseRecipeIngredientFormSet(forms.BaseFormSet):
+    """
+    Проверяет все выбранные ингредиенты одним запросом и подставляет в строки их названия.
+    """
     def __init__(self, *args, **kwargs):
-        ingredients = kwargs.pop('ingredients', None)
         super().__init__(*args, **kwargs)
-        for ingredient in ingredients:
-            self.fields[f'ingredient_{ingredient.id}'] = forms.BooleanField(
-                required=False,
-                label=ingredient.name,
-                widget=forms.CheckboxInput()
-            )
-            self.fields[f'quantity_{ingredient.id}'] = forms.IntegerField(
-                required=False,
-                initial=1,
-                min_value=1,
-                label='Количество',
-                widget=forms.NumberInput(attrs={'class': 'form-control', 'style': 'width: 80px;'})
-            )
-            self.fields[f'measure_{ingredient.id}'] = forms.CharField(
-                required=False,
-                initial=ingredient.measure,
-                label='Единица измерения',
-                widget=forms.TextInput(attrs={'class': 'form-control', 'readonly': 'readonly', 'style': 'width: 80px;'})
-            )
+        self._ingredients = None
+
+    def _row_ingredient_ids(self):
+        if not self.is_bound:
+            return [row['ingredient'] for row in self.initial or []]
+        ids = []
+        for i in range(self.total_form_count()):
+            value = self.data.get(self.add_prefix(i) + '-ingredient')
+            if value and value.isdigit():
+                ids.append(int(value))
+        return ids
+
+    @property
+    def ingredients(self):
+        """
+        Активные ингредиенты строк: {id: (название, единица измерения)}.
+        """
+        if self._ingredients is None:
+            if self.is_bound:
+                self._ingredients = {
+                    pk: (name, measure or '')
+                    for pk, name, measure in Ingredient.active.filter(
+                        pk__in=self._row_ingredient_ids()
+                    ).values_list('pk', 'name', 'measure')
+                }
+            else:
+                # Названия для начальных строк передаются вместе с ними, без отдельного запроса
+                self._ingredients = {
+                    row['ingredient']: (row.get('name', ''), row.get('measure') or '') for row in self.initial or []
+                }
+        return self._ingredients
+
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        ingredient_id = form.initial.get('ingredient')
+        if self.is_bound:
+            value = self.data.get(form.add_prefix('ingredient'))
+            ingredient_id = int(value) if value and value.isdigit() else None
+        form.ingredient_name, form.ingredient_measure = self.ingredients.get(ingredient_id, ('', ''))
+        return form
+
+    def clean(self):
+        if any(self.errors):
+            return
+        seen = set()
+        for form in self.forms:
+            if not form.cleaned_data or (self.can_delete and self._should_delete_form(form)):
+                continue
+            ingredient_id = form.cleaned_data.get('ingredient')
+            if ingredient_id not in self.ingredients:
+                raise forms.ValidationError('Ингредиент не найден или перенесен в архив')
+            if ingredient_id in seen:
+                raise forms.ValidationError(f'Ингредиент «{self.ingredients[ingredient_id][0]}» добавлен дважды')
+            seen.add(ingredient_id)
+
+    def rows(self):
+        """
+        Выбранные ингредиенты в формате save_recipe_ingredients: {ingredient_id: quantity}.
+        """
+        return {
+            form.cleaned_data['ingredient']: form.cleaned_data['quantity']
+            for form in self.forms
+            if form.cleaned_data and not (self.can_delete and self._should_delete_form(form))
+        }
+
+
+RecipeIngredientFormSet = forms.formset_factory(
+    RecipeIngredientRowForm, formset=BaseRecipeIngredientFormSet, extra=0, can_delete=True
+)
 
 
 class RecipeForm(forms.ModelForm):
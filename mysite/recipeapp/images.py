@@ -0,0 +1,133 @@
+"""
+Уменьшенные копии изображений рецептов.
+
+После сохранения рецепта с новым изображением фоновая задача
+(recipeapp.tasks) создает копии фиксированной ширины в форматах WebP и JPEG и кладет их
+рядом с оригиналом: recipes/photo.jpg -> recipes/photo_200w.webp,
+recipes/photo_200w.jpg. Созданные варианты записываются в
+Recipe.image_variants, по ним тег {% recipe_image %} строит srcset.
+Пока копий нет, страницы показывают оригинал.
+"""
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from recipeapp import cache as recipe_cache
+from recipeapp.models import Recipe
+from recipeapp.tasks import task
+
+# Ширины копий: карточка в списке (100 и 200 пикселей для экранов высокой плотности),
+# админка, страница рецепта
+WIDTHS = (100, 200, 400, 800, 1200)
+
+# Формат -> (расширение, параметры сохранения Pillow). Первый формат предпочтительный
+FORMATS = {
+    'webp': ('webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def variant_name(source, width, image_format):
+    root, _ = os.path.splitext(source)
+    return f'{root}_{width}w.{FORMATS[image_format][0]}'
+
+
+def variant_names(variants):
+    if not variants:
+        return []
+    return [
+        variant_name(variants['source'], width, image_format)
+        for image_format in variants['formats'] for width in variants['widths']
+    ]
+
+
+def _encode(image, image_format):
+    if image_format == 'jpeg' and image.mode != 'RGB':
+        # JPEG не поддерживает прозрачность: фон заливается белым
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, format=image_format.upper(), **FORMATS[image_format][1])
+    return buffer.getvalue()
+
+
+def build_variants(source, storage=default_storage):
+    """
+    Создает копии изображения source во всех форматах и ширинах не больше исходной.
+    Возвращает описание вариантов для Recipe.image_variants.
+    """
+    with storage.open(source, 'rb') as file:
+        image = Image.open(file)
+        original_width, original_height = image.size
+        widths = [width for width in WIDTHS if width < original_width] or [original_width]
+        # JPEG декодируется сразу в уменьшенном масштабе, если самая большая копия это позволяет
+        image.draft('RGB', (max(widths), original_height * max(widths) // original_width))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if 'A' in image.getbands() or image.mode == 'P' else 'RGB')
+
+    # Каждая копия уменьшается из предыдущей, большей: так быстрее, чем каждый раз из оригинала
+    for width in sorted(widths, reverse=True):
+        height = max(1, round(image.height * width / image.width))
+        image = image.resize((width, height), Image.LANCZOS)
+        for image_format in FORMATS:
+            name = variant_name(source, width, image_format)
+            if storage.exists(name):
+                storage.delete(name)
+            storage.save(name, ContentFile(_encode(image, image_format)))
+
+    return {'source': source, 'widths': sorted(widths), 'formats': list(FORMATS)}
+
+
+def delete_variants(variants, storage=default_storage, keep=None):
+    """
+    Удаляет файлы вариантов, кроме используемых вариантами keep.
+    """
+    kept = set(variant_names(keep))
+    for name in variant_names(variants):
+        if name not in kept and storage.exists(name):
+            storage.delete(name)
+
+
+def store_variants(recipe_id, source, variants):
+    """
+    Записывает варианты, если изображение рецепта за это время не заменили.
+    """
+    updated = Recipe.objects.filter(pk=recipe_id, image=source).update(
+        image_variants=variants, updated_at=timezone.now()
+    )
+    if updated:
+        recipe_cache.invalidate_recipes([recipe_id])
+    return updated
+
+
+@task
+def generate_thumbnails(recipe_id, force=False):
+    """
+    Приводит копии изображения рецепта в соответствие с текущим Recipe.image.
+    """
+    row = Recipe.objects.filter(pk=recipe_id).values('image', 'image_variants').first()
+    if row is None:
+        return
+    source, previous = row['image'], row['image_variants']
+    if previous.get('source') == source and not force:
+        return
+
+    # Старые копии удаляются только после записи новых: до этого на них ссылается srcset страниц
+    variants = build_variants(source) if source else {}
+    if store_variants(recipe_id, source, variants):
+        delete_variants(previous, keep=variants)
+    else:
+        # Изображение заменили, пока создавались копии: их создаст следующая задача
+        delete_variants(variants, keep=previous)
+
+
+def schedule_thumbnails(recipe_id):
+    """
+    Ставит создание копий в очередь фоновых задач, не задерживая ответ на запрос.
+    """
+    generate_thumbnails.delay(recipe_id)
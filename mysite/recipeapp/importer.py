@@ -0,0 +1,255 @@
+"""
+Пакетный импорт рецептов из JSON Lines и CSV (формат recipeapp.export).
+
+Названия категорий, ингредиентов и авторов разрешаются через словари в
+памяти, новые записи создаются bulk_create, а каждая порция рецептов
+записывается в отдельной транзакции.
+
+Каждая запись проверяется до записи в базу: неверные строки пропускаются
+и возвращаются с номерами строк файла, остальные импортируются. Запись
+с id обновляет рецепт с этим id (категории и ингредиенты заменяются),
+поэтому повторный импорт выгрузки не создает дубликатов; записи без id
+добавляются как новые рецепты.
+"""
+import csv
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+
+from recipeapp import cache as recipe_cache
+from recipeapp import facets, pantry
+from recipeapp.export import CSV_DELIMITER, LIST_SEPARATOR, PART_SEPARATOR
+from recipeapp.models import Category, Ingredient, Recipe, RecipeIngredient
+from recipeapp.search import index_recipes
+
+# Поля рецепта, которые обновляет повторный импорт записи с тем же id
+UPDATE_FIELDS = [
+    'name', 'description', 'instructions', 'cooking_time', 'created_by', 'archived', 'archived_at', 'updated_at',
+]
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def iter_jsonl(path):
+    """
+    Выдает (номер строки, запись). Строка, которая не разбирается как JSON, выдается с записью None.
+    """
+    with open(path, encoding='utf-8') as source:
+        for line_number, line in enumerate(source, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError:
+                yield line_number, None
+
+
+def _parse_ingredient(value):
+    name, _, rest = value.partition(PART_SEPARATOR)
+    quantity, _, measure = rest.partition(PART_SEPARATOR)
+    return {'name': name, 'quantity': quantity or 1, 'measure': measure}
+
+
+def iter_csv(path):
+    """
+    Выдает (номер строки файла, запись).
+    """
+    with open(path, encoding='utf-8', newline='') as source:
+        reader = csv.DictReader(source, delimiter=CSV_DELIMITER)
+        for row in reader:
+            row['categories'] = [name for name in (row.get('categories') or '').split(LIST_SEPARATOR) if name]
+            row['ingredients'] = [
+                _parse_ingredient(value) for value in (row.get('ingredients') or '').split(LIST_SEPARATOR) if value
+            ]
+            yield reader.line_num, row
+
+
+def _quantity(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return 1
+
+
+def _flag(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+
+def _optional_int(record, name):
+    value = record.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise InvalidRecord(f'{name}: ожидается целое число, получено {value!r}')
+
+
+def clean_record(record):
+    """
+    Проверяет запись импорта и приводит поля к нужным типам. Неверная запись - InvalidRecord.
+    """
+    if not isinstance(record, dict):
+        raise InvalidRecord('запись должна быть объектом JSON')
+    name = record.get('name')
+    if not isinstance(name, str) or not name.strip():
+        raise InvalidRecord('нет названия рецепта (name)')
+    if len(name) > Recipe._meta.get_field('name').max_length:
+        raise InvalidRecord('слишком длинное название рецепта')
+
+    categories = record.get('categories') or []
+    if not isinstance(categories, list) or not all(isinstance(item, str) and item for item in categories):
+        raise InvalidRecord('categories: ожидается список названий')
+    ingredients = record.get('ingredients') or []
+    if not isinstance(ingredients, list) or not all(
+        isinstance(item, dict) and isinstance(item.get('name'), str) and item['name'] for item in ingredients
+    ):
+        raise InvalidRecord('ingredients: ожидается список объектов с названием (name)')
+
+    recipe_id = _optional_int(record, 'id')
+    if recipe_id is not None and recipe_id < 1:
+        raise InvalidRecord('id должен быть положительным')
+    cooking_time = _optional_int(record, 'cooking_time')
+    if cooking_time is not None and cooking_time < 0:
+        raise InvalidRecord('cooking_time не может быть отрицательным')
+
+    return {
+        **record,
+        'id': recipe_id,
+        'name': name.strip(),
+        'cooking_time': cooking_time or 0,
+        'categories': categories,
+        'ingredients': ingredients,
+    }
+
+
+class RecipeImporter:
+    def __init__(self, default_author, update_search_index=True):
+        self.default_author = default_author
+        self.update_search_index = update_search_index
+        self.categories = dict(Category.objects.values_list('name', 'pk'))
+        # При повторяющихся названиях используется ингредиент с меньшим id
+        self.ingredients = dict(Ingredient.objects.order_by('-pk').values_list('name', 'pk'))
+        self.users = dict(User.objects.values_list('username', 'pk'))
+
+    def _ensure_categories(self, names):
+        missing = {name for name in names if name not in self.categories}
+        if missing:
+            Category.objects.bulk_create([Category(name=name) for name in missing], ignore_conflicts=True)
+            self.categories.update(Category.objects.filter(name__in=missing).values_list('name', 'pk'))
+
+    def _ensure_ingredients(self, items):
+        missing = {}
+        for item in items:
+            if item['name'] not in self.ingredients:
+                missing.setdefault(item['name'], item.get('measure') or None)
+        if missing:
+            created = Ingredient.objects.bulk_create(
+                [Ingredient(name=name, measure=measure) for name, measure in missing.items()]
+            )
+            self.ingredients.update((ingredient.name, ingredient.pk) for ingredient in created)
+
+    def _reset_sequence(self):
+        # Рецепты с явными id не сдвигают последовательность PostgreSQL: без сброса следующий
+        # рецепт без id получил бы уже занятый id. Для SQLite список команд пуст
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Recipe]):
+                cursor.execute(sql)
+
+    def clean(self, rows):
+        """
+        Проверяет строки [(номер строки, запись)]. Возвращает верные записи и ошибки [(номер строки, текст)].
+        Из записей с одинаковым id остается последняя.
+        """
+        records, errors, by_id = [], [], {}
+        for line_number, record in rows:
+            try:
+                record = clean_record(record)
+            except InvalidRecord as error:
+                errors.append((line_number, str(error)))
+                continue
+            if record['id'] is not None:
+                if record['id'] in by_id:
+                    records[by_id[record['id']]] = None
+                by_id[record['id']] = len(records)
+            records.append(record)
+        return [record for record in records if record is not None], errors
+
+    def import_batch(self, rows):
+        """
+        Импортирует порцию строк [(номер строки, запись)] в одной транзакции.
+        Возвращает id созданных и обновленных рецептов и пропущенные строки [(номер строки, ошибка)].
+        """
+        records, errors = self.clean(rows)
+        if not records:
+            return [], errors
+
+        with transaction.atomic():
+            self._ensure_categories(name for record in records for name in record['categories'])
+            self._ensure_ingredients(item for record in records for item in record['ingredients'])
+
+            # bulk_create не отправляет pre_save, а auto_now не действует при обновлении по конфликту,
+            # поэтому время архивации и изменения задается здесь
+            now = timezone.now()
+            recipes = Recipe.objects.bulk_create(
+                [
+                    Recipe(
+                        id=record['id'],
+                        name=record['name'],
+                        description=record.get('description') or '',
+                        instructions=record.get('instructions') or '',
+                        cooking_time=record['cooking_time'],
+                        created_by_id=self.users.get(record.get('created_by'), self.default_author.pk),
+                        archived=_flag(record.get('archived')),
+                        archived_at=now if _flag(record.get('archived')) else None,
+                        updated_at=now,
+                    )
+                    for record in records
+                ],
+                update_conflicts=True, unique_fields=['id'], update_fields=UPDATE_FIELDS,
+            )
+
+            # Связи обновленных рецептов заменяются связями из файла
+            through = Recipe.categories.through
+            updated_ids = [record['id'] for record in records if record['id'] is not None]
+            if updated_ids:
+                through.objects.filter(recipe__in=updated_ids).delete()
+                RecipeIngredient.objects.filter(recipe__in=updated_ids).delete()
+                self._reset_sequence()
+
+            category_links = []
+            recipe_ingredients = []
+            for recipe, record in zip(recipes, records):
+                for name in set(record['categories']):
+                    category_links.append(through(recipe_id=recipe.pk, category_id=self.categories[name]))
+                seen = set()
+                for item in record['ingredients']:
+                    ingredient_id = self.ingredients[item['name']]
+                    if ingredient_id not in seen:
+                        seen.add(ingredient_id)
+                        recipe_ingredients.append(RecipeIngredient(
+                            recipe_id=recipe.pk, ingredient_id=ingredient_id, quantity=_quantity(item.get('quantity'))
+                        ))
+
+            through.objects.bulk_create(category_links, ignore_conflicts=True)
+            RecipeIngredient.objects.bulk_create(recipe_ingredients)
+
+            recipe_ids = [recipe.pk for recipe in recipes]
+            if self.update_search_index:
+                index_recipes(recipe_ids)
+        return recipe_ids, errors
+
+    def finish(self):
+        # bulk_create не отправляет сигналы, поэтому кеши и индекс «что приготовить» сбрасываются
+        # один раз в конце импорта
+        facets.refresh_counts()
+        recipe_cache.bump(recipe_cache.RECIPES, recipe_cache.CATEGORIES, recipe_cache.INGREDIENTS)
+        pantry.record_changes()
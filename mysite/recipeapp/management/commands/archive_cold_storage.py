@@ -0,0 +1,45 @@
+import time
+
+from django.core.management import BaseCommand
+
+from recipeapp.coldstorage import (
+    COLD_STORAGE_BATCH_SIZE, cold_storage_cutoff, ingredients_to_move, move_ingredients, move_recipes,
+    recipes_to_move,
+)
+
+
+class Command(BaseCommand):
+    """
+    Переносит давно архивированные рецепты и ингредиенты в архивные таблицы.
+    """
+    help = ("Переносит рецепты и неиспользуемые ингредиенты, архивированные больше --days дней назад, "
+            "в архивные таблицы и удаляет их из основных.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help='Сколько дней запись должна пролежать в архиве (по умолчанию RECIPE_COLD_STORAGE_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=COLD_STORAGE_BATCH_SIZE,
+                            help='Записей в одной транзакции')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать записи для переноса')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        before = cold_storage_cutoff(options['days'])
+        self.stdout.write(f'Переносятся записи, архивированные до {before:%Y-%m-%d %H:%M}')
+
+        if options['dry_run']:
+            self.stdout.write(f'Рецептов для переноса: {recipes_to_move(before).count()}')
+            # Ингредиенты перенесенных рецептов тоже могут освободиться, поэтому это оценка снизу
+            self.stdout.write(f'Ингредиентов для переноса: не меньше {ingredients_to_move(before).count()}')
+            return
+
+        recipes = 0
+        for moved in move_recipes(before, options['batch_size']):
+            recipes += moved
+            self.stdout.write(f'Перенесено рецептов: {recipes}')
+        ingredients = sum(move_ingredients(before, options['batch_size']))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Успешно перенесено рецептов: {recipes}, ингредиентов: {ingredients} '
+            f'за {time.monotonic() - started:.1f} с'
+        ))
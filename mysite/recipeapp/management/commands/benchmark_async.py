@@ -0,0 +1,106 @@
+import asyncio
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError
+from django.test import AsyncClient
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from recipeapp.management.commands.benchmark_views import percentile
+from recipeapp.models import Ingredient, Recipe
+
+
+def view_pairs(rng):
+    """
+    Пары адресов одной страницы: синхронное и асинхронное представление.
+    """
+    recipe_ids = list(Recipe.active.values_list('pk', flat=True)[:1000])
+    if not recipe_ids or not Ingredient.active.exists():
+        raise CommandError('Нет данных: запустите generate_fixture_data')
+
+    def detail(name):
+        return lambda: reverse(f'recipeapp:{name}', kwargs={'pk': rng.choice(recipe_ids)})
+
+    return {
+        'recipe_index': (lambda: reverse('recipeapp:recipe_index'), lambda: reverse('recipeapp:recipe_index_async')),
+        'recipe_detail': (detail('recipe_detail'), detail('recipe_detail_async')),
+        'ingredient_list': (
+            lambda: reverse('recipeapp:ingredient_list'), lambda: reverse('recipeapp:ingredient_list_async')
+        ),
+    }
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает синхронные и асинхронные представления под одновременной нагрузкой.
+    """
+    help = ("Отправляет запросы к синхронным и асинхронным вариантам страниц через ASGI-обработчик "
+            "с заданным числом одновременных клиентов и выводит пропускную способность и p50/p95.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Число запросов на каждую страницу')
+        parser.add_argument('--concurrency', type=int, default=20, help='Число одновременных запросов')
+        parser.add_argument('--anonymous', action='store_true',
+                            help='Запросы от анонимного пользователя (с кешем страниц)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--requests и --concurrency должны быть положительными')
+        pairs = view_pairs(random.Random(options['seed']))
+        user = None
+        if not options['anonymous']:
+            user, _ = User.objects.get_or_create(username='benchmark')
+
+        with override_settings(ALLOWED_HOSTS=['testserver'], DEBUG=False):
+            results = asyncio.run(self.run(pairs, user, options['requests'], options['concurrency']))
+
+        self.stdout.write(f'{"Страница":<18}{"вариант":>8}{"зап/с":>10}{"p50, мс":>10}{"p95, мс":>10}')
+        for name, variants in results.items():
+            for variant, row in variants.items():
+                self.stdout.write(
+                    f'{name:<18}{variant:>8}{row["rps"]:>10}{row["p50_ms"]:>10}{row["p95_ms"]:>10}'
+                )
+        self.stdout.write(self.style.SUCCESS('Сравнение завершено'))
+
+    async def run(self, pairs, user, total, concurrency):
+        client = AsyncClient()
+        if user is not None:
+            await client.aforce_login(user)
+
+        results = {}
+        for name, (sync_url, async_url) in pairs.items():
+            results[name] = {
+                'sync': await self.load(client, sync_url, total, concurrency),
+                'async': await self.load(client, async_url, total, concurrency),
+            }
+        return results
+
+    async def load(self, client, make_url, total, concurrency):
+        # Адреса выбираются заранее: обращение к генератору не должно зависеть от порядка выполнения задач
+        urls = [make_url() for _ in range(total)]
+        queue = asyncio.Queue()
+        for url in urls:
+            queue.put_nowait(url)
+        timings = []
+
+        async def worker():
+            while not queue.empty():
+                url = queue.get_nowait()
+                started = time.perf_counter()
+                response = await client.get(url)
+                timings.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    raise CommandError(f'{url} вернул {response.status_code}')
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        return {
+            'rps': round(total / elapsed, 1),
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+        }
@@ -0,0 +1,136 @@
+import json
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from recipeapp.models import Category, Ingredient, Recipe
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def benchmark_urls(rng):
+    """
+    Страницы для замеров: имя -> функция, возвращающая очередной адрес.
+    """
+    recipe_ids = list(Recipe.active.values_list('pk', flat=True)[:1000])
+    ingredient_ids = list(Ingredient.active.values_list('pk', flat=True)[:1000])
+    category_ids = list(Category.objects.values_list('pk', flat=True))
+    if not recipe_ids or not ingredient_ids:
+        raise CommandError('Нет данных: запустите generate_fixture_data')
+
+    return {
+        'recipe_index': lambda: reverse('recipeapp:recipe_index'),
+        'recipe_index_category': lambda: (
+            f"{reverse('recipeapp:recipe_index')}?category={rng.choice(category_ids)}" if category_ids
+            else reverse('recipeapp:recipe_index')
+        ),
+        # Несколько категорий вместе с остальными фильтрами (см. recipeapp.filters)
+        'recipe_index_filters': lambda: (
+            f"{reverse('recipeapp:recipe_index')}?category="
+            f"{','.join(str(pk) for pk in rng.sample(category_ids, min(2, len(category_ids))))}"
+            f"&category_match=all&time_max=60&rating_min=3"
+            f"&exclude_ingredient={rng.choice(ingredient_ids)}"
+        ),
+        'recipe_index_search': lambda: f"{reverse('recipeapp:recipe_index')}?search=суп",
+        'recipe_list': lambda: reverse('recipeapp:recipe_list'),
+        'recipe_detail': lambda: reverse('recipeapp:recipe_detail', kwargs={'pk': rng.choice(recipe_ids)}),
+        'recipe_update': lambda: reverse('recipeapp:recipe_update', kwargs={'pk': rng.choice(recipe_ids)}),
+        'ingredient_list': lambda: reverse('recipeapp:ingredient_list'),
+        'ingredient_list_measure': lambda: f"{reverse('recipeapp:ingredient_list')}?sort=measure",
+        'ingredient_detail': lambda: reverse('recipeapp:ingredient_detail',
+                                             kwargs={'pk': rng.choice(ingredient_ids)}),
+        'ingredient_search': lambda: f"{reverse('recipeapp:api_ingredient_search')}?q=бы",
+        'pantry': lambda: f"{reverse('recipeapp:api_pantry')}?ingredients="
+                          f"{','.join(str(pk) for pk in rng.sample(ingredient_ids, min(20, len(ingredient_ids))))}",
+        # План меню на неделю: 50 рецептов с разными множителями порций
+        'shopping_list': lambda: f"{reverse('recipeapp:shopping_list')}?" + '&'.join(
+            f'recipe={pk}&servings={rng.choice((1, 2, 0.5))}'
+            for pk in rng.sample(recipe_ids, min(50, len(recipe_ids)))
+        ),
+    }
+
+
+class Command(BaseCommand):
+    """
+    Замеряет время ответа и число SQL-запросов основных страниц приложения.
+    """
+    help = "Прогоняет страницы recipeapp через тестовый клиент и выводит p50/p95 времени ответа и число запросов."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='Число запросов на каждую страницу')
+        parser.add_argument('--anonymous', action='store_true',
+                            help='Запросы от анонимного пользователя (с кешем страниц)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Сохранить результаты в JSON-файл')
+        parser.add_argument('--baseline', help='JSON-файл с предыдущими результатами для сравнения')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Допустимый рост p95 относительно baseline (доля)')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        client = Client()
+        if not options['anonymous']:
+            user, _ = User.objects.get_or_create(username='benchmark')
+            client.force_login(user)
+
+        results = {}
+        with override_settings(ALLOWED_HOSTS=['testserver'], DEBUG=False):
+            for name, make_url in benchmark_urls(rng).items():
+                timings, queries = [], []
+                for _ in range(options['iterations']):
+                    url = make_url()
+                    with CaptureQueriesContext(connection) as captured:
+                        started = time.perf_counter()
+                        response = client.get(url)
+                        timings.append((time.perf_counter() - started) * 1000)
+                    if response.status_code != 200:
+                        raise CommandError(f'{url} вернул {response.status_code}')
+                    queries.append(len(captured))
+                results[name] = {
+                    'p50_ms': round(statistics.median(timings), 2),
+                    'p95_ms': round(percentile(timings, 0.95), 2),
+                    'queries_avg': round(statistics.mean(queries), 1),
+                    'queries_max': max(queries),
+                }
+
+        self.stdout.write(f'{"Страница":<24}{"p50, мс":>10}{"p95, мс":>10}{"запросы":>10}{"макс":>6}')
+        for name, row in results.items():
+            self.stdout.write(
+                f'{name:<24}{row["p50_ms"]:>10}{row["p95_ms"]:>10}{row["queries_avg"]:>10}{row["queries_max"]:>6}'
+            )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(results, output, indent=2, ensure_ascii=False)
+
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['tolerance'])
+
+    def compare(self, results, path, tolerance):
+        with open(path, encoding='utf-8') as source:
+            baseline = json.load(source)
+
+        regressions = []
+        for name, row in results.items():
+            previous = baseline.get(name)
+            if not previous:
+                continue
+            if row['queries_max'] > previous['queries_max']:
+                regressions.append(f'{name}: запросов {previous["queries_max"]} -> {row["queries_max"]}')
+            if row['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+                regressions.append(f'{name}: p95 {previous["p95_ms"]} -> {row["p95_ms"]} мс')
+
+        if regressions:
+            raise CommandError('Обнаружены регрессии:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Регрессий относительно baseline нет'))
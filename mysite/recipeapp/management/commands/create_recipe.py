@@ -1,6 +1,7 @@
 from django.contrib.auth.models import User
 from django.core.management import BaseCommand
 from recipeapp.models import Recipe, Ingredient, Category
+from recipeapp.services import save_recipe_ingredients
 
 
 class Command(BaseCommand):
@@ -46,16 +47,14 @@ class Command(BaseCommand):
                                 '3. Нарезаем мясо и добавляем к луку, наливаем стакан воды и томим 1 час. '
                                 '4. Добавляем перец, морковь, помидоры и картофель к мясу. '
                                 '5. Солим, добавляем еще 3 стакана воды и томим еще полчаса.',
-                'meal_type': 'горячее',
                 'cooking_time': 90,  # Добавлено время приготовления (в минутах)
                 'created_by': user,
             }
         )
 
         # Добавляем ингредиенты и категории
-        recipe.ingredients.set(ingredients)
+        save_recipe_ingredients(recipe, {ingredient.pk: 1 for ingredient in ingredients})
         recipe.categories.add(category)
-        recipe.save()
 
         if created:
             self.stdout.write(self.style.SUCCESS(f'Рецепт "{recipe.name}" успешно создан.'))
@@ -0,0 +1,149 @@
+import random
+import re
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+
+from recipeapp.management.commands.benchmark_views import benchmark_urls
+
+# Таблицы, которые читаются целиком намеренно: короткие справочники
+FULL_SCAN_ALLOWED = {'recipeapp_category'}
+
+CONDITION_COLUMN = re.compile(r'"(\w+)"\."(\w+)"\s*(?:=|IN\b|>|<|IS\b)')
+ORDER_COLUMN = re.compile(r'"(\w+)"\."(\w+)"(?:\s+(?:ASC|DESC))?')
+
+
+class StatementCollector:
+    """
+    Обертка выполнения SQL: запоминает SELECT-запросы страницы вместе с параметрами.
+    """
+    def __init__(self):
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith('SELECT'):
+            self.statements.setdefault(sql, params)
+        return execute(sql, params, many, context)
+
+
+def explain(sql, params):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN {sql}', params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def ranked_ordering(sql):
+    # Сортировка по релевантности поиска вычисляется для найденных строк и индексом не обслуживается
+    # (bm25 в индексе FTS5 или search_rank из recipeapp.search.order_by_ids)
+    _, _, order = sql.partition(' ORDER BY ')
+    return order.startswith('bm25(') or 'AS "search_rank"' in sql
+
+
+def find_problems(sql, plan):
+    """
+    Возвращает список (вид, таблица) для шагов плана без индекса: полный просмотр или сортировка.
+    """
+    problems = []
+    for line in plan:
+        if connection.vendor == 'sqlite':
+            match = re.match(r'SCAN (\w+)', line)
+            if match and 'INDEX' not in line:
+                problems.append(('scan', match.group(1)))
+            elif 'USE TEMP B-TREE FOR ORDER BY' in line and not ranked_ordering(sql):
+                problems.append(('sort', None))
+        else:
+            match = re.search(r'Seq Scan on (\w+)', line)
+            if match:
+                problems.append(('scan', match.group(1)))
+            elif re.search(r'\bSort\b', line) and 'Incremental' not in line and not ranked_ordering(sql):
+                problems.append(('sort', None))
+    return [(kind, table) for kind, table in problems if table not in FULL_SCAN_ALLOWED]
+
+
+def propose_index(sql, kind, table):
+    """
+    Предлагает столбцы индекса: условия WHERE для полного просмотра, ORDER BY для сортировки.
+    """
+    where, _, order = sql.partition(' ORDER BY ')
+    _, _, where = where.partition(' WHERE ')
+    if kind == 'sort':
+        columns = ORDER_COLUMN.findall(order.split(' LIMIT ')[0])
+    else:
+        columns = CONDITION_COLUMN.findall(where)
+    table = table or (columns[0][0] if columns else None)
+    names = list(dict.fromkeys(column for column_table, column in columns if column_table == table))
+    if not table or not names:
+        return None
+    return f'{table}({", ".join(names)})'
+
+
+class Command(BaseCommand):
+    """
+    Проверяет, что запросы страниц обслуживаются индексами.
+    """
+    help = ("Открывает страницы recipeapp, выводит планы EXPLAIN их SELECT-запросов, "
+            "находит полные просмотры таблиц и сортировки без индекса и предлагает индексы.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--anonymous', action='store_true', help='Запросы от анонимного пользователя')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--plans', action='store_true', help='Печатать планы всех запросов')
+        parser.add_argument('--strict', action='store_true',
+                            help='Завершиться с ошибкой, если есть запросы без индекса или индексы отсутствуют в БД')
+
+    def handle(self, *args, **options):
+        missing = self.validate_indexes()
+        for model, name in missing:
+            self.stdout.write(self.style.ERROR(f'Индекс {name} модели {model} отсутствует в базе данных'))
+
+        client = Client()
+        if not options['anonymous']:
+            user, _ = User.objects.get_or_create(username='benchmark')
+            client.force_login(user)
+
+        problem_count = 0
+        with override_settings(ALLOWED_HOSTS=['testserver'], DEBUG=False):
+            for name, make_url in benchmark_urls(random.Random(options['seed'])).items():
+                collector = StatementCollector()
+                with connection.execute_wrapper(collector):
+                    client.get(make_url())
+
+                self.stdout.write(self.style.MIGRATE_HEADING(f'{name}: запросов {len(collector.statements)}'))
+                for sql, params in collector.statements.items():
+                    plan = explain(sql, params)
+                    problems = find_problems(sql, plan)
+                    problem_count += bool(problems)
+                    if problems or options['plans']:
+                        self.stdout.write(f'  {sql[:200]}')
+                        for line in plan:
+                            self.stdout.write(f'    {line}')
+                    for kind, table in problems:
+                        proposal = propose_index(sql, kind, table)
+                        message = 'полный просмотр' if kind == 'scan' else 'сортировка без индекса'
+                        if proposal:
+                            message += f', предлагаемый индекс: {proposal}'
+                        self.stdout.write(self.style.WARNING(f'    ! {message}'))
+
+        if options['strict'] and (problem_count or missing):
+            raise CommandError(f'Запросов без индекса: {problem_count}, отсутствующих индексов: {len(missing)}')
+        self.stdout.write(self.style.SUCCESS(f'Проверка завершена, запросов без индекса: {problem_count}'))
+
+    def validate_indexes(self):
+        """
+        Сверяет индексы из Meta.indexes моделей recipeapp с индексами в базе данных.
+        """
+        missing = []
+        with connection.cursor() as cursor:
+            for model in apps.get_app_config('recipeapp').get_models():
+                existing = connection.introspection.get_constraints(cursor, model._meta.db_table)
+                missing.extend(
+                    (model.__name__, index.name) for index in model._meta.indexes if index.name not in existing
+                )
+        return missing
@@ -0,0 +1,42 @@
+from django.core.management import BaseCommand
+from django.core.management.base import OutputWrapper
+
+from recipeapp.export import EXPORT_CHUNK_SIZE, RECIPE_FIELDS, csv_lines, iter_recipe_records, jsonl_lines
+from recipeapp.models import Recipe
+
+
+class Command(BaseCommand):
+    """
+    Выгружает рецепты в CSV или JSON Lines.
+    """
+    help = "Потоково выгружает рецепты с категориями и ингредиентами в CSV или JSON Lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='jsonl', help='Формат выгрузки')
+        parser.add_argument('--output', help='Файл для записи (по умолчанию стандартный вывод)')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help='Размер порции чтения из БД')
+        parser.add_argument('--include-archived', action='store_true', help='Выгружать архивные рецепты')
+
+    def handle(self, *args, **options):
+        queryset = Recipe.objects.all() if options['include_archived'] else Recipe.active.all()
+
+        records = iter_recipe_records(queryset, options['chunk_size'])
+        if options['format'] == 'csv':
+            lines = csv_lines(records, RECIPE_FIELDS)
+        else:
+            lines = jsonl_lines(records)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                count = self._write(lines, OutputWrapper(output))
+            self.stderr.write(self.style.SUCCESS(f'Выгружено строк: {count} в {options["output"]}'))
+        else:
+            self._write(lines, self.stdout)
+
+    @staticmethod
+    def _write(lines, output):
+        count = 0
+        for line in lines:
+            output.write(line, ending='')
+            count += 1
+        return count
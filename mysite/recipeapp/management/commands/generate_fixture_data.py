@@ -0,0 +1,139 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from recipeapp import cache as recipe_cache
+from recipeapp import facets, pantry
+from recipeapp.models import Category, Comment, Ingredient, Rating, Recipe, RecipeIngredient
+from recipeapp.comments import rebuild_comment_counts
+from recipeapp.ratings import rebuild_rating_aggregates
+from recipeapp.recommendations import rebuild_neighbors
+from recipeapp.search import rebuild_index
+
+WORDS = (
+    'суп салат жареный тушеный запеченный домашний быстрый сливочный острый летний зимний '
+    'картофель говядина курица рыба грибы сыр томатный овощной рисовый пряный нежный хрустящий'
+).split()
+
+MEASURES = ['г', 'кг', 'мл', 'л', 'шт', 'ст.л.', 'ч.л.', 'зубчик(а)']
+
+
+class Command(BaseCommand):
+    """
+    Генерирует синтетические данные для нагрузочного тестирования.
+    """
+    help = "Создает пользователей, ингредиенты, рецепты, комментарии и оценки с реалистичными распределениями."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42, help='Зерно генератора для воспроизводимости')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        started = time.monotonic()
+
+        self.stdout.write('Создание пользователей и справочников')
+        password = make_password(None)
+        prefix = f'fixture{options["seed"]}_'
+        User.objects.bulk_create(
+            [User(username=f'{prefix}{i}', password=password) for i in range(options['users'])],
+            ignore_conflicts=True,
+        )
+        user_ids = list(User.objects.filter(username__startswith=prefix).values_list('pk', flat=True))
+
+        Category.objects.bulk_create(
+            [Category(name=name, description=name) for name in
+             ('Горячее', 'Суп', 'Салат', 'Десерт', 'Закуска', 'Напиток', 'Выпечка')],
+            ignore_conflicts=True,
+        )
+        category_ids = list(Category.objects.values_list('pk', flat=True))
+
+        ingredient_ids = [ingredient.pk for ingredient in Ingredient.objects.bulk_create([
+            Ingredient(name=f'{rng.choice(WORDS).capitalize()} {i}', measure=rng.choice(MEASURES))
+            for i in range(options['ingredients'])
+        ], batch_size=batch_size)]
+
+        # Популярность ингредиентов и активность пользователей распределены по закону Ципфа:
+        # немногие ингредиенты встречаются почти везде, большинство — редко
+        ingredient_weights = [1 / (rank + 1) for rank in range(len(ingredient_ids))]
+        user_weights = [1 / (rank + 1) for rank in range(len(user_ids))]
+
+        total = options['recipes']
+        created = 0
+        while created < total:
+            size = min(batch_size, total - created)
+            with transaction.atomic():
+                self._create_batch(rng, size, user_ids, user_weights, category_ids, ingredient_ids,
+                                   ingredient_weights)
+            created += size
+            self.stdout.write(f'Создано рецептов: {created}')
+
+        self.stdout.write('Пересчет агрегатов, счетчиков категорий, поискового индекса и похожих рецептов')
+        rebuild_rating_aggregates()
+        rebuild_comment_counts()
+        facets.refresh_counts()
+        rebuild_index()
+        rebuild_neighbors()
+        recipe_cache.bump(recipe_cache.RECIPES, recipe_cache.CATEGORIES, recipe_cache.INGREDIENTS)
+        pantry.record_changes()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Успешно созданы тестовые данные за {time.monotonic() - started:.1f} с'
+        ))
+
+    def _create_batch(self, rng, size, user_ids, user_weights, category_ids, ingredient_ids, ingredient_weights):
+        authors = rng.choices(user_ids, user_weights, k=size)
+        # Около 5% рецептов в архиве, перенесены туда в течение последнего года
+        now = timezone.now()
+        archived_at = [now - timedelta(days=rng.uniform(0, 365)) if rng.random() < 0.05 else None
+                       for _ in authors]
+        recipes = Recipe.objects.bulk_create([
+            Recipe(
+                name=' '.join(rng.sample(WORDS, rng.randint(2, 4))).capitalize(),
+                description=' '.join(rng.choices(WORDS, k=rng.randint(10, 40))),
+                instructions=' '.join(rng.choices(WORDS, k=rng.randint(30, 150))),
+                # Время приготовления распределено логнормально: медиана около 40 минут
+                cooking_time=max(5, int(rng.lognormvariate(3.7, 0.6))),
+                created_by_id=author,
+                archived=recipe_archived_at is not None,
+                archived_at=recipe_archived_at,
+            )
+            for author, recipe_archived_at in zip(authors, archived_at)
+        ])
+
+        through = Recipe.categories.through
+        links, recipe_ingredients, comments, ratings = [], [], [], []
+        for recipe in recipes:
+            for category_id in rng.sample(category_ids, rng.randint(1, min(2, len(category_ids)))):
+                links.append(through(recipe_id=recipe.pk, category_id=category_id))
+
+            chosen = set(rng.choices(ingredient_ids, ingredient_weights, k=rng.randint(3, 15)))
+            recipe_ingredients.extend(
+                RecipeIngredient(recipe_id=recipe.pk, ingredient_id=ingredient_id, quantity=rng.randint(1, 500))
+                for ingredient_id in chosen
+            )
+
+            # Число комментариев и оценок — длинный хвост: у большинства рецептов их мало
+            for _ in range(min(int(rng.paretovariate(1.2)) - 1, 200)):
+                comments.append(Comment(recipe_id=recipe.pk, user_id=rng.choice(user_ids),
+                                        text=' '.join(rng.choices(WORDS, k=rng.randint(3, 30)))))
+            raters = set(rng.sample(user_ids, min(len(user_ids), int(rng.paretovariate(1.1)) - 1)))
+            ratings.extend(
+                Rating(recipe_id=recipe.pk, user_id=user_id, value=min(10, max(0, round(rng.gauss(7, 2)))))
+                for user_id in raters
+            )
+
+        through.objects.bulk_create(links, ignore_conflicts=True)
+        RecipeIngredient.objects.bulk_create(recipe_ingredients)
+        Comment.objects.bulk_create(comments)
+        Rating.objects.bulk_create(ratings, ignore_conflicts=True)
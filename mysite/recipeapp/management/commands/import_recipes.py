@@ -0,0 +1,58 @@
+import time
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError
+
+from recipeapp.importer import RecipeImporter, iter_csv, iter_jsonl
+
+
+class Command(BaseCommand):
+    """
+    Импортирует рецепты из файлов JSON Lines или CSV.
+    """
+    help = "Пакетно импортирует рецепты с категориями и ингредиентами из JSON Lines или CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу .jsonl или .csv')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Формат файла (по умолчанию по расширению)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Число рецептов в одной транзакции')
+        parser.add_argument('--author', default='stasy', help='Автор для рецептов с неизвестным пользователем')
+        parser.add_argument('--skip-index', action='store_true',
+                            help='Не обновлять поисковый индекс (запустите rebuild_search_index после импорта)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть положительным')
+
+        author, created = User.objects.get_or_create(username=options['author'])
+        if created:
+            self.stdout.write(f'Создан новый пользователь - {author.username}')
+
+        records = iter_csv(path) if file_format == 'csv' else iter_jsonl(path)
+        importer = RecipeImporter(author, update_search_index=not options['skip_index'])
+
+        self.stdout.write(f'Импорт рецептов из {path}')
+        started = time.monotonic()
+        total = skipped = 0
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+            recipe_ids, errors = importer.import_batch(batch)
+            total += len(recipe_ids)
+            skipped += len(errors)
+            for line_number, error in errors:
+                self.stdout.write(self.style.WARNING(f'Строка {line_number} пропущена: {error}'))
+            elapsed = max(time.monotonic() - started, 1e-9)
+            self.stdout.write(f'Импортировано рецептов: {total} ({total / elapsed:.0f} рец/с)')
+
+        importer.finish()
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write(self.style.SUCCESS(
+            f'Успешно импортировано рецептов: {total}, пропущено строк: {skipped} '
+            f'за {elapsed:.1f} с ({total / elapsed:.0f} рец/с)'
+        ))
@@ -0,0 +1,15 @@
+from django.core.management import BaseCommand
+
+from recipeapp.ratings import rebuild_rating_aggregates
+
+
+class Command(BaseCommand):
+    """
+    Пересчитывает агрегаты рейтинга рецептов по таблице оценок.
+    """
+    help = "Пересчитывает количество, сумму и средний рейтинг для всех рецептов."
+
+    def handle(self, *args, **options):
+        self.stdout.write('Пересчет агрегатов рейтинга')
+        updated = rebuild_rating_aggregates()
+        self.stdout.write(self.style.SUCCESS(f'Успешно обновлено рецептов: {updated}'))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management import BaseCommand
+
+from recipeapp.recommendations import rebuild_neighbors
+
+
+class Command(BaseCommand):
+    """
+    Пересчитывает похожие рецепты для всех рецептов.
+    """
+    help = "Полностью пересчитывает таблицу похожих рецептов по совпадению ингредиентов и рейтингу."
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        self.stdout.write('Пересчет похожих рецептов')
+        count = rebuild_neighbors(self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Успешно пересчитаны соседи рецептов: {count} за {time.monotonic() - started:.1f} с'
+        ))
@@ -0,0 +1,15 @@
+from django.core.management import BaseCommand
+
+from recipeapp.search import rebuild_index
+
+
+class Command(BaseCommand):
+    """
+    Перестраивает полнотекстовый индекс рецептов.
+    """
+    help = "Перестраивает полнотекстовый поисковый индекс по всем рецептам."
+
+    def handle(self, *args, **options):
+        self.stdout.write('Перестроение поискового индекса')
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Успешно проиндексировано рецептов: {count}'))
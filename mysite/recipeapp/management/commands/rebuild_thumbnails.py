@@ -0,0 +1,56 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management import BaseCommand
+
+from recipeapp.images import build_variants, delete_variants, store_variants
+from recipeapp.models import Recipe
+
+
+def _build(source):
+    # Выполняется в дочернем процессе: ошибки возвращаются, чтобы не прерывать всю обработку
+    try:
+        return source, build_variants(source), None
+    except Exception as error:
+        return source, None, str(error)
+
+
+class Command(BaseCommand):
+    """
+    Создает уменьшенные копии изображений всех рецептов.
+    """
+    help = "Создает WebP/JPEG-копии изображений рецептов параллельно в нескольких процессах."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Число процессов')
+        parser.add_argument('--force', action='store_true', help='Пересоздать копии, даже если они уже есть')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        recipes = {}
+        for pk, source, variants in (Recipe.objects.exclude(image='').exclude(image__isnull=True)
+                                     .values_list('pk', 'image', 'image_variants').iterator()):
+            if options['force'] or variants.get('source') != source:
+                recipes.setdefault(source, []).append((pk, variants))
+
+        self.stdout.write(f'Изображений для обработки: {len(recipes)}')
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as executor:
+            for source, variants, error in executor.map(_build, list(recipes), chunksize=4):
+                if error:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(f'{source}: {error}'))
+                    continue
+                # Старые копии удаляются после записи новых, чтобы srcset страниц не ссылался на удаленные файлы
+                for pk, previous in recipes[source]:
+                    if store_variants(pk, source, variants):
+                        delete_variants(previous, keep=variants)
+                done += 1
+                if done % 100 == 0:
+                    self.stdout.write(f'Обработано изображений: {done}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Успешно обработано изображений: {done}, с ошибками: {failed} за {time.monotonic() - started:.1f} с'
+        ))
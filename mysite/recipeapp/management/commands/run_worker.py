@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import timedelta
+
+import django
+from django.core.management import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from recipeapp.tasks import claim, execute, finish, release_stale, requeue
+
+
+class Command(BaseCommand):
+    """
+    Выполняет фоновые задачи из очереди recipeapp.tasks.
+    """
+    help = ("Забирает задачи из очереди и выполняет их в пуле процессов. "
+            "Останавливается по SIGTERM/Ctrl+C после завершения начатых задач.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=2, help='Число процессов, выполняющих задачи')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Пауза между проверками пустой очереди, секунд')
+        parser.add_argument('--lock-timeout', type=int, default=600,
+                            help='Через сколько секунд задача, захваченная другим воркером, считается зависшей')
+        parser.add_argument('--once', action='store_true', help='Выполнить готовые задачи и завершиться')
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        if concurrency < 1:
+            raise CommandError('--concurrency должен быть положительным')
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        lock_timeout = timedelta(seconds=options['lock_timeout'])
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+
+        released = release_stale(lock_timeout, exclude_worker=worker_id)
+        if released:
+            self.stdout.write(f'Возвращено в очередь зависших задач: {released}')
+        self.stdout.write(f'Воркер {worker_id} запущен, процессов: {concurrency}')
+
+        done = failed = 0
+        running = {}
+        last_release = time.monotonic()
+        # Дочерние процессы запускаются заново (spawn), а не копируют открытые подключения к базе
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=concurrency, mp_context=context, initializer=django.setup) as executor:
+            try:
+                while not self.stopping or running:
+                    if not self.stopping and len(running) < concurrency:
+                        for task_record in claim(worker_id, concurrency - len(running)):
+                            running[executor.submit(execute, task_record.name, task_record.payload)] = task_record
+
+                    if not running:
+                        if options['once']:
+                            break
+                        close_old_connections()
+                        time.sleep(options['poll_interval'])
+                    else:
+                        completed, _ = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                        for future in completed:
+                            task_record = running.pop(future)
+                            try:
+                                error = future.result()
+                            except Exception as exc:
+                                # Дочерний процесс упал целиком (BrokenProcessPool)
+                                error = repr(exc)
+                            finish(task_record, error)
+                            if error is None:
+                                done += 1
+                            else:
+                                failed += 1
+                                self.stdout.write(self.style.ERROR(f'{task_record}: {error.splitlines()[-1]}'))
+
+                    if time.monotonic() - last_release > lock_timeout.total_seconds():
+                        release_stale(lock_timeout, exclude_worker=worker_id)
+                        last_release = time.monotonic()
+            except KeyboardInterrupt:
+                # Ctrl+C получают и дочерние процессы: начатые задачи возвращаются в очередь без учета попытки
+                requeue(running.values())
+                executor.shutdown(cancel_futures=True)
+                self.stdout.write(f'Прервано, возвращено в очередь задач: {len(running)}')
+
+        self.stdout.write(self.style.SUCCESS(f'Воркер остановлен. Выполнено задач: {done}, с ошибками: {failed}'))
+
+    def stop(self, signum, frame):
+        self.stopping = True
@@ -0,0 +1,52 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from recipeapp.routers import replicas
+
+
+class Command(BaseCommand):
+    """
+    Копирует основную базу SQLite в файлы реплик.
+    """
+    help = ("Обновляет локальные реплики (RECIPE_DB_REPLICAS) копией основной базы SQLite. "
+            "С --interval повторяет копирование, имитируя отстающую репликацию.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*', help='Псевдонимы реплик (по умолчанию все)')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Повторять копирование каждые N секунд, пока команду не остановят')
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or replicas()
+        if not aliases:
+            raise CommandError('Реплики не настроены: задайте RECIPE_DB_REPLICAS')
+        for alias in aliases:
+            if alias == DEFAULT_DB_ALIAS or alias not in settings.DATABASES:
+                raise CommandError(f'Неизвестная реплика: {alias}')
+            if settings.DATABASES[alias]['ENGINE'] != 'django.db.backends.sqlite3':
+                raise CommandError(f'{alias}: копируются только реплики SQLite')
+
+        while True:
+            for alias in aliases:
+                started = time.monotonic()
+                self.copy(alias)
+                self.stdout.write(f'{alias}: скопировано за {time.monotonic() - started:.2f} с')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS('Реплики обновлены'))
+
+    def copy(self, alias):
+        source = connections[DEFAULT_DB_ALIAS]
+        source.ensure_connection()
+        # Резервное копирование SQLite видит согласованный снимок основной базы, включая журнал WAL,
+        # а читатели реплики в режиме WAL не блокируются и после копирования видят новые данные
+        target = sqlite3.connect(settings.DATABASES[alias]['NAME'], timeout=20)
+        try:
+            source.connection.backup(target)
+        finally:
+            target.close()
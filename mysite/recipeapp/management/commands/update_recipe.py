@@ -1,5 +1,6 @@
 from django.core.management import BaseCommand
 from recipeapp.models import Recipe, Ingredient, Category
+from recipeapp.services import save_recipe_ingredients
 
 
 class Command(BaseCommand):
@@ -31,8 +32,7 @@ class Command(BaseCommand):
             self.stdout.write(f'Категория уже существует - {category.name}')
 
         # Добавляем ингредиенты и категории
-        recipe.ingredients.set(ingredients)
+        save_recipe_ingredients(recipe, {ingredient.pk: 1 for ingredient in ingredients})
         recipe.categories.add(category)
-        recipe.save()
 
         self.stdout.write(self.style.SUCCESS(f'Успешно обновлен рецепт "{recipe.name}"'))
\ No newline at end of file
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.5 on 2026-10-17 19:52
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, Sum
+
+
+def fill_rating_aggregates(apps, schema_editor):
+    Recipe = apps.get_model('recipeapp', 'Recipe')
+    Rating = apps.get_model('recipeapp', 'Rating')
+    rows = Rating.objects.values('recipe').annotate(c=Count('pk'), s=Sum('value'), a=Avg('value'))
+    for row in rows.iterator():
+        Recipe.objects.filter(pk=row['recipe']).update(
+            rating_count=row['c'], rating_sum=row['s'], rate=round(row['a'], 2)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipeapp', '0007_alter_ingredient_options_alter_ingredient_archived_and_more'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='recipe',
+            name='meal_type',
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='rate',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0.0, max_digits=10),
+        ),
+        migrations.RunPython(fill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+from django.db import migrations
+
+# Схема и заполнение индекса записаны здесь, а не берутся из recipeapp.search:
+# миграция не должна меняться вместе с кодом поиска
+FTS_TABLE = 'recipeapp_recipe_fts'
+PG_TABLE = 'recipeapp_recipe_search'
+
+
+def _tables(apps):
+    return {
+        'recipe': apps.get_model('recipeapp', 'Recipe')._meta.db_table,
+        'recipe_ingredient': apps.get_model('recipeapp', 'RecipeIngredient')._meta.db_table,
+        'ingredient': apps.get_model('recipeapp', 'Ingredient')._meta.db_table,
+    }
+
+
+def create_search_index(apps, schema_editor):
+    tables = _tables(apps)
+    ingredient_names = (
+        "SELECT {separator} FROM {recipe_ingredient} ri JOIN {ingredient} i ON i.id = ri.ingredient_id "
+        "WHERE ri.recipe_id = r.id"
+    )
+    vendor = schema_editor.connection.vendor
+
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5(name, body, tokenize='unicode61 remove_diacritics 2')"
+        )
+        # Документы заполняются словами без стемминга: основа - начало слова, поэтому
+        # префиксный запрос по основе находит те же рецепты. Основы запишет следующее
+        # сохранение рецепта или команда rebuild_search_index
+        fold = "REPLACE(REPLACE({}, 'ё', 'е'), 'Ё', 'Е')"
+        names = ingredient_names.format(separator="group_concat(i.name, ' ')", **tables)
+        body = f"r.description || ' ' || r.instructions || ' ' || COALESCE(({names}), '')"
+        schema_editor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, body) "
+            f"SELECT r.id, {fold.format('r.name')}, {fold.format(body)} FROM {tables['recipe']} r"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE TABLE IF NOT EXISTS {PG_TABLE} ("
+            f"recipe_id bigint PRIMARY KEY REFERENCES {tables['recipe']} (id) ON DELETE CASCADE, "
+            f"document tsvector NOT NULL)"
+        )
+        schema_editor.execute(f"CREATE INDEX IF NOT EXISTS {PG_TABLE}_document_idx ON {PG_TABLE} USING GIN (document)")
+        names = ingredient_names.format(separator="string_agg(i.name, ' ')", **tables)
+        schema_editor.execute(
+            f"INSERT INTO {PG_TABLE} (recipe_id, document) "
+            f"SELECT r.id, setweight(to_tsvector('russian', r.name), 'A') || "
+            f"setweight(to_tsvector('russian', concat_ws(' ', r.description, r.instructions, ({names}))), 'B') "
+            f"FROM {tables['recipe']} r ON CONFLICT (recipe_id) DO NOTHING"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {PG_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipeapp', '0008_recipe_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.5 on 2026-10-17 20:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipeapp', '0013_task_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('similarity', models.FloatField()),
+                ('shared_ingredients', models.PositiveIntegerField()),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipeapp.recipe')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='recipeapp.recipe')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['recipe', '-score'], name='neighbor_recipe_score_idx')],
+                'constraints': [models.UniqueConstraint(fields=('recipe', 'neighbor'), name='unique_recipe_neighbor')],
+            },
+        ),
+    ]
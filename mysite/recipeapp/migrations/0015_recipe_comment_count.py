@@ -0,0 +1,28 @@
+# Generated by Django 5.1.5 on 2026-10-17 20:45
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_comment_counts(apps, schema_editor):
+    Recipe = apps.get_model('recipeapp', 'Recipe')
+    Comment = apps.get_model('recipeapp', 'Comment')
+    rows = Comment.objects.values('recipe').annotate(c=Count('pk'))
+    for row in rows.iterator():
+        Recipe.objects.filter(pk=row['recipe']).update(comment_count=row['c'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipeapp', '0014_recipe_neighbors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_comment_counts, migrations.RunPython.noop),
+    ]
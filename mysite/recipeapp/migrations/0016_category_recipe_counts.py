@@ -0,0 +1,37 @@
+# Generated by Django 5.1.5 on 2026-10-17 20:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_category_counts(apps, schema_editor):
+    Category = apps.get_model('recipeapp', 'Category')
+    CategoryRecipeCount = apps.get_model('recipeapp', 'CategoryRecipeCount')
+    Through = apps.get_model('recipeapp', 'Recipe').categories.through
+    counts = dict(
+        Through.objects.filter(recipe__archived=False).values('category').annotate(c=Count('pk'))
+        .values_list('category', 'c')
+    )
+    CategoryRecipeCount.objects.bulk_create([
+        CategoryRecipeCount(category_id=pk, count=counts.get(pk, 0))
+        for pk in Category.objects.values_list('pk', flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipeapp', '0015_recipe_comment_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryRecipeCount',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='facet', serialize=False, to='recipeapp.category')),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_category_counts, migrations.RunPython.noop),
+    ]
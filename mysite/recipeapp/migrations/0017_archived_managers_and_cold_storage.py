@@ -0,0 +1,69 @@
+# Generated by Django 5.1.5 on 2026-10-17 20:56
+
+import django.core.serializers.json
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_archived_at(apps, schema_editor):
+    # Точное время архивации неизвестно: берется время последнего изменения
+    for model_name in ('Recipe', 'Ingredient'):
+        apps.get_model('recipeapp', model_name).objects.filter(archived=True).update(archived_at=F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipeapp', '0016_category_recipe_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngredientArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200)),
+                ('description', models.TextField(blank=True)),
+                ('measure', models.CharField(blank=True, max_length=15, null=True)),
+                ('archived_at', models.DateTimeField(null=True)),
+                ('moved_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RecipeArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200)),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('archived_at', models.DateTimeField(null=True)),
+                ('moved_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='recipe',
+            name='recipe_archived_created_idx',
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Архивировано в'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(condition=models.Q(('archived', True)), fields=['archived_at'], name='ingredient_archived_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('archived', False)), fields=['created_at', 'id'], name='recipe_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('archived', True)), fields=['archived_at'], name='recipe_archived_at_idx'),
+        ),
+        migrations.RunPython(fill_archived_at, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,42 @@
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models import F, Func, Q
+from django.utils import timezone
+
+
+class EmptyIfNull(Func):
+    """
+    COALESCE(поле, '') с пустой строкой прямо в тексте SQL. С параметром вместо литерала
+    запрос не совпадает с выражением индекса, и база данных не может им воспользоваться.
+    """
+    function = 'COALESCE'
+    template = "%(function)s(%(expressions)s, '')"
+    arity = 1
+
+
+class ArchivableQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(archived=False)
+
+    def archive(self):
+        """
+        Переносит записи в архив одним UPDATE (без сигналов). Возвращает число измененных записей.
+        """
+        now = timezone.now()
+        return self.filter(archived=False).update(archived=True, archived_at=now, updated_at=now)
+
+    def unarchive(self):
+        return self.filter(archived=True).update(archived=False, archived_at=None, updated_at=timezone.now())
+
+
+class ActiveManager(models.Manager.from_queryset(ArchivableQuerySet)):
+    """
+    Только неархивированные записи. Запросы через него совпадают с условием
+    частичных индексов WHERE NOT archived и читают только рабочий набор.
+    """
+    def get_queryset(self):
+        return super().get_queryset().filter(archived=False)
 
 
 class Category(models.Model):
@@ -10,11 +47,32 @@ class Category(models.Model):
         return self.name
 
 
+class CategoryRecipeCount(models.Model):
+    """
+    Число неархивированных рецептов категории для панели фильтров (см. recipeapp.facets).
+    """
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True, related_name='facet')
+    count = models.IntegerField(default=0)
+
+
 class Ingredient(models.Model):
     class Meta:
         ordering = ['name']
         verbose_name = 'Ингредиент'  # Название модели в единственном числе
         verbose_name_plural = 'Ингредиенты'  # Название модели во множественном числе
+        indexes = [
+            # Ингредиенты по названию с отбором по признаку архивации (админка, archived=True)
+            models.Index(fields=['archived', 'name', 'id'], name='ingredient_name_idx'),
+            # filter(archived=False) Django записывает как NOT archived, а такое условие SQLite
+            # не сопоставляет с первым столбцом составного индекса, поэтому для активных
+            # ингредиентов (список и формы рецептов) используются частичные индексы
+            models.Index(fields=['name', 'id'], condition=Q(archived=False), name='ingredient_active_name_idx'),
+            # Сортировка списка по единице измерения (measure_key в IngredientListView)
+            models.Index(EmptyIfNull('measure'), F('id'), condition=Q(archived=False),
+                         name='ingredient_active_measure_idx'),
+            # Давно архивированные записи для переноса в архивную таблицу (archive_cold_storage)
+            models.Index(fields=['archived_at'], condition=Q(archived=True), name='ingredient_archived_at_idx'),
+        ]
 
     name = models.CharField(
         max_length=200,
@@ -24,7 +82,6 @@ class Ingredient(models.Model):
     description = models.TextField(
         null=False,
         blank=True,
-        db_index=True,
         verbose_name="Описание"  # Название поля
     )
     measure = models.CharField(
@@ -37,6 +94,23 @@ class Ingredient(models.Model):
         default=False,
         verbose_name="Архивировано"  # Название поля
     )
+    # Время переноса в архив; заполняется сигналом pre_save и ArchivableQuerySet.archive()
+    archived_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Архивировано в"  # Название поля
+    )
+    # Время последнего изменения для Last-Modified и ETag в JSON API; update() обновляет его явно
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        db_index=True,
+        verbose_name="Изменено"  # Название поля
+    )
+
+    # Первым объявлен менеджер по умолчанию: админка и связи видят и архивированные записи
+    objects = ArchivableQuerySet.as_manager()
+    active = ActiveManager()
 
     def __str__(self) -> str:
         return f'Продукт(название={self.name}, описание={self.description}, мера={self.measure})'
@@ -48,19 +122,43 @@ class Recipe(models.Model):
     instructions = models.TextField()
     cooking_time = models.PositiveIntegerField(help_text="Время приготовления в минутах")
     image = models.ImageField(upload_to='recipes/', blank=True, null=True)
-    rate = models.DecimalField(max_digits=10, decimal_places=2, default=0.0)
+    # Уменьшенные копии изображения: {'source': ..., 'widths': [...], 'formats': [...]} (см. recipeapp.images)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # Средний рейтинг и агрегаты, поддерживаются при каждой оценке (см. recipeapp.ratings)
+    rate = models.DecimalField(max_digits=10, decimal_places=2, default=0.0, db_index=True)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+    # Число комментариев, поддерживается при добавлении и удалении (см. recipeapp.comments)
+    comment_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Время последнего изменения для Last-Modified и ETag в JSON API; update() обновляет его явно
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     categories = models.ManyToManyField('Category', related_name='recipes')
     archived = models.BooleanField(default=False)
+    # Время переноса в архив; заполняется сигналом pre_save и ArchivableQuerySet.archive()
+    archived_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = ArchivableQuerySet.as_manager()
+    active = ActiveManager()
+
+    class Meta:
+        indexes = [
+            # Админка и выгрузки: все рецепты от новых к старым
+            models.Index(fields=['created_at', 'id'], name='recipe_created_idx'),
+            # Ленты рецептов (Recipe.active): от новых к старым, курсор по (created_at, id).
+            # Частичный индекс содержит только рабочий набор, архивные рецепты в него не попадают
+            models.Index(fields=['created_at', 'id'], condition=Q(archived=False), name='recipe_active_created_idx'),
+            # Давно архивированные рецепты для переноса в архивную таблицу (archive_cold_storage)
+            models.Index(fields=['archived_at'], condition=Q(archived=True), name='recipe_archived_at_idx'),
+        ]
 
     def __str__(self) -> str:
         return f'Recipe(№={self.pk}, name={self.name!r}, description={self.description!r})'
 
-    # Метод для расчета среднего рейтинга
+    # Средний рейтинг берется из сохраненного агрегата, без запроса к таблице оценок
     def average_rating(self):
-        from django.db.models import Avg
-        return self.ratings.aggregate(Avg('value'))['value__avg'] or 0
+        return self.rate if self.rating_count else 0
 
     def get_categories_display(self):
         return ", ".join([category.name for category in self.categories.all()])
@@ -81,6 +179,12 @@ class Comment(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='comments')
 
+    class Meta:
+        indexes = [
+            # Комментарии рецепта в порядке добавления
+            models.Index(fields=['recipe', 'created_at', 'id'], name='comment_recipe_created_idx'),
+        ]
+
     def __str__(self):
         return f'Comment by {self.user.username} on {self.recipe.name}'
 
@@ -92,6 +196,103 @@ class Rating(models.Model):
 
     class Meta:
         unique_together = ('user', 'recipe')  # Один пользователь может оставить только одну оценку на рецепт
+        indexes = [
+            # Пересчет агрегатов читает оценки рецепта только из индекса
+            models.Index(fields=['recipe', 'value'], name='rating_recipe_value_idx'),
+        ]
 
     def __str__(self):
         return f'Rating {self.value} by {self.user.username} on {self.recipe.name}'
+
+
+class RecipeNeighbor(models.Model):
+    """
+    Похожий рецепт (см. recipeapp.recommendations): первые соседи каждого рецепта.
+    """
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='neighbors')
+    neighbor = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    similarity = models.FloatField()
+    shared_ingredients = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'neighbor'], name='unique_recipe_neighbor'),
+        ]
+        indexes = [
+            # Соседи рецепта в порядке убывания оценки: страница рецепта читает только начало индекса
+            models.Index(fields=['recipe', '-score'], name='neighbor_recipe_score_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.neighbor_id} похож на {self.recipe_id} ({self.score:.3f})'
+
+
+class RecipeArchive(models.Model):
+    """
+    Рецепт, перенесенный из основной таблицы командой archive_cold_storage.
+    data - запись в формате recipeapp.export (ее принимает import_recipes) с комментариями.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    name = models.CharField(max_length=200)
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    archived_at = models.DateTimeField(null=True)
+    moved_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'RecipeArchive(№={self.pk}, name={self.name!r})'
+
+
+class IngredientArchive(models.Model):
+    """
+    Ингредиент, перенесенный из основной таблицы командой archive_cold_storage.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    name = models.CharField(max_length=200)
+    description = models.TextField(blank=True)
+    measure = models.CharField(max_length=15, blank=True, null=True)
+    archived_at = models.DateTimeField(null=True)
+    moved_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'IngredientArchive(№={self.pk}, name={self.name!r})'
+
+
+class Task(models.Model):
+    """
+    Фоновая задача в очереди recipeapp.tasks, которую выполняет команда run_worker.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    class Meta:
+        verbose_name = 'Задача'
+        verbose_name_plural = 'Задачи'
+        indexes = [
+            # Выборка следующих задач воркером (status='pending' по времени запуска) и поиск зависших.
+            # Частичный индекс не подходит: значение status передается в запрос параметром
+            models.Index(fields=['status', 'run_at', 'id'], name='task_status_run_idx'),
+        ]
+
+    name = models.CharField(max_length=200, verbose_name="Задача")
+    payload = models.JSONField(default=dict, verbose_name="Аргументы")
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING, verbose_name="Состояние")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Попытки")
+    max_attempts = models.PositiveIntegerField(default=3, verbose_name="Максимум попыток")
+    run_at = models.DateTimeField(verbose_name="Запуск не раньше")
+    locked_by = models.CharField(max_length=64, blank=True, verbose_name="Воркер")
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name="Захвачена")
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создана")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершена")
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
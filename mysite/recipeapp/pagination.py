@@ -0,0 +1,244 @@
+"""
+Keyset (cursor) пагинация.
+
+Вместо OFFSET и COUNT следующая страница выбирается условием «после
+последней записи» по ключу сортировки, поэтому глубокие страницы стоят
+столько же, сколько первая. Курсор — непрозрачная строка с направлением
+и значениями ключа граничной записи.
+"""
+import base64
+import datetime
+import hashlib
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, FieldError, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder обрезает время до миллисекунд, а для сравнения по ключу нужна полная точность
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _split(field):
+    return (field[1:], True) if field.startswith('-') else (field, False)
+
+
+def _model_field(queryset, name):
+    """
+    Поле модели или аннотации выборки, по которому идет сортировка; None, если его не найти.
+    """
+    if name in queryset.query.annotations:
+        try:
+            return queryset.query.annotations[name].output_field
+        except FieldError:
+            return None
+    try:
+        return queryset.model._meta.pk if name == 'pk' else queryset.model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+
+def _resolve(obj, name):
+    if name == 'pk':
+        return obj.pk
+    if isinstance(obj, dict):
+        return obj[name]
+    return getattr(obj, name)
+
+
+class KeysetPage:
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<KeysetPage ({len(self.object_list)} objects)>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return None
+        return self.paginator.encode_cursor(self.object_list[-1], NEXT)
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return None
+        return self.paginator.encode_cursor(self.object_list[0], PREVIOUS)
+
+
+class KeysetPaginator:
+    """
+    ordering — поля сортировки, последним должно идти уникальное поле (обычно 'id' или '-id').
+    """
+
+    def __init__(self, ordering, per_page):
+        self.ordering = tuple(ordering)
+        self.per_page = int(per_page)
+        self.fields = [_split(field) for field in self.ordering]
+
+    def encode_cursor(self, obj, direction):
+        values = [_resolve(obj, name) for name, _ in self.fields]
+        payload = json.dumps([direction, values], cls=CursorEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor, queryset=None):
+        """
+        Возвращает направление и значения ключа. С выборкой значения приводятся к типам полей сортировки,
+        чтобы подделанный курсор давал InvalidCursor, а не ошибку в запросе.
+        """
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        except (ValueError, TypeError, UnicodeDecodeError):
+            raise InvalidCursor(cursor)
+        if direction not in (NEXT, PREVIOUS) or not isinstance(values, list) or len(values) != len(self.fields):
+            raise InvalidCursor(cursor)
+        if queryset is not None:
+            try:
+                values = [self._to_python(queryset, name, value) for (name, _), value in zip(self.fields, values)]
+            except (ValidationError, TypeError, ValueError):
+                raise InvalidCursor(cursor)
+        return direction, values
+
+    def _to_python(self, queryset, name, value):
+        field = _model_field(queryset, name)
+        return value if field is None else field.to_python(value)
+
+    def _after(self, values, reverse):
+        """
+        Условие «строго после» записи с ключом values в порядке сортировки (или до нее при reverse).
+        """
+        condition = Q()
+        for position, (name, descending) in enumerate(self.fields):
+            lookup = 'lt' if descending != reverse else 'gt'
+            branch = Q(**{f'{name}__{lookup}': values[position]})
+            for previous in range(position):
+                branch &= Q(**{self.fields[previous][0]: values[previous]})
+            condition |= branch
+        # Одна цепочка OR не дает SQLite начать чтение индекса с позиции курсора, и каждая
+        # страница читала индекс с начала. Граница по первому полю превращает SCAN в SEARCH
+        if len(self.fields) > 1:
+            first, descending = self.fields[0]
+            bound = 'lte' if descending != reverse else 'gte'
+            condition &= Q(**{f'{first}__{bound}': values[0]})
+        return condition
+
+    def prepare(self, queryset, cursor=None):
+        """
+        Возвращает выборку на per_page + 1 записей, направление движения и признак наличия курсора.
+        """
+        direction, values = NEXT, None
+        if cursor:
+            try:
+                direction, values = self.decode_cursor(cursor, queryset)
+            except InvalidCursor:
+                direction, values = NEXT, None
+
+        reverse = direction == PREVIOUS
+        if values is not None:
+            queryset = queryset.filter(self._after(values, reverse))
+        ordering = self.ordering
+        if reverse:
+            ordering = [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+        return queryset.order_by(*ordering)[:self.per_page + 1], direction, values is not None
+
+    def build_page(self, rows, direction, has_cursor):
+        rows = list(rows)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == PREVIOUS:
+            rows.reverse()
+            return KeysetPage(rows, self, has_next=True, has_previous=has_more)
+        return KeysetPage(rows, self, has_next=has_more, has_previous=has_cursor)
+
+    def paginate(self, queryset, cursor=None):
+        return self.build_page(*self.prepare(queryset, cursor))
+
+
+class KeysetPaginationMixin:
+    """
+    Миксин для ListView: заменяет постраничную навигацию по номеру страницы на курсорную.
+    """
+    keyset_ordering = ('-created_at', '-id')
+    cursor_param = 'cursor'
+
+    def get_keyset_ordering(self, queryset):
+        return self.keyset_ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(self.get_keyset_ordering(queryset), page_size)
+        page = paginator.paginate(queryset, self.request.GET.get(self.cursor_param))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    async def apaginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(self.get_keyset_ordering(queryset), page_size)
+        queryset, direction, has_cursor = paginator.prepare(queryset, self.request.GET.get(self.cursor_param))
+        page = paginator.build_page([obj async for obj in queryset], direction, has_cursor)
+        return paginator, page, page.object_list, page.has_other_pages()
+
+
+def _count_key(queryset):
+    sql, params = queryset.order_by().query.sql_with_params()
+    return 'count:' + hashlib.md5(f'{queryset.db}:{sql}:{params!r}'.encode()).hexdigest()
+
+
+def approximate_count(queryset, timeout=300):
+    """
+    Количество записей выборки, закешированное на timeout секунд.
+    Значение может отставать от действительного, зато COUNT не выполняется на каждый запрос.
+    """
+    if queryset.query.is_empty():
+        return 0
+    key = _count_key(queryset)
+    total = cache.get(key)
+    if total is None:
+        total = queryset.count()
+        cache.set(key, total, timeout)
+    return total
+
+
+async def aapproximate_count(queryset, timeout=300):
+    if queryset.query.is_empty():
+        return 0
+    # Компиляция SQL может обращаться к подключению, поэтому выполняется синхронно
+    key = await sync_to_async(_count_key)(queryset)
+    total = await cache.aget(key)
+    if total is None:
+        total = await queryset.acount()
+        await cache.aset(key, total, timeout)
+    return total
@@ -0,0 +1,192 @@
+"""
+Поиск рецептов по имеющимся ингредиентам («что приготовить»).
+
+Каждый процесс держит в памяти инвертированный индекс: для ингредиента —
+отсортированный массив рецептов, в которых он встречается, для рецепта —
+массив его ингредиентов. Число имеющихся ингредиентов каждого рецепта
+считается проходом по массивам выбранных ингредиентов, без GROUP BY по
+recipe_ingredients, а рецепты ранжируются по доле покрытых ингредиентов.
+
+Индекс строится при первом запросе. Изменения ингредиентов рецептов
+записываются в кеш: версия группы PANTRY увеличивается, а под ключом
+новой версии сохраняются измененные рецепты. Перед запросом процесс
+сравнивает свою версию с текущей и перечитывает из базы только
+измененные рецепты; если записи о части изменений уже вытеснены из кеша
+или изменение массовое (импорт, архивация), индекс строится заново.
+"""
+import heapq
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict, namedtuple
+
+from django.core.cache import cache
+from django.db import transaction
+
+from recipeapp import cache as recipe_cache
+from recipeapp.models import Ingredient, Recipe, RecipeIngredient
+
+# Сколько версий изменений можно применить по одной, прежде чем перестроить индекс целиком
+MAX_REPLAY = 100
+
+PantryMatch = namedtuple('PantryMatch', 'recipe_id covered total missing')
+
+_pending = threading.local()
+
+
+def _changes_key(version):
+    return f'pantry:changes:{version}'
+
+
+class PantryIndex:
+    def __init__(self):
+        self.version = None
+        self.lock = threading.Lock()
+        self.recipes = {}
+        self.postings = {}
+
+    def build(self):
+        recipes = defaultdict(list)
+        for recipe_id, ingredient_id in (RecipeIngredient.objects.filter(recipe__archived=False)
+                                         .order_by('recipe_id').values_list('recipe_id', 'ingredient_id')
+                                         .iterator(chunk_size=10000)):
+            recipes[recipe_id].append(ingredient_id)
+
+        postings = defaultdict(list)
+        for recipe_id, ingredients in recipes.items():
+            for ingredient_id in ingredients:
+                postings[ingredient_id].append(recipe_id)
+
+        self.recipes = {recipe_id: array('q', sorted(set(ids))) for recipe_id, ids in recipes.items()}
+        self.postings = {ingredient_id: array('q', ids) for ingredient_id, ids in postings.items()}
+
+    def update(self, recipe_ids):
+        """
+        Перечитывает из базы ингредиенты указанных рецептов.
+        """
+        fresh = defaultdict(set)
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe__in=recipe_ids, recipe__archived=False
+        ).values_list('recipe_id', 'ingredient_id'):
+            fresh[recipe_id].add(ingredient_id)
+
+        for recipe_id in recipe_ids:
+            old = set(self.recipes.pop(recipe_id, ()))
+            new = fresh.get(recipe_id, set())
+            for ingredient_id in old - new:
+                posting = self.postings[ingredient_id]
+                del posting[bisect_left(posting, recipe_id)]
+            for ingredient_id in new - old:
+                insort(self.postings.setdefault(ingredient_id, array('q')), recipe_id)
+            if new:
+                self.recipes[recipe_id] = array('q', sorted(new))
+
+    def sync(self, version):
+        """
+        Приводит индекс к версии version, применяя записанные изменения или строя его заново.
+        """
+        if self.version is not None and 0 < version - self.version <= MAX_REPLAY:
+            keys = [_changes_key(number) for number in range(self.version + 1, version + 1)]
+            changes = cache.get_many(keys)
+            if len(changes) == len(keys) and all(ids is not None for ids in changes.values()):
+                self.update(sorted({recipe_id for ids in changes.values() for recipe_id in ids}))
+                self.version = version
+                return
+        self.build()
+        self.version = version
+
+    def find(self, pantry, exclude=(), min_coverage=0.5, limit=20):
+        """
+        Рецепты, не меньше min_coverage ингредиентов которых есть в pantry, и без ингредиентов exclude.
+        Порядок: доля покрытия, число недостающих ингредиентов, новизна рецепта.
+        """
+        pantry = set(pantry)
+        with self.lock:
+            counts = Counter()
+            for ingredient_id in pantry:
+                counts.update(self.postings.get(ingredient_id, ()))
+
+            excluded = set()
+            for ingredient_id in exclude:
+                excluded.update(self.postings.get(ingredient_id, ()))
+
+            candidates = []
+            for recipe_id, covered in counts.items():
+                total = len(self.recipes[recipe_id])
+                if covered >= min_coverage * total and recipe_id not in excluded:
+                    candidates.append((-covered / total, total - covered, -recipe_id, covered, total))
+
+            return [
+                PantryMatch(-negative_id, covered, total,
+                            [ingredient_id for ingredient_id in self.recipes[-negative_id]
+                             if ingredient_id not in pantry])
+                for _, _, negative_id, covered, total in heapq.nsmallest(limit, candidates)
+            ]
+
+
+_index = PantryIndex()
+_sync_lock = threading.Lock()
+
+
+def get_index():
+    """
+    Индекс процесса, синхронизированный с текущей версией изменений.
+    """
+    version, = recipe_cache.get_versions(recipe_cache.PANTRY)
+    if _index.version != version:
+        with _sync_lock:
+            if _index.version != version:
+                with _index.lock:
+                    _index.sync(version)
+    return _index
+
+
+def find_recipes(pantry, exclude=(), min_coverage=0.5, limit=20):
+    return get_index().find(pantry, exclude, min_coverage, limit)
+
+
+def describe(matches):
+    """
+    Названия рецептов и недостающих ингредиентов для результатов поиска: два запроса.
+    """
+    recipes = Recipe.active.in_bulk([match.recipe_id for match in matches])
+    missing_ids = {ingredient_id for match in matches for ingredient_id in match.missing}
+    names = dict(Ingredient.objects.filter(pk__in=missing_ids).values_list('pk', 'name'))
+    return [
+        {
+            'recipe': recipes[match.recipe_id],
+            'coverage': round(match.covered / match.total, 2),
+            'covered': match.covered,
+            'total': match.total,
+            'missing': [names[ingredient_id] for ingredient_id in match.missing if ingredient_id in names],
+        }
+        for match in matches if match.recipe_id in recipes
+    ]
+
+
+def record_changes(recipe_ids=None):
+    """
+    Сообщает индексам всех процессов об изменении ингредиентов рецептов. Без recipe_ids
+    (массовые изменения) индексы перестраиваются целиком.
+    """
+    version, = recipe_cache.bump(recipe_cache.PANTRY)
+    if recipe_ids is not None:
+        cache.set(_changes_key(version), sorted(recipe_ids), recipe_cache.cache_timeout())
+
+
+def schedule_update(recipe_ids):
+    """
+    Откладывает запись изменений до фиксации транзакции: все рецепты транзакции — одной версией.
+    """
+    pending = getattr(_pending, 'ids', None)
+    if pending is None:
+        pending = _pending.ids = set()
+    pending.update(recipe_ids)
+    transaction.on_commit(_flush_pending)
+
+
+def _flush_pending():
+    ids = getattr(_pending, 'ids', None)
+    if ids:
+        _pending.ids = set()
+        record_changes(ids)
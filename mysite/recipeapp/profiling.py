@@ -0,0 +1,250 @@
+"""
+Профилирование запросов: время ответа, рендеринга шаблонов и SQL.
+
+ProfilingMiddleware включается настройкой RECIPE_PROFILING. Для каждого
+запроса она считает общее время, время рендеринга шаблонов, число
+и время SQL-запросов и повторяющиеся запросы (признак N+1), добавляет их
+в заголовок Server-Timing и накапливает агрегаты по имени URL
+(например, recipeapp:recipe_detail). Агрегаты хранятся в памяти процесса
+и отдаются представлением profiling_metrics в JSON или в текстовом
+формате Prometheus.
+
+Время рендеринга учитывает шаблонный бэкенд ProfilingDjangoTemplates:
+он замеряет только запросы, для которых включено профилирование.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+# Профиль текущего запроса, пока его обрабатывает ProfilingMiddleware
+_current_profile = ContextVar('recipeapp_profile', default=None)
+
+# Сколько самых частых повторяющихся запросов хранить для каждого URL
+TOP_DUPLICATES = 5
+
+
+def profiling_enabled():
+    return getattr(settings, 'RECIPE_PROFILING', False)
+
+
+def duplicate_threshold():
+    """
+    Запрос, выполненный за один HTTP-запрос больше этого числа раз, считается признаком N+1.
+    """
+    return getattr(settings, 'RECIPE_PROFILING_DUPLICATE_THRESHOLD', 3)
+
+
+class QueryRecorder:
+    """
+    Обертка выполнения SQL (connection.execute_wrapper): считает запросы и их время.
+    Запросы группируются по тексту SQL без параметров.
+    """
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1
+
+    def duplicates(self):
+        return {sql: count for sql, count in self.statements.items() if count > 1}
+
+
+class RequestProfile:
+    def __init__(self):
+        self.queries = QueryRecorder()
+        self.template = 0.0
+        self.template_depth = 0
+
+
+class ProfiledTemplate(Template):
+    def render(self, context=None, request=None):
+        profile = _current_profile.get()
+        # Вложенный рендеринг (render_to_string внутри шаблона) уже входит во время внешнего
+        if profile is None or profile.template_depth:
+            return super().render(context, request)
+        profile.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            profile.template += time.perf_counter() - started
+            profile.template_depth -= 1
+
+
+class ProfilingDjangoTemplates(DjangoTemplates):
+    """
+    Шаблонный бэкенд Django, замеряющий время рендеринга для ProfilingMiddleware.
+    """
+    def from_string(self, template_code):
+        return ProfiledTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return ProfiledTemplate(super().get_template(template_name).template, self)
+
+
+class MetricsRegistry:
+    """
+    Агрегаты метрик по именам URL. Общий для всех потоков процесса.
+    """
+    FIELDS = ('total', 'template', 'sql')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view_name, total, template, sql_time, sql_count, duplicates):
+        with self._lock:
+            stats = self._views.get(view_name)
+            if stats is None:
+                stats = self._views[view_name] = {
+                    'requests': 0,
+                    'sql_queries': 0,
+                    'duplicate_queries': 0,
+                    'seconds': {field: 0.0 for field in self.FIELDS},
+                    'max_seconds': {field: 0.0 for field in self.FIELDS},
+                    'duplicates': Counter(),
+                }
+            stats['requests'] += 1
+            stats['sql_queries'] += sql_count
+            stats['duplicate_queries'] += sum(count - 1 for count in duplicates.values())
+            for field, value in zip(self.FIELDS, (total, template, sql_time)):
+                stats['seconds'][field] += value
+                stats['max_seconds'][field] = max(stats['max_seconds'][field], value)
+            stats['duplicates'].update(duplicates)
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for view_name, stats in sorted(self._views.items()):
+                requests = stats['requests']
+                result[view_name] = {
+                    'requests': requests,
+                    'sql_queries': stats['sql_queries'],
+                    'sql_queries_avg': round(stats['sql_queries'] / requests, 2),
+                    'duplicate_queries': stats['duplicate_queries'],
+                    'seconds': {field: round(value, 6) for field, value in stats['seconds'].items()},
+                    'avg_ms': {field: round(value / requests * 1000, 2) for field, value in stats['seconds'].items()},
+                    'max_ms': {field: round(value * 1000, 2) for field, value in stats['max_seconds'].items()},
+                    'top_duplicates': [
+                        {'sql': sql, 'count': count}
+                        for sql, count in stats['duplicates'].most_common(TOP_DUPLICATES)
+                    ],
+                }
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+registry = MetricsRegistry()
+
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def render_prometheus(snapshot):
+    """
+    Форматирует агрегаты в текстовом формате Prometheus.
+    """
+    lines = [
+        '# HELP recipeapp_requests_total Число обработанных запросов.',
+        '# TYPE recipeapp_requests_total counter',
+    ]
+    for view_name, stats in snapshot.items():
+        lines.append(f'recipeapp_requests_total{{view="{_escape_label(view_name)}"}} {stats["requests"]}')
+
+    lines += [
+        '# HELP recipeapp_request_seconds_total Суммарное время по фазам: total, template, sql.',
+        '# TYPE recipeapp_request_seconds_total counter',
+    ]
+    for view_name, stats in snapshot.items():
+        for phase, value in stats['seconds'].items():
+            lines.append(
+                f'recipeapp_request_seconds_total{{view="{_escape_label(view_name)}",phase="{phase}"}} {value}'
+            )
+
+    lines += [
+        '# HELP recipeapp_sql_queries_total Число выполненных SQL-запросов.',
+        '# TYPE recipeapp_sql_queries_total counter',
+    ]
+    for view_name, stats in snapshot.items():
+        lines.append(f'recipeapp_sql_queries_total{{view="{_escape_label(view_name)}"}} {stats["sql_queries"]}')
+
+    lines += [
+        '# HELP recipeapp_duplicate_sql_queries_total Повторные выполнения одинаковых SQL-запросов.',
+        '# TYPE recipeapp_duplicate_sql_queries_total counter',
+    ]
+    for view_name, stats in snapshot.items():
+        lines.append(
+            f'recipeapp_duplicate_sql_queries_total{{view="{_escape_label(view_name)}"}} {stats["duplicate_queries"]}'
+        )
+    return '\n'.join(lines) + '\n'
+
+
+class ProfilingMiddleware:
+    """
+    Замеряет запросы и добавляет заголовок Server-Timing. Ставится первой в MIDDLEWARE,
+    чтобы учитывать время всех остальных middleware.
+    """
+    def __init__(self, get_response):
+        if not profiling_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        token = _current_profile.set(profile)
+        started = time.perf_counter()
+        try:
+            with _wrap_connections(profile.queries):
+                response = self.get_response(request)
+        finally:
+            _current_profile.reset(token)
+        total = time.perf_counter() - started
+
+        queries = profile.queries
+        duplicates = queries.duplicates()
+        view_name = request.resolver_match.view_name if request.resolver_match else 'unresolved'
+        registry.record(view_name, total, profile.template, queries.duration, queries.count, duplicates)
+
+        response['Server-Timing'] = ', '.join([
+            f'total;dur={total * 1000:.1f}',
+            f'tpl;dur={profile.template * 1000:.1f}',
+            f'sql;dur={queries.duration * 1000:.1f};desc="{queries.count} queries"',
+        ])
+
+        threshold = duplicate_threshold()
+        for sql, count in duplicates.items():
+            if count > threshold:
+                logger.warning('Возможный N+1 в %s: запрос выполнен %s раз: %s', view_name, count, sql)
+        return response
+
+
+def _wrap_connections(recorder):
+    """
+    Устанавливает обертку выполнения SQL на все подключения к базам данных.
+    """
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(recorder))
+    return stack
@@ -0,0 +1,113 @@
+"""
+Ограничение частоты запросов на запись (token bucket).
+
+У каждого ключа - пользователя и IP-адреса - своя корзина на capacity
+жетонов, которая равномерно пополняется: capacity жетонов за period
+секунд. POST-запрос тратит по жетону из корзины пользователя и корзины
+адреса; если в какой-то из них жетонов нет, он получает ответ 429 с
+заголовком Retry-After и до базы данных не доходит.
+
+Лимиты задаются настройкой RECIPE_RATE_LIMITS: {область: (capacity, period)}.
+Корзины хранятся в памяти процесса (RECIPE_RATELIMIT_BACKEND = 'local')
+или в кеше Django ('cache'), который при бэкенде file или redis общий для
+всех процессов. Обновление корзины в кеше не атомарно: при одновременных
+запросах одного клиента лимит может быть превышен на несколько запросов.
+"""
+import math
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+# Больше этого числа корзин в памяти процесса - полностью пополненные удаляются
+MAX_LOCAL_BUCKETS = 10000
+
+
+def take_token(state, capacity, period, now):
+    """
+    Пополняет корзину к моменту now и берет из нее жетон.
+    Возвращает новое состояние (жетоны, время) и сколько секунд ждать, если жетона нет (иначе 0).
+    """
+    tokens, updated = state if state is not None else (capacity, now)
+    tokens = min(capacity, tokens + (now - updated) * capacity / period)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) * period / capacity
+
+
+class LocalBucketStore:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def consume(self, key, capacity, period):
+        now = time.monotonic()
+        with self.lock:
+            if len(self.buckets) > MAX_LOCAL_BUCKETS:
+                self.buckets = {
+                    bucket_key: (tokens, updated) for bucket_key, (tokens, updated) in self.buckets.items()
+                    if now - updated < period
+                }
+            self.buckets[key], wait = take_token(self.buckets.get(key), capacity, period, now)
+        return wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class CacheBucketStore:
+    def consume(self, key, capacity, period):
+        cache_key = f'ratelimit:{key}'
+        state, wait = take_token(cache.get(cache_key), capacity, period, time.time())
+        # Через period секунд корзина заполнится, и хранить ее не нужно
+        cache.set(cache_key, state, math.ceil(period))
+        return wait
+
+
+_stores = {'local': LocalBucketStore(), 'cache': CacheBucketStore()}
+
+
+def get_store():
+    return _stores[getattr(settings, 'RECIPE_RATELIMIT_BACKEND', 'cache')]
+
+
+def client_keys(request):
+    keys = [f'ip:{request.META.get("REMOTE_ADDR", "")}']
+    if request.user.is_authenticated:
+        keys.append(f'user:{request.user.pk}')
+    return keys
+
+
+def check_rate(request, scope):
+    """
+    Тратит жетоны запроса в области scope. Возвращает, сколько секунд клиенту ждать (0 - запрос разрешен).
+    """
+    limit = getattr(settings, 'RECIPE_RATE_LIMITS', {}).get(scope)
+    if limit is None:
+        return 0
+    capacity, period = limit
+    store = get_store()
+    return max(store.consume(f'{scope}:{key}', capacity, period) for key in client_keys(request))
+
+
+def ratelimit(scope):
+    """
+    Декоратор представления: ограничивает частоту POST-запросов лимитом области scope.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method == 'POST':
+                wait = check_rate(request, scope)
+                if wait:
+                    response = HttpResponse('Слишком много запросов, попробуйте позже.', status=429,
+                                            content_type='text/plain; charset=utf-8')
+                    response['Retry-After'] = str(math.ceil(wait))
+                    return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
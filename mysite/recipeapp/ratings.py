@@ -0,0 +1,202 @@
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.db.models import Count, DecimalField, F, FloatField, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Round
+from django.db.models.expressions import Case, When
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
+
+from recipeapp import cache as recipe_cache
+from recipeapp.models import Rating, Recipe
+
+logger = logging.getLogger(__name__)
+
+# Допустимые оценки, как в форме на странице рецепта
+MIN_RATING = 0
+MAX_RATING = 10
+
+
+def parse_rating(value):
+    """
+    Оценка из данных формы. Не целое число или значение вне MIN_RATING..MAX_RATING - ValueError.
+    """
+    try:
+        rating = int(value)
+    except (TypeError, ValueError):
+        rating = None
+    if rating is None or not MIN_RATING <= rating <= MAX_RATING:
+        raise ValueError(f'Оценка должна быть целым числом от {MIN_RATING} до {MAX_RATING}')
+    return rating
+
+
+def _average(count, total):
+    """
+    Выражение для среднего значения: total / count, либо 0, если оценок нет.
+    """
+    # Приведение к DECIMAL в SQLite оставляет целое число, и деление было бы целочисленным
+    return Case(
+        When(GreaterThan(count, 0), then=Round(Cast(total, FloatField()) / count, 2)),
+        default=Value(0),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def apply_rating_delta(recipe_id, count_delta, sum_delta):
+    """
+    Атомарно изменяет агрегаты рейтинга рецепта одним UPDATE через F-выражения.
+    """
+    new_count = F('rating_count') + count_delta
+    new_sum = F('rating_sum') + sum_delta
+    Recipe.objects.filter(pk=recipe_id).update(
+        rating_count=new_count,
+        rating_sum=new_sum,
+        rate=_average(new_count, new_sum),
+        updated_at=timezone.now(),
+    )
+
+
+def set_rating(recipe_id, user, value):
+    """
+    Сохраняет оценку пользователя и в той же транзакции обновляет агрегаты рецепта.
+    """
+    with transaction.atomic():
+        previous = (
+            Rating.objects.select_for_update()
+            .filter(recipe_id=recipe_id, user=user)
+            .values_list('value', flat=True)
+            .first()
+        )
+        Rating.objects.update_or_create(
+            recipe_id=recipe_id,
+            user=user,
+            defaults={'value': value}
+        )
+        if previous is None:
+            apply_rating_delta(recipe_id, 1, value)
+        elif previous != value:
+            apply_rating_delta(recipe_id, 0, value - previous)
+
+
+def rebuild_rating_aggregates(queryset=None):
+    """
+    Пересчитывает агрегаты рейтинга с нуля по таблице оценок. Возвращает число обновленных рецептов.
+    """
+    if queryset is None:
+        queryset = Recipe.objects.all()
+
+    ratings = Rating.objects.filter(recipe=OuterRef('pk')).order_by().values('recipe')
+    count = Coalesce(Subquery(ratings.annotate(c=Count('pk')).values('c')), 0, output_field=IntegerField())
+    total = Coalesce(Subquery(ratings.annotate(s=Sum('value')).values('s')), 0, output_field=IntegerField())
+
+    with transaction.atomic():
+        updated = queryset.update(rating_count=count, rating_sum=total, updated_at=timezone.now())
+        queryset.update(rate=_average(F('rating_count'), F('rating_sum')))
+    return updated
+
+
+def write_ratings(ratings):
+    """
+    Сохраняет пакет оценок {(recipe_id, user_id): value} одной транзакцией: один запрос
+    на чтение прежних оценок, один INSERT ... ON CONFLICT и по UPDATE агрегатов на рецепт.
+    Оценки удаленных за это время рецептов и пользователей отбрасываются.
+    """
+    recipe_ids = {recipe_id for recipe_id, _ in ratings}
+    user_ids = {user_id for _, user_id in ratings}
+    with transaction.atomic():
+        existing_recipes = set(Recipe.objects.filter(pk__in=recipe_ids).values_list('pk', flat=True))
+        existing_users = set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+        ratings = {
+            (recipe_id, user_id): value for (recipe_id, user_id), value in ratings.items()
+            if recipe_id in existing_recipes and user_id in existing_users
+        }
+        previous = {
+            (recipe_id, user_id): value
+            for recipe_id, user_id, value in Rating.objects.filter(
+                recipe_id__in=existing_recipes, user_id__in=existing_users
+            ).values_list('recipe_id', 'user_id', 'value')
+        }
+        Rating.objects.bulk_create(
+            [Rating(recipe_id=recipe_id, user_id=user_id, value=value)
+             for (recipe_id, user_id), value in ratings.items()],
+            update_conflicts=True, unique_fields=['user', 'recipe'], update_fields=['value'],
+        )
+
+        deltas = defaultdict(lambda: [0, 0])
+        for key, value in ratings.items():
+            old = previous.get(key)
+            deltas[key[0]][0] += old is None
+            deltas[key[0]][1] += value - (old or 0)
+        for recipe_id, (count_delta, sum_delta) in deltas.items():
+            if count_delta or sum_delta:
+                apply_rating_delta(recipe_id, count_delta, sum_delta)
+
+        # bulk_create не отправляет сигналы, кеш страниц рецептов сбрасывается явно
+        changed = list(deltas)
+        transaction.on_commit(lambda: recipe_cache.invalidate_recipes(changed))
+    return len(ratings)
+
+
+def coalesce_window():
+    return getattr(settings, 'RECIPE_RATING_COALESCE_SECONDS', 0)
+
+
+class RatingBuffer:
+    """
+    Оценки, ожидающие записи. Первая оценка в пустом буфере запускает таймер на window
+    секунд, по которому весь буфер записывается одной транзакцией (write_ratings).
+    Повторная оценка того же пользователя до записи заменяет предыдущую.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.timer = None
+
+    def add(self, recipe_id, user_id, value, window):
+        with self.lock:
+            self.pending[(recipe_id, user_id)] = value
+            if self.timer is None:
+                self.timer = threading.Timer(window, self._flush_in_background)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        if pending:
+            write_ratings(pending)
+        return len(pending)
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Не удалось записать накопленные оценки')
+        finally:
+            # Подключения потока таймера больше не понадобятся
+            connections.close_all()
+
+
+rating_buffer = RatingBuffer()
+# Оценки, накопленные к остановке процесса, записываются перед выходом
+atexit.register(rating_buffer.flush)
+
+
+def submit_rating(recipe_id, user, value):
+    """
+    Сохраняет оценку сразу (set_rating) или, если задан RECIPE_RATING_COALESCE_SECONDS,
+    откладывает ее до пакетной записи.
+    """
+    window = coalesce_window()
+    if window:
+        rating_buffer.add(recipe_id, user.pk, value, window)
+    else:
+        set_rating(recipe_id, user, value)
@@ -0,0 +1,261 @@
+"""
+Похожие рецепты по совпадению ингредиентов и рейтингу.
+
+Рецепт представлен разреженным вектором — отсортированным массивом
+идентификаторов ингредиентов, а для каждого ингредиента хранится массив
+рецептов, в которых он встречается (транспонированная матрица). Число
+общих ингредиентов рецепта со всеми остальными считается проходом по
+этим массивам, без перебора всех пар рецептов, а сходство — мерой
+Жаккара. Порядок соседей учитывает и рейтинг соседа (RATING_WEIGHT).
+
+Первые TOP_K соседей каждого рецепта хранятся в таблице RecipeNeighbor,
+поэтому страница рецепта получает их одним запросом по индексу. После
+изменения ингредиентов рецепта фоновая задача пересчитывает его соседей
+и обновляет списки тех рецептов, с которыми он пересекается. Удаленный
+из чужого списка рецепт не заменяется следующим кандидатом до полного
+пересчета командой rebuild_recommendations; ее же нужно запускать после
+массового импорта, который не отправляет сигналов.
+
+Частые ингредиенты (соль, вода) не считаются совпадением: они связывают
+почти все рецепты и делают расчет квадратичным. В размер набора
+ингредиентов рецепта они при этом входят.
+"""
+import heapq
+import threading
+from array import array
+from collections import Counter, defaultdict
+from operator import itemgetter
+
+from django.db import transaction
+from django.db.models import Count
+
+from recipeapp import cache as recipe_cache
+from recipeapp.models import Recipe, RecipeIngredient, RecipeNeighbor
+from recipeapp.tasks import task
+
+TOP_K = 10
+
+# Доля рейтинга в порядке соседей: score = similarity * (1 - RATING_WEIGHT + RATING_WEIGHT * rate / 10)
+RATING_WEIGHT = 0.2
+MAX_RATE = 10
+
+# Ингредиент считается частым, если встречается больше чем в COMMON_SHARE рецептов (но не меньше COMMON_MIN)
+COMMON_SHARE = 0.1
+COMMON_MIN = 100
+
+BATCH_SIZE = 1000
+
+_pending = threading.local()
+
+
+def common_threshold(recipe_count):
+    return max(COMMON_MIN, int(recipe_count * COMMON_SHARE))
+
+
+def rating_factors(rates):
+    """
+    Множители оценки по рейтингу соседа из пар (recipe_id, rate): {recipe_id: множитель}.
+    """
+    return {
+        recipe_id: 1 - RATING_WEIGHT + RATING_WEIGHT * float(rate or 0) / MAX_RATE
+        for recipe_id, rate in rates
+    }
+
+
+class IngredientMatrix:
+    """
+    Разреженная матрица «рецепт × ингредиент» в двух представлениях: по строкам и по столбцам.
+    """
+    def __init__(self, pairs, recipe_count=None):
+        recipes = defaultdict(list)
+        for recipe_id, ingredient_id in pairs:
+            recipes[recipe_id].append(ingredient_id)
+        self.sizes = {recipe_id: len(ingredients) for recipe_id, ingredients in recipes.items()}
+
+        postings = defaultdict(list)
+        for recipe_id in sorted(recipes):
+            for ingredient_id in recipes[recipe_id]:
+                postings[ingredient_id].append(recipe_id)
+
+        threshold = common_threshold(recipe_count or len(recipes))
+        self.common = {ingredient_id for ingredient_id, ids in postings.items() if len(ids) > threshold}
+        self.postings = {
+            ingredient_id: array('q', ids) for ingredient_id, ids in postings.items()
+            if ingredient_id not in self.common
+        }
+        self.recipes = {
+            recipe_id: array('q', sorted(set(ingredients) - self.common))
+            for recipe_id, ingredients in recipes.items()
+        }
+
+    @classmethod
+    def load(cls):
+        pairs = (RecipeIngredient.objects.filter(recipe__archived=False)
+                 .values_list('recipe_id', 'ingredient_id').iterator(chunk_size=10000))
+        return cls(pairs, Recipe.active.count())
+
+    def overlaps(self, recipe_id):
+        """
+        Число общих ингредиентов рецепта с каждым пересекающимся рецептом (строка произведения A·Aᵀ).
+        """
+        counts = Counter()
+        for ingredient_id in self.recipes.get(recipe_id, ()):
+            counts.update(self.postings[ingredient_id])
+        counts.pop(recipe_id, None)
+        return counts
+
+
+def top_neighbors(size, overlaps, sizes, factors, limit=TOP_K):
+    """
+    Первые limit соседей рецепта: [(score, similarity, shared, neighbor_id)].
+
+    Кандидаты перебираются по убыванию числа общих ингредиентов. Оценка не больше
+    shared / size, поэтому перебор останавливается, как только эта граница не превышает
+    худшую из уже найденных оценок.
+    """
+    heap = []
+    for neighbor_id, shared in sorted(overlaps.items(), key=itemgetter(1), reverse=True):
+        full = len(heap) == limit
+        if full and heap[0][0] >= shared / size:
+            break
+        similarity = shared / (size + sizes[neighbor_id] - shared)
+        value = similarity * factors[neighbor_id]
+        if not full:
+            heapq.heappush(heap, (value, similarity, shared, neighbor_id))
+        elif value > heap[0][0]:
+            heapq.heapreplace(heap, (value, similarity, shared, neighbor_id))
+    return sorted(heap, reverse=True)
+
+
+def _neighbor_rows(recipe_id, neighbors):
+    return [
+        RecipeNeighbor(recipe_id=recipe_id, neighbor_id=neighbor_id, score=value, similarity=similarity,
+                       shared_ingredients=shared)
+        for value, similarity, shared, neighbor_id in neighbors
+    ]
+
+
+def rebuild_neighbors(stdout=None):
+    """
+    Полностью пересчитывает таблицу соседей. Возвращает число рецептов с соседями.
+    """
+    matrix = IngredientMatrix.load()
+    factors = rating_factors(Recipe.active.values_list('pk', 'rate'))
+    recipe_ids = sorted(matrix.recipes)
+
+    with transaction.atomic():
+        RecipeNeighbor.objects.all().delete()
+        for start in range(0, len(recipe_ids), BATCH_SIZE):
+            rows = []
+            for recipe_id in recipe_ids[start:start + BATCH_SIZE]:
+                neighbors = top_neighbors(matrix.sizes[recipe_id], matrix.overlaps(recipe_id), matrix.sizes, factors)
+                rows += _neighbor_rows(recipe_id, neighbors)
+            RecipeNeighbor.objects.bulk_create(rows)
+            if stdout:
+                stdout.write(f'Обработано рецептов: {min(start + BATCH_SIZE, len(recipe_ids))}')
+        transaction.on_commit(lambda: recipe_cache.bump(recipe_cache.NEIGHBORS))
+    return len(recipe_ids)
+
+
+def refresh_recipe(recipe_id):
+    """
+    Пересчитывает соседей одного рецепта и обновляет его место в списках пересекающихся рецептов.
+    Возвращает идентификаторы рецептов, списки соседей которых изменились.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).values('archived', 'rate').first()
+    ingredient_ids = list(RecipeIngredient.objects.filter(recipe=recipe_id).values_list('ingredient_id', flat=True))
+
+    with transaction.atomic():
+        # Рецепты, в списках которых он был до пересчета
+        affected = {recipe_id, *RecipeNeighbor.objects.filter(neighbor=recipe_id).values_list('recipe_id', flat=True)}
+        if recipe is None or recipe['archived'] or not ingredient_ids:
+            RecipeNeighbor.objects.filter(recipe=recipe_id).delete()
+            RecipeNeighbor.objects.filter(neighbor=recipe_id).delete()
+            return affected
+
+        recipe_count = Recipe.active.count()
+        frequencies = (RecipeIngredient.objects.filter(ingredient__in=ingredient_ids, recipe__archived=False)
+                       .values('ingredient').annotate(n=Count('id')).values_list('ingredient', 'n'))
+        threshold = common_threshold(recipe_count)
+        matched = [ingredient_id for ingredient_id, n in frequencies if n <= threshold]
+
+        overlaps = Counter(
+            RecipeIngredient.objects.filter(ingredient__in=matched, recipe__archived=False)
+            .exclude(recipe=recipe_id).values_list('recipe_id', flat=True)
+        )
+        candidates = list(overlaps)
+        sizes = dict(RecipeIngredient.objects.filter(recipe__in=candidates).values('recipe')
+                     .annotate(n=Count('id')).values_list('recipe', 'n'))
+        factors = rating_factors(Recipe.objects.filter(pk__in=candidates).values_list('pk', 'rate'))
+        size = len(ingredient_ids)
+
+        RecipeNeighbor.objects.filter(recipe=recipe_id).delete()
+        RecipeNeighbor.objects.bulk_create(
+            _neighbor_rows(recipe_id, top_neighbors(size, overlaps, sizes, factors))
+        )
+
+        # Обратная сторона: рецепт входит в списки пересекающихся рецептов, если вытесняет последнего соседа
+        RecipeNeighbor.objects.filter(neighbor=recipe_id).delete()
+        existing = defaultdict(list)
+        for pk, owner_id, value in (RecipeNeighbor.objects.filter(recipe__in=candidates)
+                                    .values_list('pk', 'recipe_id', 'score')):
+            existing[owner_id].append((value, pk))
+
+        # Множитель рейтинга самого рецепта в списках соседей
+        factor = rating_factors([(recipe_id, recipe['rate'])])[recipe_id]
+        to_create, to_delete = [], []
+        for candidate_id, shared in overlaps.items():
+            similarity = shared / (size + sizes[candidate_id] - shared)
+            value = similarity * factor
+            current = existing[candidate_id]
+            if len(current) < TOP_K:
+                to_create.append((candidate_id, value, similarity, shared))
+            else:
+                lowest = min(current)
+                if value > lowest[0]:
+                    to_create.append((candidate_id, value, similarity, shared))
+                    to_delete.append(lowest[1])
+
+        RecipeNeighbor.objects.filter(pk__in=to_delete).delete()
+        RecipeNeighbor.objects.bulk_create([
+            RecipeNeighbor(recipe_id=candidate_id, neighbor_id=recipe_id, score=value, similarity=similarity,
+                           shared_ingredients=shared)
+            for candidate_id, value, similarity, shared in to_create
+        ])
+    return affected | {candidate_id for candidate_id, *_ in to_create}
+
+
+@task
+def refresh_neighbors(recipe_ids):
+    affected = set()
+    for recipe_id in recipe_ids:
+        affected |= refresh_recipe(recipe_id)
+    # Страницы рецептов, у которых изменились похожие рецепты
+    recipe_cache.bump(*[recipe_cache.recipe_namespace(recipe_id) for recipe_id in sorted(affected)])
+
+
+def schedule_refresh(recipe_ids):
+    """
+    Откладывает пересчет соседей до фиксации транзакции: все рецепты транзакции — одной задачей.
+    """
+    pending = getattr(_pending, 'ids', None)
+    if pending is None:
+        pending = _pending.ids = set()
+    pending.update(recipe_ids)
+    transaction.on_commit(_flush_pending)
+
+
+def _flush_pending():
+    ids = getattr(_pending, 'ids', None)
+    if ids:
+        _pending.ids = set()
+        refresh_neighbors.delay(sorted(ids))
+
+
+def similar_recipes(recipe_id, limit=TOP_K):
+    """
+    Похожие рецепты одним запросом по индексу (recipe, score). Запрос ленивый: при попадании
+    в кеш фрагмента страницы он не выполняется.
+    """
+    return (RecipeNeighbor.objects.filter(recipe=recipe_id, neighbor__archived=False)
+            .select_related('neighbor').order_by('-score')[:limit])
@@ -0,0 +1,124 @@
+"""
+Чтение с реплик базы данных.
+
+Реплики перечисляются в настройке RECIPE_DB_REPLICAS (псевдонимы из
+DATABASES). ReplicaMiddleware выбирает для GET- и HEAD-запроса одну
+реплику, и ReplicaRouter направляет на нее чтение моделей recipeapp.
+Запись, небезопасные методы (добавление комментария, оценка, создание
+и изменение рецептов), чтение внутри транзакции, фоновые задачи
+и команды работают с основной базой.
+
+Чтение своих записей: первая запись в базу закрепляет остаток запроса
+за основной базой, а ответ на такой запрос ставит cookie, с которой
+следующие запросы того же браузера RECIPE_DB_REPLICA_LAG секунд читают
+из основной базы. В то же окно после любого изменения данных
+(recipeapp.cache.bump) основная база используется для всех запросов:
+иначе страница, собранная по отставшей реплике, попала бы в кеш под
+уже новой версией.
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from recipeapp import cache as recipe_cache
+
+# Приложения, модели которых читаются с реплик. Сессии и пользователи всегда читаются из основной базы
+REPLICA_APPS = {'recipeapp'}
+
+STICKY_COOKIE = 'recipe_db_primary'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RoutingState:
+    """
+    Выбор базы для текущего запроса. Изменяемый объект, а не значение ContextVar:
+    асинхронные представления выполняют запросы в копии контекста (sync_to_async),
+    и запись оттуда должна быть видна middleware.
+    """
+    def __init__(self, replica=None):
+        self.replica = replica
+        self.wrote = False
+        # Транзакции, открытые до начала запроса (например, тестом), не влияют на выбор базы
+        self.atomic_depth = len(connections[DEFAULT_DB_ALIAS].atomic_blocks)
+
+
+_state = ContextVar('recipeapp_routing', default=None)
+
+
+def replicas():
+    return getattr(settings, 'RECIPE_DB_REPLICAS', [])
+
+
+def replica_lag():
+    return getattr(settings, 'RECIPE_DB_REPLICA_LAG', 5)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None or model._meta.app_label not in REPLICA_APPS:
+            return None
+        # Внутри транзакции чтение должно видеть ее же изменения
+        if len(connections[DEFAULT_DB_ALIAS].atomic_blocks) > state.atomic_depth:
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.replica = None
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии основной базы, объекты из них можно связывать между собой
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплик копируется вместе с данными (sync_replicas)
+        if db in replicas():
+            return False
+        return None
+
+
+def choose_replica(request):
+    """
+    Реплика для чтения в запросе или None, если запрос должен читать из основной базы.
+    """
+    available = replicas()
+    if not available or request.method not in SAFE_METHODS or STICKY_COOKIE in request.COOKIES:
+        return None
+    if time.time() - recipe_cache.last_change() < replica_lag():
+        return None
+    return random.choice(available)
+
+
+class ReplicaMiddleware:
+    """
+    Выбирает реплику для запроса и ставит cookie чтения из основной базы после записи.
+    Без настроенных реплик отключается.
+    """
+    def __init__(self, get_response):
+        if not replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RoutingState(choose_replica(request))
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote or request.method not in SAFE_METHODS:
+            response.set_cookie(STICKY_COOKIE, '1', max_age=replica_lag(), httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,296 @@
+"""
+Полнотекстовый поиск по рецептам.
+
+Для SQLite используется виртуальная таблица FTS5 с заранее застемленным
+текстом (см. recipeapp.stemmer), для PostgreSQL — таблица с tsvector и
+GIN-индексом на конфигурации 'russian'. Для остальных СУБД остается
+поиск по вхождению подстроки в название.
+
+Индекс опрашивается только среди рецептов выборки, к которой применяется
+поиск (категории, автор, архив и другие фильтры), поэтому ограничение
+RECIPE_SEARCH_MAX_RESULTS не отбрасывает подходящие под фильтры рецепты.
+"""
+import re
+import threading
+
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, When
+
+from recipeapp.stemmer import stem
+from recipeapp.tasks import task
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+FTS_TABLE = 'recipeapp_recipe_fts'
+PG_TABLE = 'recipeapp_recipe_search'
+
+INDEX_BATCH_SIZE = 500
+
+
+def tokenize(text):
+    return WORD_RE.findall((text or '').lower())
+
+
+def build_document(name, description, instructions, ingredient_names):
+    """
+    Собирает документ рецепта: название (поле с большим весом) и остальной текст.
+    """
+    body = ' '.join([description or '', instructions or '', *ingredient_names])
+    return name or '', body
+
+
+class BaseSearchBackend:
+    vendor = None
+
+    def create_schema(self, schema_connection):
+        pass
+
+    def drop_schema(self, schema_connection):
+        pass
+
+    def index(self, documents):
+        """
+        documents — список кортежей (recipe_id, name, body).
+        """
+        pass
+
+    def delete(self, recipe_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def filter(self, queryset, query):
+        return queryset.filter(name__icontains=query)
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    vendor = 'sqlite'
+
+    @staticmethod
+    def _stem_text(text):
+        return ' '.join(stem(word) for word in tokenize(text))
+
+    def create_schema(self, schema_connection):
+        with schema_connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                f"USING fts5(name, body, tokenize='unicode61 remove_diacritics 2')"
+            )
+
+    def drop_schema(self, schema_connection):
+        with schema_connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+    def index(self, documents):
+        rows = [(recipe_id, self._stem_text(name), self._stem_text(body)) for recipe_id, name, body in documents]
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(f'INSERT INTO {FTS_TABLE} (rowid, name, body) VALUES (%s, %s, %s)', rows)
+
+    def delete(self, recipe_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in recipe_ids])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    def match_expression(self, query):
+        # Каждое слово ищется по префиксу основы: «картоф» найдет «картофелем»
+        return ' AND '.join(f'"{stem(word)}"*' for word in tokenize(query))
+
+    def ranked_ids(self, query, limit, queryset=None):
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        candidates, params = candidates_sql(queryset, 'rowid')
+        if candidates is None:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s{candidates} '
+                f'ORDER BY bm25({FTS_TABLE}, 10.0, 1.0) LIMIT %s',
+                [expression, *params, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def filter(self, queryset, query):
+        return order_by_ids(queryset, self.ranked_ids(query, max_results(), queryset))
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    vendor = 'postgresql'
+
+    def create_schema(self, schema_connection):
+        with schema_connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {PG_TABLE} ('
+                f'recipe_id bigint PRIMARY KEY REFERENCES recipeapp_recipe (id) ON DELETE CASCADE, '
+                f'document tsvector NOT NULL)'
+            )
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {PG_TABLE}_document_idx ON {PG_TABLE} USING GIN (document)')
+
+    def drop_schema(self, schema_connection):
+        with schema_connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {PG_TABLE}')
+
+    def index(self, documents):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {PG_TABLE} (recipe_id, document) "
+                f"VALUES (%s, setweight(to_tsvector('russian', %s), 'A') || setweight(to_tsvector('russian', %s), 'B')) "
+                f"ON CONFLICT (recipe_id) DO UPDATE SET document = EXCLUDED.document",
+                documents
+            )
+
+    def delete(self, recipe_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {PG_TABLE} WHERE recipe_id = ANY(%s)', [list(recipe_ids)])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {PG_TABLE}')
+
+    def ranked_ids(self, query, limit, queryset=None):
+        words = tokenize(query)
+        if not words:
+            return []
+        candidates, params = candidates_sql(queryset, 'recipe_id')
+        if candidates is None:
+            return []
+        # Морфологию выполняет сам PostgreSQL, префиксный поиск задается через «:*»
+        expression = ' & '.join(f'{word}:*' for word in words)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT recipe_id FROM {PG_TABLE} WHERE document @@ to_tsquery('russian', %s){candidates} "
+                f"ORDER BY ts_rank(document, to_tsquery('russian', %s)) DESC LIMIT %s",
+                [expression, *params, expression, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def filter(self, queryset, query):
+        return order_by_ids(queryset, self.ranked_ids(query, max_results(), queryset))
+
+
+BACKENDS = {
+    SQLiteSearchBackend.vendor: SQLiteSearchBackend,
+    PostgresSearchBackend.vendor: PostgresSearchBackend,
+}
+
+
+def get_backend(vendor=None):
+    return BACKENDS.get(vendor or connection.vendor, BaseSearchBackend)()
+
+
+def candidates_sql(queryset, column):
+    """
+    Условие «column IN (id рецептов выборки)» для запроса к индексу: лимит RECIPE_SEARCH_MAX_RESULTS
+    применяется к найденным рецептам, уже прошедшим остальные фильтры. Для пустой выборки - (None, []).
+    """
+    if queryset is None:
+        return '', []
+    try:
+        sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    except EmptyResultSet:
+        return None, []
+    return f' AND {column} IN ({sql})', list(params)
+
+
+def max_results():
+    return getattr(settings, 'RECIPE_SEARCH_MAX_RESULTS', 1000)
+
+
+def order_by_ids(queryset, ids):
+    """
+    Оставляет в выборке только найденные рецепты в порядке релевантности.
+    Позиция в выдаче доступна как search_rank (используется курсорной пагинацией).
+    """
+    if not ids:
+        return queryset.none()
+    ranking = Case(*[When(pk=pk, then=position) for position, pk in enumerate(ids)], output_field=IntegerField())
+    return queryset.filter(pk__in=ids).annotate(search_rank=ranking).order_by('search_rank', 'id')
+
+
+def search_recipes(queryset, query):
+    """
+    Применяет полнотекстовый поиск к выборке рецептов.
+    """
+    query = (query or '').strip()
+    if not query:
+        return queryset
+    return get_backend().filter(queryset, query)
+
+
+def index_recipes(recipe_ids):
+    """
+    Пересобирает поисковые документы для указанных рецептов.
+    """
+    from recipeapp.models import Recipe, RecipeIngredient
+
+    recipe_ids = list(recipe_ids)
+    backend = get_backend()
+    for start in range(0, len(recipe_ids), INDEX_BATCH_SIZE):
+        batch = recipe_ids[start:start + INDEX_BATCH_SIZE]
+        ingredient_names = {}
+        for recipe_id, name in (RecipeIngredient.objects.filter(recipe_id__in=batch)
+                                .values_list('recipe_id', 'ingredient__name')):
+            ingredient_names.setdefault(recipe_id, []).append(name)
+
+        documents = []
+        found = set()
+        for pk, name, description, instructions in (Recipe.objects.filter(pk__in=batch)
+                                                    .values_list('pk', 'name', 'description', 'instructions')):
+            found.add(pk)
+            documents.append((pk, *build_document(name, description, instructions, ingredient_names.get(pk, []))))
+
+        backend.index(documents)
+        missing = set(batch) - found
+        if missing:
+            backend.delete(missing)
+
+
+@task
+def reindex_recipes(recipe_ids):
+    """
+    Фоновая переиндексация: для изменений, затрагивающих много рецептов сразу.
+    """
+    index_recipes(sorted(recipe_ids))
+
+
+def rebuild_index():
+    """
+    Полностью перестраивает поисковый индекс. Возвращает число проиндексированных рецептов.
+    """
+    from recipeapp.models import Recipe
+
+    backend = get_backend()
+    with transaction.atomic():
+        backend.clear()
+        recipe_ids = list(Recipe.objects.order_by('pk').values_list('pk', flat=True))
+        index_recipes(recipe_ids)
+    return len(recipe_ids)
+
+
+_pending = threading.local()
+
+
+def schedule_reindex(recipe_ids):
+    """
+    Откладывает переиндексацию рецептов до фиксации транзакции.
+    Все накопленные за транзакцию рецепты индексируются первым сработавшим обработчиком.
+    """
+    pending = getattr(_pending, 'ids', None)
+    if pending is None:
+        pending = _pending.ids = set()
+    pending.update(recipe_ids)
+    transaction.on_commit(_flush_pending)
+
+
+def _flush_pending():
+    ids = getattr(_pending, 'ids', None)
+    if ids:
+        _pending.ids = set()
+        index_recipes(sorted(ids))
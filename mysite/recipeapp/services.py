@@ -0,0 +1,54 @@
+from django.db import transaction
+from django.utils import timezone
+
+from recipeapp import pantry
+from recipeapp.cache import invalidate_recipes
+from recipeapp.models import Ingredient, Recipe, RecipeIngredient
+from recipeapp.recommendations import schedule_refresh
+from recipeapp.search import schedule_reindex
+
+
+def save_recipe_ingredients(recipe, rows):
+    """
+    Приводит ингредиенты рецепта к переданному набору {ingredient_id: quantity}:
+    новые строки создаются одним bulk_create, измененные — одним bulk_update,
+    лишние удаляются одним DELETE.
+    """
+    with transaction.atomic():
+        active_ids = set(
+            Ingredient.active.filter(pk__in=rows.keys()).values_list('pk', flat=True)
+        )
+        rows = {ingredient_id: quantity for ingredient_id, quantity in rows.items() if ingredient_id in active_ids}
+
+        existing = {
+            ingredient_id: (pk, quantity)
+            for pk, ingredient_id, quantity in recipe.recipe_ingredients.values_list('pk', 'ingredient_id', 'quantity')
+        }
+
+        to_create = [
+            RecipeIngredient(recipe=recipe, ingredient_id=ingredient_id, quantity=quantity)
+            for ingredient_id, quantity in rows.items()
+            if ingredient_id not in existing
+        ]
+        to_update = [
+            RecipeIngredient(pk=existing[ingredient_id][0], quantity=quantity)
+            for ingredient_id, quantity in rows.items()
+            if ingredient_id in existing and existing[ingredient_id][1] != quantity
+        ]
+        to_delete = [pk for ingredient_id, (pk, _) in existing.items() if ingredient_id not in rows]
+
+        if to_create:
+            RecipeIngredient.objects.bulk_create(to_create)
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ['quantity'])
+        if to_delete:
+            RecipeIngredient.objects.filter(pk__in=to_delete).delete()
+
+        # Массовые операции не отправляют сигналы, поэтому время изменения рецепта, индекс, соседей и кеш
+        # обновляем явно
+        if to_create or to_update or to_delete:
+            Recipe.objects.filter(pk=recipe.pk).update(updated_at=timezone.now())
+            schedule_reindex([recipe.pk])
+            schedule_refresh([recipe.pk])
+            pantry.schedule_update([recipe.pk])
+            transaction.on_commit(lambda: invalidate_recipes([recipe.pk]))
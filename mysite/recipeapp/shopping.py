@@ -0,0 +1,116 @@
+"""
+Список покупок по плану меню.
+
+План - рецепты с множителями порций. Все строки RecipeIngredient плана
+выбираются одним запросом вместе с названиями рецептов и ингредиентов,
+количества умножаются на множитель рецепта и складываются по продукту
+и единице измерения. Единицы массы и объема приводятся к базовым (г, мл)
+по таблице UNITS, поэтому 500 г и 1 кг одного продукта дают 1,5 кг.
+Ингредиенты с одинаковым названием складываются, даже если это разные
+записи каталога. Остальные единицы (ст.л., зубчик) складываются только
+с такими же.
+"""
+from collections import namedtuple
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from recipeapp.models import RecipeIngredient
+
+MAX_RECIPES = 100
+MAX_SERVINGS = Decimal(100)
+
+# Единица измерения (без регистра и завершающей точки) -> (базовая единица, множитель)
+UNITS = {
+    'мг': ('г', Decimal('0.001')),
+    'г': ('г', Decimal(1)),
+    'гр': ('г', Decimal(1)),
+    'g': ('г', Decimal(1)),
+    'кг': ('г', Decimal(1000)),
+    'kg': ('г', Decimal(1000)),
+    'мл': ('мл', Decimal(1)),
+    'ml': ('мл', Decimal(1)),
+    'л': ('мл', Decimal(1000)),
+    'l': ('мл', Decimal(1000)),
+    'шт': ('шт', Decimal(1)),
+}
+
+# Базовая единица -> единицы для вывода, от крупной к мелкой
+DISPLAY_UNITS = {
+    'г': (('кг', Decimal(1000)), ('г', Decimal(1))),
+    'мл': (('л', Decimal(1000)), ('мл', Decimal(1))),
+}
+
+ShoppingItem = namedtuple('ShoppingItem', 'name quantity unit ingredient_ids recipe_ids')
+ShoppingList = namedtuple('ShoppingList', 'recipes items')
+
+
+def normalize_unit(measure):
+    unit = (measure or '').strip().lower().rstrip('.')
+    return UNITS.get(unit, (unit, Decimal(1)))
+
+
+def display_quantity(total, base_unit):
+    """
+    Переводит количество в базовых единицах в самую крупную единицу, в которой оно не меньше 1.
+    """
+    for unit, factor in DISPLAY_UNITS.get(base_unit, ()):
+        if total >= factor:
+            return total / factor, unit
+    return total, base_unit
+
+
+def format_quantity(quantity):
+    return f'{quantity.quantize(Decimal("0.01"), ROUND_HALF_UP).normalize():f}'
+
+
+def parse_plan(recipe_values, servings_values=()):
+    """
+    План из параллельных списков рецептов и множителей порций
+    (?recipe=1&servings=2&recipe=5&servings=0.5): {recipe_id: множитель}.
+    Пропущенный множитель равен 1, повторы одного рецепта складываются.
+    """
+    if len(recipe_values) > MAX_RECIPES:
+        raise ValueError(f'В плане может быть не больше {MAX_RECIPES} рецептов')
+    plan = {}
+    for position, value in enumerate(recipe_values):
+        raw = servings_values[position] if position < len(servings_values) else ''
+        try:
+            recipe_id = int(value)
+            servings = Decimal(raw.strip().replace(',', '.') or 1)
+        except (ValueError, InvalidOperation):
+            raise ValueError(f'Неверная позиция плана: рецепт {value!r}, порции {raw!r}')
+        if not servings.is_finite() or not 0 < servings <= MAX_SERVINGS:
+            raise ValueError(f'Множитель порций должен быть больше 0 и не больше {MAX_SERVINGS}')
+        plan[recipe_id] = plan.get(recipe_id, 0) + servings
+    return plan
+
+
+def build_shopping_list(plan):
+    """
+    Сводный список покупок по плану {recipe_id: множитель} за один запрос к базе данных.
+    Возвращает рецепты плана [(id, название, множитель)] и позиции списка по алфавиту.
+    Архивированные и несуществующие рецепты пропускаются.
+    """
+    rows = RecipeIngredient.objects.filter(recipe_id__in=list(plan), recipe__archived=False).values_list(
+        'recipe_id', 'recipe__name', 'ingredient_id', 'ingredient__name', 'ingredient__measure', 'quantity'
+    )
+
+    recipe_names = {}
+    totals = {}
+    for recipe_id, recipe_name, ingredient_id, name, measure, quantity in rows:
+        recipe_names[recipe_id] = recipe_name
+        base_unit, factor = normalize_unit(measure)
+        key = (name.strip().lower(), base_unit)
+        entry = totals.get(key)
+        if entry is None:
+            entry = totals[key] = [name.strip(), Decimal(0), set(), set()]
+        entry[1] += quantity * factor * plan[recipe_id]
+        entry[2].add(ingredient_id)
+        entry[3].add(recipe_id)
+
+    items = []
+    for (_, base_unit), (name, total, ingredient_ids, recipe_ids) in sorted(totals.items()):
+        quantity, unit = display_quantity(total, base_unit)
+        items.append(ShoppingItem(name, quantity, unit, sorted(ingredient_ids), sorted(recipe_ids)))
+    recipes = [(recipe_id, recipe_names[recipe_id], servings)
+               for recipe_id, servings in plan.items() if recipe_id in recipe_names]
+    return ShoppingList(recipes, items)
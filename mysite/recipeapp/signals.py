@@ -0,0 +1,135 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from recipeapp import cache as recipe_cache
+from recipeapp import facets, pantry
+from recipeapp.comments import apply_comment_delta
+from recipeapp.images import schedule_thumbnails
+from recipeapp.models import Category, CategoryRecipeCount, Comment, Ingredient, Rating, Recipe, RecipeIngredient
+from recipeapp.ratings import apply_rating_delta
+from recipeapp.recommendations import schedule_refresh
+from recipeapp.search import get_backend, reindex_recipes, schedule_reindex
+
+
+def invalidate_recipes_on_commit(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    transaction.on_commit(lambda: recipe_cache.invalidate_recipes(recipe_ids))
+
+
+@receiver(post_delete, sender=Rating)
+def rating_deleted(sender, instance, **kwargs):
+    # Удаление оценки (в т.ч. каскадное при удалении пользователя) уменьшает агрегаты рецепта
+    apply_rating_delta(instance.recipe_id, -1, -instance.value)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    # Удаление комментария (в т.ч. каскадное при удалении пользователя) уменьшает счетчик рецепта
+    apply_comment_delta(instance.recipe_id, -1)
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def recipe_related_changed(sender, instance, **kwargs):
+    invalidate_recipes_on_commit([instance.recipe_id])
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=Ingredient)
+def archived_timestamp(sender, instance, **kwargs):
+    # Время архивации нужно команде archive_cold_storage
+    if not instance.archived:
+        instance.archived_at = None
+    elif instance.archived_at is None:
+        instance.archived_at = timezone.now()
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_saving(sender, instance, update_fields=None, **kwargs):
+    # Прежнее значение archived нужно, чтобы перенести рецепт в счетчиках категорий
+    if not instance._state.adding and (update_fields is None or 'archived' in update_fields):
+        instance._archived_before = (Recipe.objects.filter(pk=instance.pk)
+                                     .values_list('archived', flat=True).first())
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, **kwargs):
+    archived_before = instance.__dict__.pop('_archived_before', None)
+    if archived_before is not None and archived_before != instance.archived:
+        facets.archived_changed(instance)
+    schedule_reindex([instance.pk])
+    # Рецепт мог быть перенесен в архив или возвращен из него
+    pantry.schedule_update([instance.pk])
+    invalidate_recipes_on_commit([instance.pk])
+    # Копии изображения создаются в фоне, если изображение заменили или удалили
+    if (instance.image.name or '') != (instance.image_variants.get('source') or ''):
+        schedule_thumbnails(instance.pk)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    # Связи с категориями удаляются каскадно, без сигнала m2m_changed
+    facets.apply_deltas({category_id: -count for category_id, count
+                         in facets.linked_counts(instance, reverse=False).items()})
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    get_backend().delete([instance.pk])
+    pantry.schedule_update([instance.pk])
+    invalidate_recipes_on_commit([instance.pk])
+
+
+@receiver(m2m_changed, sender=Recipe.categories.through)
+def recipe_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    facets.links_changed(instance, action, reverse, pk_set)
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # Изменены рецепты категории: instance — категория, при очистке pk_set не передается
+        transaction.on_commit(lambda: recipe_cache.bump(recipe_cache.CATEGORIES))
+        invalidate_recipes_on_commit(pk_set or [])
+    else:
+        invalidate_recipes_on_commit([instance.pk])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    schedule_reindex([instance.recipe_id])
+    schedule_refresh([instance.recipe_id])
+    pantry.schedule_update([instance.recipe_id])
+    invalidate_recipes_on_commit([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, created, **kwargs):
+    transaction.on_commit(lambda: recipe_cache.bump(recipe_cache.INGREDIENTS))
+    # Название ингредиента входит в поисковые документы и страницы всех рецептов, где он используется.
+    # Рецептов может быть много, поэтому переиндексация выполняется фоновой задачей
+    if not created:
+        recipe_ids = list(instance.recipe_ingredients.values_list('recipe_id', flat=True))
+        if recipe_ids:
+            reindex_recipes.delay(recipe_ids)
+        invalidate_recipes_on_commit(recipe_ids)
+
+
+@receiver(post_delete, sender=Ingredient)
+def ingredient_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: recipe_cache.bump(recipe_cache.INGREDIENTS))
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+    if created:
+        CategoryRecipeCount.objects.get_or_create(category=instance)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: recipe_cache.bump(recipe_cache.CATEGORIES, recipe_cache.RECIPES))
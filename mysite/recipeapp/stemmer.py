@@ -0,0 +1,146 @@
+"""
+Стеммер для русского языка по алгоритму Snowball (Porter).
+
+Используется поисковым индексом SQLite, у которого нет встроенной
+морфологии для русского языка.
+"""
+from functools import lru_cache
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND_1 = ('вшись', 'вши', 'в')
+PERFECTIVE_GERUND_2 = ('ившись', 'ывшись', 'ивши', 'ывши', 'ив', 'ыв')
+
+ADJECTIVE = (
+    'ими', 'ыми', 'его', 'ого', 'ему', 'ому',
+    'ее', 'ие', 'ые', 'ое', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+    'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+)
+
+PARTICIPLE_1 = ('ем', 'нн', 'вш', 'ющ', 'щ')
+PARTICIPLE_2 = ('ивш', 'ывш', 'ующ')
+
+REFLEXIVE = ('ся', 'сь')
+
+VERB_1 = ('ете', 'йте', 'ешь', 'нно', 'ла', 'на', 'ли', 'ем', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'й', 'л', 'н')
+VERB_2 = (
+    'ейте', 'уйте', 'ила', 'ыла', 'ена', 'ите', 'или', 'ыли', 'ило', 'ыло', 'ено', 'ует', 'уют', 'ены',
+    'ить', 'ыть', 'ишь', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ят', 'ит', 'ыт', 'ую', 'ю',
+)
+
+NOUN = (
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях',
+    'ев', 'ов', 'ие', 'ье', 'еи', 'ии', 'ей', 'ой', 'ий', 'ям', 'ем', 'ам', 'ом', 'ах', 'ях', 'ию', 'ью', 'ия', 'ья',
+    'а', 'е', 'и', 'й', 'о', 'у', 'ы', 'ь', 'ю', 'я',
+)
+
+SUPERLATIVE = ('ейше', 'ейш')
+DERIVATIONAL = ('ость', 'ост')
+
+
+def _regions(word):
+    """
+    Возвращает начала областей RV и R2 (см. описание алгоритма Snowball).
+    """
+    rv = len(word)
+    for i, char in enumerate(word):
+        if char in VOWELS:
+            rv = i + 1
+            break
+
+    def next_region(start):
+        for i in range(start + 1, len(word)):
+            if word[i] not in VOWELS and word[i - 1] in VOWELS:
+                return i + 1
+        return len(word)
+
+    r1 = next_region(0)
+    r2 = next_region(r1)
+    return rv, r2
+
+
+def _by_length(endings):
+    groups = {}
+    for ending in endings:
+        groups.setdefault(len(ending), set()).add(ending)
+    return sorted(groups.items(), reverse=True)
+
+
+_SUFFIX_TABLES = {}
+
+
+def _match(word, group_1=(), group_2=()):
+    """
+    Ищет самое длинное окончание. Окончания первой группы должны следовать за «а» или «я».
+    Возвращает длину окончания или 0.
+    """
+    table = _SUFFIX_TABLES.get((group_1, group_2))
+    if table is None:
+        table = _SUFFIX_TABLES[(group_1, group_2)] = (
+            _by_length(group_1 + group_2), frozenset(group_1)
+        )
+    lengths, first_group = table
+    for size, endings in lengths:
+        ending = word[-size:]
+        if size <= len(word) and ending in endings:
+            if ending in first_group and word[-size - 1:-size] not in ('а', 'я'):
+                return 0
+            return size
+    return 0
+
+
+def _cut(word, size):
+    return word[:-size] if size else word
+
+
+@lru_cache(maxsize=100000)
+def stem(word):
+    """
+    Возвращает основу русского слова. Слова без гласных возвращаются без изменений.
+    Результат кешируется: словарь рецептов невелик, а одни и те же слова повторяются постоянно.
+    """
+    word = word.lower().replace('ё', 'е')
+    rv, r2 = _regions(word)
+    prefix, rv_part = word[:rv], word[rv:]
+
+    # Шаг 1
+    size = _match(rv_part, PERFECTIVE_GERUND_1, PERFECTIVE_GERUND_2)
+    if size:
+        rv_part = _cut(rv_part, size)
+    else:
+        rv_part = _cut(rv_part, _match(rv_part, group_2=REFLEXIVE))
+
+        size = _match(rv_part, group_2=ADJECTIVE)
+        if size:
+            rv_part = _cut(rv_part, size)
+            rv_part = _cut(rv_part, _match(rv_part, PARTICIPLE_1, PARTICIPLE_2))
+        else:
+            size = _match(rv_part, VERB_1, VERB_2)
+            if size:
+                rv_part = _cut(rv_part, size)
+            else:
+                rv_part = _cut(rv_part, _match(rv_part, group_2=NOUN))
+
+    # Шаг 2
+    if rv_part.endswith('и'):
+        rv_part = rv_part[:-1]
+
+    # Шаг 3: словообразовательные окончания удаляются только внутри R2
+    r2_part = (prefix + rv_part)[r2:]
+    size = _match(r2_part, group_2=DERIVATIONAL)
+    if size:
+        rv_part = _cut(rv_part, size)
+
+    # Шаг 4
+    if rv_part.endswith('нн'):
+        rv_part = rv_part[:-1]
+    else:
+        size = _match(rv_part, group_2=SUPERLATIVE)
+        if size:
+            rv_part = _cut(rv_part, size)
+            if rv_part.endswith('нн'):
+                rv_part = rv_part[:-1]
+        elif rv_part.endswith('ь'):
+            rv_part = rv_part[:-1]
+
+    return prefix + rv_part
@@ -0,0 +1,164 @@
+"""
+Очередь фоновых задач в базе данных.
+
+Функция, отмеченная декоратором @task, ставится в очередь вызовом
+func.delay(*args, **kwargs). Запись Task создается после фиксации текущей
+транзакции, поэтому задача не увидит данные раньше, чем они сохранены,
+и не выполнится, если транзакция отменена. Команда run_worker забирает
+ожидающие задачи пачками и выполняет их в пуле процессов; упавшая задача
+перезапускается с экспоненциальной задержкой, пока не исчерпает
+max_attempts. Внешние сервисы не нужны: очередь — обычная таблица.
+
+Аргументы задач сериализуются в JSON, поэтому передавать нужно
+идентификаторы, а не экземпляры моделей. Задачи должны быть
+идемпотентными: задача, выполнение которой прервалось вместе с воркером,
+запускается снова.
+
+При RECIPE_TASKS_EAGER задачи выполняются сразу после фиксации в текущем
+процессе (разработка без воркера).
+"""
+import logging
+import traceback
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from recipeapp.models import Task
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def tasks_eager():
+    return getattr(settings, 'RECIPE_TASKS_EAGER', False)
+
+
+def retry_delay(attempt):
+    """
+    Задержка перед повторным запуском после attempt неудачных попыток: 10 с, 20 с, 40 с...
+    """
+    return timedelta(seconds=getattr(settings, 'RECIPE_TASKS_RETRY_DELAY', 10) * 2 ** (attempt - 1))
+
+
+def task(func=None, *, max_attempts=3):
+    """
+    Регистрирует функцию как фоновую задачу и добавляет ей метод delay().
+    Сама функция по-прежнему вызывается синхронно.
+    """
+    if func is None:
+        return partial(task, max_attempts=max_attempts)
+
+    name = f'{func.__module__}.{func.__qualname__}'
+    _registry[name] = func
+    func.task_name = name
+    func.delay = lambda *args, **kwargs: enqueue(name, args, kwargs, max_attempts=max_attempts)
+    return func
+
+
+def get_task(name):
+    # Воркер мог еще не импортировать модуль с задачей
+    if name not in _registry:
+        import_string(name)
+    return _registry[name]
+
+
+def enqueue(name, args=(), kwargs=None, max_attempts=3, countdown=0):
+    """
+    Ставит задачу в очередь после фиксации текущей транзакции.
+    """
+    payload = {'args': list(args), 'kwargs': kwargs or {}}
+    if tasks_eager():
+        transaction.on_commit(partial(execute, name, payload))
+        return
+    transaction.on_commit(partial(
+        Task.objects.create, name=name, payload=payload, max_attempts=max_attempts,
+        run_at=timezone.now() + timedelta(seconds=countdown),
+    ))
+
+
+def execute(name, payload):
+    """
+    Выполняет задачу. Возвращает текст ошибки или None, исключения не пробрасывает,
+    чтобы ошибка задачи не прерывала процесс воркера.
+    """
+    try:
+        get_task(name)(*payload.get('args', ()), **payload.get('kwargs', {}))
+    except Exception:
+        logger.exception('Ошибка фоновой задачи %s', name)
+        return traceback.format_exc()
+    finally:
+        close_old_connections()
+    return None
+
+
+def claim(worker_id, limit):
+    """
+    Захватывает до limit задач, время запуска которых наступило.
+    Условие status='pending' в UPDATE не дает двум воркерам захватить одну задачу.
+    """
+    now = timezone.now()
+    pending = Task.objects.filter(status=Task.PENDING, run_at__lte=now).order_by('run_at', 'id')
+    Task.objects.filter(pk__in=pending.values('pk')[:limit], status=Task.PENDING).update(
+        status=Task.RUNNING, locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1,
+    )
+    return list(Task.objects.filter(status=Task.RUNNING, locked_by=worker_id, locked_at=now).order_by('run_at', 'id'))
+
+
+def finish(task_record, error):
+    """
+    Отмечает задачу выполненной либо планирует повтор, пока не исчерпаны попытки.
+    """
+    now = timezone.now()
+    if error is None:
+        changes = {'status': Task.DONE, 'finished_at': now, 'last_error': ''}
+    elif task_record.attempts >= task_record.max_attempts:
+        changes = {'status': Task.FAILED, 'finished_at': now, 'last_error': error}
+    else:
+        changes = {'status': Task.PENDING, 'run_at': now + retry_delay(task_record.attempts), 'last_error': error}
+    Task.objects.filter(pk=task_record.pk, locked_by=task_record.locked_by).update(
+        locked_by='', locked_at=None, **changes
+    )
+
+
+def requeue(task_records):
+    """
+    Возвращает прерванные задачи в очередь, не засчитывая попытку.
+    """
+    for task_record in task_records:
+        Task.objects.filter(pk=task_record.pk, locked_by=task_record.locked_by).update(
+            status=Task.PENDING, locked_by='', locked_at=None, attempts=F('attempts') - 1,
+        )
+
+
+def release_stale(timeout, exclude_worker=''):
+    """
+    Возвращает в очередь задачи, захваченные воркером, который не завершил их за timeout
+    (воркер остановлен или упал). Задачи без оставшихся попыток отмечаются ошибкой.
+    """
+    stale = Task.objects.filter(status=Task.RUNNING, locked_at__lt=timezone.now() - timeout).exclude(
+        locked_by=exclude_worker
+    )
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Task.FAILED, locked_by='', locked_at=None, finished_at=timezone.now(),
+        last_error='Воркер не завершил задачу',
+    )
+    released = stale.update(status=Task.PENDING, locked_by='', locked_at=None, run_at=timezone.now())
+    return released + failed
+
+
+def run_pending(worker_id='inline', batch_size=100):
+    """
+    Выполняет все готовые к запуску задачи в текущем процессе. Возвращает число выполненных попыток.
+    """
+    processed = 0
+    while batch := claim(worker_id, batch_size):
+        for task_record in batch:
+            finish(task_record, execute(task_record.name, task_record.payload))
+        processed += len(batch)
+    return processed
@@ -0,0 +1,45 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from recipeapp.images import FORMATS, variant_name
+
+register = template.Library()
+
+# Ширина изображения на странице для атрибута sizes
+SIZES = {
+    'card': '100px',
+    'admin': '60px',
+    'detail': '(max-width: 800px) 100vw, 800px',
+}
+
+
+def _srcset(variants, image_format):
+    return ', '.join(
+        f'{default_storage.url(variant_name(variants["source"], width, image_format))} {width}w'
+        for width in variants['widths']
+    )
+
+
+@register.simple_tag
+def recipe_image(recipe, size, **attrs):
+    """
+    <picture> с копиями изображения рецепта в WebP и JPEG.
+    Пока копии не созданы, выводится оригинал. Пример: {% recipe_image recipe 'card' class='img-fluid' %}
+    """
+    if not recipe.image:
+        return ''
+    attributes = format_html_join(' ', '{}="{}"', sorted(attrs.items()))
+    variants = recipe.image_variants
+    if variants.get('source') != recipe.image.name:
+        return format_html('<img src="{}" alt="{}" loading="lazy" {}>', recipe.image.url, recipe.name, attributes)
+
+    sizes = SIZES.get(size, size)
+    preferred, fallback = list(FORMATS)[0], list(FORMATS)[-1]
+    return format_html(
+        '<picture><source type="image/{}" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="lazy" {}></picture>',
+        preferred, _srcset(variants, preferred), sizes,
+        default_storage.url(variant_name(variants['source'], variants['widths'][0], fallback)),
+        _srcset(variants, fallback), sizes, recipe.name, attributes,
+    )
@@ -1,3 +1,1251 @@
-from django.test import TestCase
+import base64
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, router, transaction
+from django.http import HttpResponse, QueryDict
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from recipeapp.images import generate_thumbnails, store_variants, variant_names
+from recipeapp.models import (
+    Category, CategoryRecipeCount, Comment, EmptyIfNull, Ingredient, IngredientArchive, Rating, Recipe,
+    RecipeArchive, RecipeIngredient, Task,
+)
+from recipeapp import cache as recipe_cache, pantry
+from recipeapp.checks import check_shared_cache
+from recipeapp.coldstorage import cold_storage_cutoff
+from recipeapp.comments import COMMENTS_PER_PAGE, add_comment
+from recipeapp.export import RECIPE_FIELDS, iter_recipe_records
+from recipeapp.facets import category_facets, refresh_counts
+from recipeapp.filters import filter_recipes, parse_filters
+from recipeapp.pagination import InvalidCursor, KeysetPaginator
+from recipeapp.profiling import registry
+from recipeapp.ratelimit import take_token
+from recipeapp.ratings import rating_buffer, set_rating
+from recipeapp.routers import STICKY_COOKIE, ReplicaMiddleware
+from recipeapp.recommendations import rebuild_neighbors, similar_recipes
+from recipeapp.search import FTS_TABLE, index_recipes, order_by_ids, search_recipes
+from recipeapp.services import save_recipe_ingredients
+from recipeapp.shopping import build_shopping_list, parse_plan
+from recipeapp.stemmer import stem
+from recipeapp.tasks import run_pending, task
+from recipeapp.templatetags.recipe_images import recipe_image
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Проверяет, что число SQL-запросов страницы не зависит от количества связанных записей.
+    """
+    sizes = (1, 10, 100)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cook', password='secret')
+
+    def create_recipes(self, count, related):
+        """
+        Создает count рецептов, у каждого по related ингредиентов, категорий и комментариев.
+        """
+        categories = Category.objects.bulk_create(
+            [Category(name=f'Категория {count}-{related}-{i}') for i in range(related)]
+        )
+        ingredients = Ingredient.objects.bulk_create(
+            [Ingredient(name=f'Продукт {i}', measure='г') for i in range(related)]
+        )
+        recipes = Recipe.objects.bulk_create([
+            Recipe(name=f'Рецепт {i}', description='Описание', instructions='Инструкции',
+                   cooking_time=10, created_by=self.user)
+            for i in range(count)
+        ])
+        for recipe in recipes:
+            recipe.categories.set(categories)
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, quantity=1)
+            for recipe in recipes for ingredient in ingredients
+        ])
+        Comment.objects.bulk_create([
+            Comment(recipe=recipe, user=self.user, text=f'Комментарий {i}')
+            for recipe in recipes for i in range(related)
+        ])
+        return recipes
+
+    def assertQueryBudget(self, budget, url):
+        cache.clear()
+        with self.assertNumQueries(budget):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+
+class RecipeDetailViewQueryTestCase(QueryBudgetTestCase):
+    def test_query_count_is_constant(self):
+        for size in self.sizes:
+            with self.subTest(related=size):
+                recipe, = self.create_recipes(1, size)
+                self.assertQueryBudget(5, reverse('recipeapp:recipe_detail', kwargs={'pk': recipe.pk}))
+
+
+class RecipeListViewQueryTestCase(QueryBudgetTestCase):
+    def test_query_count_is_constant(self):
+        for size in self.sizes:
+            with self.subTest(related=size):
+                self.create_recipes(10, size)
+                self.assertQueryBudget(4, reverse('recipeapp:recipe_list'))
+
+
+class RecipeIndexViewQueryTestCase(QueryBudgetTestCase):
+    def test_query_count_is_constant(self):
+        for size in self.sizes:
+            with self.subTest(related=size):
+                self.create_recipes(size, size)
+                self.assertQueryBudget(3, reverse('recipeapp:recipe_index'))
+
+
+class IngredientListViewQueryTestCase(QueryBudgetTestCase):
+    def test_query_count_is_constant(self):
+        for size in self.sizes:
+            with self.subTest(related=size):
+                self.create_recipes(1, size)
+                self.assertQueryBudget(1, reverse('recipeapp:ingredient_list'))
+
+
+class SaveRecipeIngredientsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cook', password='secret')
+        cls.ingredients = Ingredient.objects.bulk_create(
+            [Ingredient(name=f'Продукт {i}', measure='г') for i in range(1000)]
+        )
+        cls.recipe = Recipe.objects.create(name='Рецепт', description='Описание', instructions='Инструкции',
+                                           cooking_time=10, created_by=cls.user)
+
+    def test_rows_are_diffed_in_constant_queries(self):
+        rows = {ingredient.pk: 2 for ingredient in self.ingredients[:50]}
+
+        # SAVEPOINT, проверка ингредиентов, текущие строки, bulk_create, время изменения рецепта, RELEASE SAVEPOINT
+        with self.assertNumQueries(6):
+            save_recipe_ingredients(self.recipe, rows)
+        self.assertEqual(self.recipe.recipe_ingredients.count(), 50)
+
+        first, second = self.ingredients[0], self.ingredients[1]
+        save_recipe_ingredients(self.recipe, {first.pk: 5, second.pk: 2})
+        self.assertEqual(
+            dict(self.recipe.recipe_ingredients.values_list('ingredient_id', 'quantity')),
+            {first.pk: 5, second.pk: 2}
+        )
+
+    def test_update_form_does_not_render_catalogue(self):
+        save_recipe_ingredients(self.recipe, {self.ingredients[0].pk: 3})
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('recipeapp:recipe_update', args=[self.recipe.pk]))
+        self.assertContains(response, 'Продукт 0')
+        self.assertNotContains(response, 'Продукт 999')
+
+        first, second = self.ingredients[1], self.ingredients[2]
+        data = {
+            'name': 'Рецепт', 'description': 'Описание', 'instructions': 'Инструкции', 'cooking_time': 10,
+            'categories': [Category.objects.create(name='Супы').pk],
+            'ingredients-TOTAL_FORMS': 3, 'ingredients-INITIAL_FORMS': 1,
+            'ingredients-0-ingredient': self.ingredients[0].pk, 'ingredients-0-quantity': 3,
+            'ingredients-0-DELETE': 'on',
+            'ingredients-1-ingredient': first.pk, 'ingredients-1-quantity': 4,
+            'ingredients-2-ingredient': second.pk, 'ingredients-2-quantity': 1,
+        }
+        response = self.client.post(reverse('recipeapp:recipe_update', args=[self.recipe.pk]), data)
+        self.assertRedirects(response, reverse('recipeapp:recipe_detail', args=[self.recipe.pk]))
+        self.assertEqual(
+            dict(self.recipe.recipe_ingredients.values_list('ingredient_id', 'quantity')),
+            {first.pk: 4, second.pk: 1}
+        )
+
+        # Повтор ингредиента и несуществующий ингредиент отклоняются без изменения рецепта
+        data['ingredients-2-ingredient'] = first.pk
+        response = self.client.post(reverse('recipeapp:recipe_update', args=[self.recipe.pk]), data)
+        self.assertContains(response, 'добавлен дважды')
+        data['ingredients-2-ingredient'] = 0
+        response = self.client.post(reverse('recipeapp:recipe_update', args=[self.recipe.pk]), data)
+        self.assertContains(response, 'не найден')
+        self.assertEqual(self.recipe.recipe_ingredients.count(), 2)
+
+    def test_ingredient_search(self):
+        Ingredient.objects.create(name='Продукт в архиве', archived=True)
+        cache.clear()
+        url = reverse('recipeapp:api_ingredient_search')
+        response = self.client.get(url, {'q': 'продукт 99', 'limit': 3})
+        self.assertEqual([row['name'] for row in response.json()['results']],
+                         ['Продукт 99', 'Продукт 990', 'Продукт 991'])
+        self.assertEqual(self.client.get(url, {'q': 'Продукт в'}).json(), {'results': []})
+
+
+class RatingAggregatesTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cook')
+        cls.other = User.objects.create_user(username='guest')
+        cls.recipe = Recipe.objects.create(name='Блины', description='', instructions='', cooking_time=30,
+                                           created_by=cls.user)
+
+    def assertAggregates(self, count, total, rate):
+        self.recipe.refresh_from_db()
+        self.assertEqual((self.recipe.rating_count, self.recipe.rating_sum), (count, total))
+        self.assertEqual(self.recipe.rate, Decimal(rate))
+
+    def test_new_and_changed_rating(self):
+        set_rating(self.recipe.pk, self.user, 4)
+        self.assertAggregates(1, 4, '4.00')
+        set_rating(self.recipe.pk, self.other, 5)
+        self.assertAggregates(2, 9, '4.50')
+        set_rating(self.recipe.pk, self.other, 2)
+        self.assertAggregates(2, 6, '3.00')
+        set_rating(self.recipe.pk, self.other, 2)
+        self.assertAggregates(2, 6, '3.00')
+
+    def test_deleted_rating(self):
+        set_rating(self.recipe.pk, self.user, 4)
+        set_rating(self.recipe.pk, self.other, 1)
+        Rating.objects.get(user=self.other).delete()
+        self.assertAggregates(1, 4, '4.00')
+        Rating.objects.get(user=self.user).delete()
+        self.assertAggregates(0, 0, '0.00')
+
+    def test_rebuild_fixes_drift(self):
+        set_rating(self.recipe.pk, self.user, 4)
+        set_rating(self.recipe.pk, self.other, 3)
+        Recipe.objects.filter(pk=self.recipe.pk).update(rating_count=10, rating_sum=7, rate=Decimal('0.70'))
+        call_command('rebuild_rating_aggregates', stdout=StringIO())
+        self.assertAggregates(2, 7, '3.50')
+
+
+class SearchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cook')
+        cls.potato = Ingredient.objects.create(name='Картофель', measure='г')
+
+    def create(self, name, description=''):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Recipe.objects.create(name=name, description=description, instructions='', cooking_time=30,
+                                         created_by=self.user)
+
+    def found(self, query):
+        return [recipe.name for recipe in search_recipes(Recipe.objects.all(), query)]
+
+    def test_word_forms_and_prefix(self):
+        self.assertEqual(stem('картофелем'), stem('картофель'))
+        self.create('Пюре', 'Картофелем и молоком')
+        self.create('Драники', 'Тертый картофель')
+        self.create('Окрошка', 'Квас')
+        self.assertEqual(sorted(self.found('картофель')), ['Драники', 'Пюре'])
+        self.assertEqual(sorted(self.found('картофелем')), ['Драники', 'Пюре'])
+        self.assertEqual(sorted(self.found('карто')), ['Драники', 'Пюре'])
+        self.assertEqual(self.found('молоко'), ['Пюре'])
+        self.assertEqual(self.found('гречка'), [])
+
+    def test_rank_order(self):
+        # Совпадение в названии весит больше, чем в описании
+        body = self.create('Запеканка', 'Сырники и творог')
+        name = self.create('Сырники', 'Творог')
+        self.assertEqual(self.found('сырники'), ['Сырники', 'Запеканка'])
+
+        ranked = order_by_ids(Recipe.objects.all(), [body.pk, name.pk])
+        self.assertEqual([(recipe.pk, recipe.search_rank) for recipe in ranked], [(body.pk, 0), (name.pk, 1)])
+        self.assertEqual(list(order_by_ids(Recipe.objects.all(), [])), [])
+
+    @override_settings(RECIPE_SEARCH_MAX_RESULTS=2)
+    def test_limit_applies_after_filters(self):
+        self.create('Суп', 'Суп с курицей')
+        self.create('Суп гороховый', 'Суп')
+        other = User.objects.create_user(username='other')
+        with self.captureOnCommitCallbacks(execute=True):
+            third = Recipe.objects.create(name='Щи', description='Суп', instructions='', cooking_time=30,
+                                          created_by=other)
+        self.assertEqual(len(self.found('суп')), 2)
+        # Рецепт другого автора не вытесняется лимитом, взятым по всем рецептам
+        found = search_recipes(Recipe.objects.filter(created_by=other), 'суп')
+        self.assertEqual([recipe.pk for recipe in found], [third.pk])
+        self.assertEqual(list(search_recipes(Recipe.objects.none(), 'суп')), [])
+
+    def test_reindex_on_commit(self):
+        recipe = self.create('Суп')
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            recipe.name = 'Солянка'
+            recipe.save()
+            # До фиксации транзакции индекс не меняется
+            self.assertEqual(self.found('солянка'), [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.found('солянка'), ['Солянка'])
+        self.assertEqual(self.found('суп'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredient.objects.create(recipe=recipe, ingredient=self.potato, quantity=200)
+        self.assertEqual(self.found('картофель'), ['Солянка'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {FTS_TABLE}')
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+
+class KeysetPaginatorTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Повторяющиеся названия проверяют, что порядок однозначен благодаря id
+        Ingredient.objects.bulk_create([Ingredient(name=f'Продукт {i % 7}') for i in range(45)])
+
+    def test_pages_cover_all_rows_in_both_directions(self):
+        paginator = KeysetPaginator(('name', 'id'), 10)
+        queryset = Ingredient.objects.all()
+        expected = list(queryset.order_by('name', 'id').values_list('pk', flat=True))
+
+        pages, cursor = [], None
+        while True:
+            page = paginator.paginate(queryset, cursor)
+            pages.append([ingredient.pk for ingredient in page])
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual([pk for page in pages for pk in page], expected)
+
+        page = paginator.paginate(queryset, page.previous_cursor)
+        self.assertEqual([ingredient.pk for ingredient in page], pages[-2])
+        self.assertTrue(page.has_previous())
+
+    def test_bad_cursor_values_fall_back_to_first_page(self):
+        paginator = KeysetPaginator(('name', 'id'), 10)
+        queryset = Ingredient.objects.all()
+        first = [ingredient.pk for ingredient in paginator.paginate(queryset)]
+        for values in (['Продукт 1', 'garbage'], ['Продукт 1', [1]], ['Продукт 1', {'id': 1}]):
+            cursor = base64.urlsafe_b64encode(json.dumps(['n', values]).encode()).decode()
+            with self.assertRaises(InvalidCursor):
+                paginator.decode_cursor(cursor, queryset)
+            self.assertEqual([ingredient.pk for ingredient in paginator.paginate(queryset, cursor)], first)
+
+        # Подделанный курсор в ленте рецептов и в API не приводит к ошибке сервера
+        cursor = base64.urlsafe_b64encode(json.dumps(['n', ['garbage', 1]]).encode()).decode()
+        for name in ('recipeapp:recipe_list', 'recipeapp:api_recipe_list'):
+            self.assertEqual(self.client.get(reverse(name), {'cursor': cursor}).status_code, 200)
+
+    def test_cursor_seeks_in_index(self):
+        user = User.objects.create_user(username='cook', password='secret')
+        Recipe.objects.bulk_create([
+            Recipe(name=f'Рецепт {i}', description='', instructions='', cooking_time=10, created_by=user)
+            for i in range(25)
+        ])
+        paginator = KeysetPaginator(('-created_at', '-id'), 10)
+        page = paginator.paginate(Recipe.active.all(), paginator.paginate(Recipe.active.all()).next_cursor)
+        for cursor in (page.next_cursor, page.previous_cursor):
+            queryset, _, _ = paginator.prepare(Recipe.active.all(), cursor)
+            # Страница N читает индекс с позиции курсора, а не с начала
+            plan = queryset.explain()
+            self.assertIn('SEARCH', plan)
+            self.assertIn('recipe_active_created_idx', plan)
+
+
+class CachedPagesTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cook')
+        cls.recipe = Recipe.objects.create(name='Борщ', description='Красный', instructions='Варить',
+                                           cooking_time=60, created_by=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_edit_invalidates_pages(self):
+        urls = [reverse('recipeapp:recipe_list'),
+                reverse('recipeapp:recipe_detail', kwargs={'pk': self.recipe.pk})]
+        for url in urls:
+            self.assertContains(self.client.get(url), 'Борщ')
+            # Повторный запрос отдается из кеша без обращения к базе
+            with self.assertNumQueries(0):
+                self.assertContains(self.client.get(url), 'Борщ')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.name = 'Щи'
+            self.recipe.save()
+        for url in urls:
+            response = self.client.get(url)
+            self.assertContains(response, 'Щи')
+            self.assertNotContains(response, 'Борщ')
+
+    def test_deploy_requires_shared_cache(self):
+        self.assertEqual([error.id for error in check_shared_cache(None)], ['recipeapp.E001'])
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}
+        with override_settings(CACHES=redis):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class GenerateFixtureDataTestCase(TestCase):
+    def test_generated_data_is_consistent(self):
+        call_command('generate_fixture_data', users=5, ingredients=30, recipes=40, batch_size=15, stdout=StringIO())
+
+        self.assertEqual(Recipe.objects.count(), 40)
+        self.assertFalse(Recipe.objects.filter(recipe_ingredients__isnull=True).exists())
+        self.assertFalse(Recipe.objects.filter(categories__isnull=True).exists())
+        # Агрегаты рейтинга пересчитаны по созданным оценкам
+        self.assertEqual(sum(Recipe.objects.values_list('rating_count', flat=True)), Rating.objects.count())
+
+
+@override_settings(RECIPE_PROFILING=True)
+class ProfilingMiddlewareTestCase(TestCase):
+    def setUp(self):
+        registry.reset()
+
+    def test_server_timing_and_metrics(self):
+        response = self.client.get(reverse('recipeapp:recipe_index'))
+        self.assertIn('sql;dur=', response['Server-Timing'])
+
+        self.client.force_login(User.objects.create_user(username='admin', is_staff=True))
+        metrics = self.client.get(reverse('recipeapp:profiling_metrics')).json()
+        self.assertEqual(metrics['recipeapp:recipe_index']['requests'], 1)
+        self.assertGreater(metrics['recipeapp:recipe_index']['avg_ms']['template'], 0)
+
+        response = self.client.get(reverse('recipeapp:profiling_metrics'), {'format': 'prometheus'})
+        self.assertIn('recipeapp_requests_total{view="recipeapp:recipe_index"}', response.content.decode())
+
+
+class IndexUsageTestCase(TestCase):
+    """
+    Ленты сортируются по индексам, а не во временном B-дереве.
+    """
+    def assertUsesIndex(self, queryset, index_name):
+        if connection.vendor != 'sqlite':
+            self.skipTest('План проверяется только для SQLite')
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_active_ingredients(self):
+        active = Ingredient.objects.filter(archived=False)
+        self.assertUsesIndex(active.order_by('name', 'id')[:50], 'ingredient_active_name_idx')
+        self.assertUsesIndex(
+            active.annotate(measure_key=EmptyIfNull('measure')).order_by('measure_key', 'id')[:50],
+            'ingredient_active_measure_idx',
+        )
+
+    def test_recipe_feed(self):
+        self.assertUsesIndex(Recipe.objects.order_by('-created_at', '-id')[:30], 'recipe_created_idx')
+
+
+class AsyncViewsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='cook')
+        cls.recipe = Recipe.objects.create(name='Борщ', description='Суп', instructions='Варить',
+                                           cooking_time=90, created_by=user)
+        cls.recipe.categories.add(Category.objects.create(name='Супы'))
+        RecipeIngredient.objects.create(recipe=cls.recipe, ingredient=Ingredient.objects.create(name='Свекла'),
+                                        quantity=2)
+        Comment.objects.create(recipe=cls.recipe, user=user, text='Очень вкусно')
+        index_recipes([cls.recipe.pk])
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_recipe_detail(self):
+        response = await self.async_client.get(reverse('recipeapp:recipe_detail_async', args=[self.recipe.pk]))
+        self.assertEqual(response.status_code, 200)
+        for text in ('Борщ', 'Супы', 'Свекла', 'Очень вкусно'):
+            self.assertContains(response, text)
+
+        response = await self.async_client.get(reverse('recipeapp:recipe_detail_async', args=[self.recipe.pk + 1]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_lists(self):
+        response = await self.async_client.get(reverse('recipeapp:recipe_index_async'), {'search': 'борщ'})
+        self.assertContains(response, 'Борщ')
+        response = await self.async_client.get(reverse('recipeapp:recipe_index_async'), {'search': 'пицца'})
+        self.assertContains(response, 'Рецептов пока нет')
+        response = await self.async_client.get(reverse('recipeapp:ingredient_list_async'), {'sort': '-measure'})
+        self.assertContains(response, 'Свекла')
+
+
+class RecipeAPITestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cook')
+        cls.recipe = Recipe.objects.create(name='Борщ', description='Суп', instructions='Варить',
+                                           cooking_time=90, created_by=cls.user)
+        cls.recipe.categories.add(Category.objects.create(name='Супы'))
+        RecipeIngredient.objects.create(recipe=cls.recipe, ingredient=Ingredient.objects.create(name='Свекла'),
+                                        quantity=2)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_field_selection(self):
+        response = self.client.get(reverse('recipeapp:api_recipe_list'), {'fields': 'id,name,categories'})
+        self.assertEqual(response.json()['results'], [{'id': self.recipe.pk, 'name': 'Борщ', 'categories': ['Супы']}])
+
+        response = self.client.get(reverse('recipeapp:api_recipe_detail', args=[self.recipe.pk]),
+                                   {'fields': 'ingredients,ratings'})
+        self.assertEqual(response.json(), {
+            'ingredients': [{'id': self.recipe.recipe_ingredients.get().ingredient_id, 'name': 'Свекла',
+                             'quantity': 2, 'measure': ''}],
+            'ratings': {'average': None, 'count': 0, 'distribution': {}},
+        })
+
+        response = self.client.get(reverse('recipeapp:api_recipe_list'), {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_conditional_get(self):
+        url = reverse('recipeapp:api_recipe_detail', args=[self.recipe.pk])
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        set_rating(self.recipe.pk, self.user, 8)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['rate'], '8.00')
+
+
+class ThumbnailTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_generate_thumbnails(self):
+        buffer = BytesIO()
+        Image.new('RGB', (500, 300), 'red').save(buffer, format='JPEG')
+        recipe = Recipe.objects.create(
+            name='Пицца', description='Описание', instructions='Печь', cooking_time=20,
+            created_by=User.objects.create_user(username='cook'),
+            image=SimpleUploadedFile('pizza.jpg', buffer.getvalue(), content_type='image/jpeg'),
+        )
+        self.assertIn('<img src="/media/recipes/pizza', recipe_image(recipe, 'card'))
+
+        generate_thumbnails(recipe.pk)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_variants['widths'], [100, 200, 400])
+        names = variant_names(recipe.image_variants)
+        self.assertEqual(len(names), 6)
+        self.assertTrue(all(default_storage.exists(name) for name in names))
+        self.assertIn('srcset="/media/recipes/pizza_100w.webp 100w', recipe_image(recipe, 'card'))
+
+        # Пересоздание копий того же изображения не удаляет используемые файлы
+        generate_thumbnails(recipe.pk, force=True)
+        self.assertTrue(all(default_storage.exists(name) for name in names))
+
+        # При замене изображения старые копии доступны, пока не записаны новые
+        buffer = BytesIO()
+        Image.new('RGB', (300, 200), 'blue').save(buffer, format='JPEG')
+        recipe.image = SimpleUploadedFile('pasta.jpg', buffer.getvalue(), content_type='image/jpeg')
+        recipe.save()
+        old_exists = []
+
+        def store(*args):
+            old_exists.append(all(default_storage.exists(name) for name in names))
+            return store_variants(*args)
+
+        with mock.patch('recipeapp.images.store_variants', side_effect=store):
+            generate_thumbnails(recipe.pk)
+        self.assertEqual(old_exists, [True])
+        self.assertFalse(any(default_storage.exists(name) for name in names))
+        recipe.refresh_from_db()
+        names = variant_names(recipe.image_variants)
+        self.assertTrue(all(default_storage.exists(name) for name in names))
+
+        recipe.image = None
+        recipe.save()
+        generate_thumbnails(recipe.pk)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_variants, {})
+        self.assertFalse(any(default_storage.exists(name) for name in names))
+
+
+@task(max_attempts=2)
+def record_task_call(name, fail=False):
+    if fail:
+        raise ValueError('Ошибка задачи')
+    Category.objects.create(name=name)
+
+
+class TaskQueueTestCase(TestCase):
+    def test_enqueued_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            record_task_call.delay('Выпечка')
+            self.assertFalse(Task.objects.exists())
+        for callback in callbacks:
+            callback()
+
+        task_record = Task.objects.get()
+        self.assertEqual(task_record.payload, {'args': ['Выпечка'], 'kwargs': {}})
+        self.assertEqual(run_pending(), 1)
+        task_record.refresh_from_db()
+        self.assertEqual(task_record.status, Task.DONE)
+        self.assertTrue(Category.objects.filter(name='Выпечка').exists())
+
+    def test_retry_then_fail(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record_task_call.delay('Супы', fail=True)
+
+        with self.assertLogs('recipeapp.tasks', 'ERROR'):
+            run_pending()
+        task_record = Task.objects.get()
+        self.assertEqual((task_record.status, task_record.attempts), (Task.PENDING, 1))
+        self.assertGreater(task_record.run_at, timezone.now())
+        self.assertIn('Ошибка задачи', task_record.last_error)
+
+        # Повтор запускается только после задержки
+        self.assertEqual(run_pending(), 0)
+        Task.objects.update(run_at=timezone.now())
+        with self.assertLogs('recipeapp.tasks', 'ERROR'):
+            run_pending()
+        task_record.refresh_from_db()
+        self.assertEqual((task_record.status, task_record.attempts), (Task.FAILED, 2))
+        self.assertFalse(Category.objects.exists())
+
+
+class RecommendationsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cook')
+        cls.ingredients = Ingredient.objects.bulk_create([Ingredient(name=f'Продукт {i}') for i in range(6)])
+        cls.recipes = Recipe.objects.bulk_create([
+            Recipe(name=f'Рецепт {i}', description='', instructions='', cooking_time=10, created_by=cls.user)
+            for i in range(4)
+        ])
+        compositions = [(0, 1, 2, 3), (0, 1, 2), (0, 4), (5,)]
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipe, ingredient=cls.ingredients[i])
+            for recipe, composition in zip(cls.recipes, compositions) for i in composition
+        ])
+
+    def neighbors(self, recipe):
+        return [(row.neighbor.name, round(row.similarity, 2)) for row in similar_recipes(recipe.pk)]
+
+    def test_rebuild_and_incremental_refresh(self):
+        rebuild_neighbors()
+        first, second, third, fourth = self.recipes
+        self.assertEqual(self.neighbors(first), [('Рецепт 1', 0.75), ('Рецепт 2', 0.2)])
+        self.assertEqual(self.neighbors(fourth), [])
+
+        # Четвертый рецепт получает ингредиенты первого: фоновая задача обновляет оба списка
+        with self.captureOnCommitCallbacks(execute=True):
+            save_recipe_ingredients(fourth, {ingredient.pk: 1 for ingredient in self.ingredients[:4]})
+        run_pending()
+        self.assertEqual(self.neighbors(fourth)[0], ('Рецепт 0', 1.0))
+        self.assertEqual(self.neighbors(first)[0], ('Рецепт 3', 1.0))
+
+        with self.assertNumQueries(1):
+            list(similar_recipes(first.pk))
+
+
+class PantryTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cook')
+        cls.flour, cls.eggs, cls.milk, cls.nuts = Ingredient.objects.bulk_create(
+            [Ingredient(name=name) for name in ('Мука', 'Яйца', 'Молоко', 'Орехи')]
+        )
+        cls.pancakes, cls.omelette, cls.cake = Recipe.objects.bulk_create([
+            Recipe(name=name, description='', instructions='', cooking_time=10, created_by=cls.user)
+            for name in ('Блины', 'Омлет', 'Торт')
+        ])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipe, ingredient=ingredient)
+            for recipe, ingredients in (
+                (cls.pancakes, (cls.flour, cls.eggs, cls.milk)),
+                (cls.omelette, (cls.eggs, cls.milk)),
+                (cls.cake, (cls.flour, cls.eggs, cls.nuts)),
+            )
+            for ingredient in ingredients
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_find_ranks_by_coverage(self):
+        matches = pantry.find_recipes([self.eggs.pk, self.milk.pk])
+        self.assertEqual([(match.recipe_id, match.covered, match.total) for match in matches],
+                         [(self.omelette.pk, 2, 2), (self.pancakes.pk, 2, 3)])
+        self.assertEqual(matches[1].missing, [self.flour.pk])
+
+        matches = pantry.find_recipes([self.flour.pk, self.eggs.pk], exclude=[self.nuts.pk], min_coverage=0.1)
+        self.assertNotIn(self.cake.pk, [match.recipe_id for match in matches])
+
+    def test_index_follows_ingredient_changes(self):
+        pantry.find_recipes([self.eggs.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            save_recipe_ingredients(self.cake, {self.eggs.pk: 1, self.milk.pk: 1})
+        matches = pantry.find_recipes([self.eggs.pk, self.milk.pk], min_coverage=1)
+        self.assertEqual({match.recipe_id for match in matches}, {self.omelette.pk, self.cake.pk})
+
+    def test_views(self):
+        response = self.client.get(reverse('recipeapp:pantry'), {'ingredient': [self.eggs.pk, self.milk.pk]})
+        self.assertContains(response, 'Омлет')
+        self.assertContains(response, 'Не хватает: Мука')
+
+        response = self.client.get(reverse('recipeapp:api_pantry'),
+                                   {'ingredients': f'{self.eggs.pk},{self.milk.pk}', 'min_coverage': 1})
+        self.assertEqual(response.json()['results'], [
+            {'id': self.omelette.pk, 'name': 'Омлет', 'coverage': 1.0, 'covered': 2, 'total': 2, 'missing': []},
+        ])
+        self.assertEqual(self.client.get(reverse('recipeapp:api_pantry'), {'ingredients': 'x'}).status_code, 400)
+
+
+class CommentsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cook', password='secret')
+        cls.recipe = Recipe.objects.create(name='Борщ', description='', instructions='', cooking_time=60,
+                                           created_by=cls.user)
+        for i in range(COMMENTS_PER_PAGE + 5):
+            add_comment(cls.recipe.pk, cls.user, f'Комментарий №{i}')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_count_follows_changes(self):
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.comment_count, COMMENTS_PER_PAGE + 5)
+
+        self.client.force_login(self.user)
+        self.client.post(reverse('recipeapp:add_comment', kwargs={'pk': self.recipe.pk}), {'text': 'Еще один'})
+        Comment.objects.filter(text='Комментарий №0').delete()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.comment_count, COMMENTS_PER_PAGE + 5)
+
+    def test_first_page_inlined_and_rest_loaded(self):
+        response = self.client.get(reverse('recipeapp:recipe_detail', kwargs={'pk': self.recipe.pk}))
+        page = response.context['comments_page']
+        self.assertEqual([comment.text for comment in page],
+                         [f'Комментарий №{i}' for i in range(COMMENTS_PER_PAGE)])
+        self.assertContains(response, 'Показать еще')
+
+        response = self.client.get(reverse('recipeapp:recipe_comments', kwargs={'pk': self.recipe.pk}),
+                                   {'cursor': page.next_cursor})
+        self.assertEqual([comment.text for comment in response.context['comments_page']],
+                         [f'Комментарий №{i}' for i in range(COMMENTS_PER_PAGE, COMMENTS_PER_PAGE + 5)])
+        self.assertNotContains(response, 'Показать еще')
+
+
+class FacetCountsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cook', password='secret')
+        cls.soups = Category.objects.create(name='Супы')
+        cls.salads = Category.objects.create(name='Салаты')
+        cls.borscht = Recipe.objects.create(name='Борщ', description='Свекла', instructions='', cooking_time=60,
+                                            created_by=cls.user)
+        cls.olivier = Recipe.objects.create(name='Оливье', description='Картофель', instructions='',
+                                            cooking_time=30, created_by=cls.user)
+        index_recipes([cls.borscht.pk, cls.olivier.pk])
+
+    def setUp(self):
+        cache.clear()
+
+    def counts(self):
+        return dict(CategoryRecipeCount.objects.values_list('category__name', 'count'))
+
+    def assertCounts(self, expected):
+        self.assertEqual(self.counts(), expected)
+        # Счетчики, поддерживаемые сигналами, совпадают с пересчитанными
+        refresh_counts()
+        self.assertEqual(self.counts(), expected)
+
+    def test_counts_follow_links_archive_and_delete(self):
+        self.borscht.categories.add(self.soups, self.salads)
+        self.soups.recipes.add(self.olivier)
+        self.assertCounts({'Супы': 2, 'Салаты': 1})
+
+        # Удаление несвязанной категории счетчики не меняет
+        self.olivier.categories.remove(self.soups, self.salads)
+        self.assertCounts({'Супы': 1, 'Салаты': 1})
+
+        self.olivier.categories.add(self.salads)
+        self.borscht.archived = True
+        self.borscht.save()
+        self.assertCounts({'Супы': 0, 'Салаты': 1})
+
+        self.borscht.archived = False
+        self.borscht.save()
+        self.salads.recipes.clear()
+        self.assertCounts({'Супы': 1, 'Салаты': 0})
+
+        self.borscht.delete()
+        self.assertCounts({'Супы': 0, 'Салаты': 0})
+
+    def test_index_facets_one_query(self):
+        self.borscht.categories.add(self.soups)
+        with self.assertNumQueries(1):
+            facets = category_facets()
+        self.assertEqual([(facet['name'], facet['recipe_total']) for facet in facets],
+                         [('Салаты', 0), ('Супы', 1)])
+
+        response = self.client.get(reverse('recipeapp:recipe_index'))
+        self.assertEqual(list(response.context['categories']), facets)
+
+    def test_search_facets(self):
+        self.borscht.categories.add(self.soups)
+        self.olivier.categories.add(self.salads, self.soups)
+        facets = category_facets(parse_filters(QueryDict('search=картофель')))
+        self.assertEqual([(facet['name'], facet['recipe_total']) for facet in facets],
+                         [('Салаты', 1), ('Супы', 1)])
+        with self.assertNumQueries(0):
+            self.assertEqual(category_facets(parse_filters(QueryDict('search=картофель'))), facets)
+
+        response = self.client.get(reverse('recipeapp:recipe_index'), {'search': 'свекла'})
+        self.assertContains(response, f'?search=%D1%81%D0%B2%D0%B5%D0%BA%D0%BB%D0%B0&amp;category={self.soups.pk}')
+
+
+class RecipeFiltersTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cook', password='secret')
+        cls.other = User.objects.create_user(username='baker', password='secret')
+        cls.soups, cls.hot, cls.quick = Category.objects.bulk_create(
+            [Category(name='Супы'), Category(name='Горячее'), Category(name='Быстро')]
+        )
+        cls.beet, cls.meat = Ingredient.objects.bulk_create([Ingredient(name='Свекла'), Ingredient(name='Мясо')])
+
+        def create(name, cooking_time, categories, ingredients, user=cls.user, rate=0):
+            recipe = Recipe.objects.create(name=name, description='', instructions='', cooking_time=cooking_time,
+                                           created_by=user, rate=rate)
+            recipe.categories.set(categories)
+            for ingredient in ingredients:
+                RecipeIngredient.objects.create(recipe=recipe, ingredient=ingredient, quantity=1)
+            return recipe
+
+        cls.borscht = create('Борщ', 90, [cls.soups, cls.hot], [cls.beet, cls.meat], rate=8)
+        cls.broth = create('Бульон', 40, [cls.soups, cls.hot, cls.quick], [cls.meat], rate=5)
+        cls.salad = create('Винегрет', 20, [cls.quick], [cls.beet], user=cls.other)
+
+    def names(self, query):
+        return sorted(filter_recipes(Recipe.objects.all(), QueryDict(query)).values_list('name', flat=True))
+
+    def test_canonical_key(self):
+        key = parse_filters(QueryDict(f'search=  борщ   со  сметаной&category={self.hot.pk}&category={self.soups.pk}'
+                                      f',{self.hot.pk}&rating_min=7.50&utm=x')).key
+        self.assertEqual(key, parse_filters(QueryDict(f'category={self.soups.pk},{self.hot.pk}&rating_min=7.5'
+                                                      f'&search=борщ со сметаной')).key)
+        self.assertEqual(parse_filters(QueryDict(f'category={self.soups.pk}&category_match=all')).key,
+                         f'category={self.soups.pk}')
+        self.assertTrue(parse_filters(QueryDict('utm=x&category_match=all')).is_empty())
+
+    def test_combined_filters_without_duplicates(self):
+        categories = f'category={self.soups.pk},{self.hot.pk},{self.quick.pk}'
+        self.assertEqual(self.names(categories), ['Борщ', 'Бульон', 'Винегрет'])
+        self.assertEqual(self.names(f'{categories}&category_match=all'), ['Бульон'])
+        self.assertEqual(self.names('time_min=30&time_max=60'), ['Бульон'])
+        self.assertEqual(self.names('rating_min=6'), ['Борщ'])
+        self.assertEqual(self.names(f'author={self.other.pk}'), ['Винегрет'])
+        self.assertEqual(self.names(f'ingredient={self.beet.pk},{self.meat.pk}'), ['Борщ'])
+        self.assertEqual(self.names(f'exclude_ingredient={self.beet.pk}&category={self.hot.pk}'), ['Бульон'])
+
+        # Фильтры по связям - условия EXISTS, без JOIN и DISTINCT
+        sql = str(filter_recipes(Recipe.objects.all(), QueryDict(f'{categories}&ingredient={self.beet.pk}')).query)
+        self.assertIn('EXISTS', sql)
+        self.assertNotIn('JOIN', sql)
+        self.assertNotIn('DISTINCT', sql)
+
+    def test_invalid_filters(self):
+        for query in ('category=abc', 'time_min=60&time_max=10', 'category_match=some', 'rating_min=x'):
+            with self.assertRaises(ValueError):
+                parse_filters(QueryDict(query))
+        self.assertEqual(self.client.get(reverse('recipeapp:recipe_index'), {'time_min': '-1'}).status_code, 400)
+        response = self.client.get(reverse('recipeapp:api_recipe_list'), {'category': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ArchivedRecordsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cook', password='secret')
+        cls.live = Recipe.objects.create(name='Борщ', description='', instructions='', cooking_time=60,
+                                         created_by=cls.user)
+        cls.old = Recipe.objects.create(name='Холодец', description='', instructions='', cooking_time=300,
+                                        created_by=cls.user)
+        cls.soups = Category.objects.create(name='Супы')
+        cls.old.categories.add(cls.soups)
+        cls.aspic = Ingredient.objects.create(name='Желатин', measure='г', archived=True)
+        cls.beet = Ingredient.objects.create(name='Свекла', measure='г', archived=True)
+        RecipeIngredient.objects.create(recipe=cls.old, ingredient=cls.aspic, quantity=20)
+        RecipeIngredient.objects.create(recipe=cls.live, ingredient=cls.beet, quantity=300)
+        add_comment(cls.old.pk, cls.user, 'Как у бабушки')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_archived_at_follows_archived(self):
+        self.old.archived = True
+        self.old.save()
+        self.assertIsNotNone(self.old.archived_at)
+        self.old.archived = False
+        self.old.save()
+        self.assertIsNone(self.old.archived_at)
+
+        self.assertEqual(Recipe.objects.filter(pk=self.old.pk).archive(), 1)
+        self.assertIsNotNone(Recipe.objects.get(pk=self.old.pk).archived_at)
+        self.assertEqual(list(Recipe.active.all()), [self.live])
+
+    def test_views_show_only_active(self):
+        Recipe.objects.filter(pk=self.old.pk).archive()
+        response = self.client.get(reverse('recipeapp:recipe_index'))
+        self.assertEqual([recipe.name for recipe in response.context['recipes']], ['Борщ'])
+        response = self.client.get(reverse('recipeapp:recipe_detail', kwargs={'pk': self.old.pk}))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('recipeapp:api_recipe_detail', kwargs={'pk': self.old.pk}))
+        self.assertEqual(response.status_code, 404)
+
+        # Лента рецептов читает частичный индекс, в котором нет архивных рецептов
+        plan = Recipe.active.order_by('-created_at', '-id')[:30].explain()
+        self.assertIn('recipe_active_created_idx', plan)
+
+    def test_admin_archive_invalidates_detail(self):
+        urls = [reverse('recipeapp:recipe_detail', kwargs={'pk': self.old.pk}),
+                reverse('recipeapp:api_recipe_detail', kwargs={'pk': self.old.pk})]
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        admin_user = User.objects.create_user(username='admin', is_staff=True, is_superuser=True)
+        changelist = reverse('admin:recipeapp_recipe_changelist')
+        for action, status_code in (('mark_archived', 404), ('mark_unarchived', 200)):
+            self.client.force_login(admin_user)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(changelist, {'action': action, '_selected_action': [self.old.pk]})
+            self.client.logout()
+            for url in urls:
+                # Страница из кеша не переживает перенос рецепта в архив и обратно
+                self.assertEqual(self.client.get(url).status_code, status_code)
+
+    def test_cold_storage(self):
+        Recipe.objects.filter(pk=self.old.pk).archive()
+        Recipe.objects.filter(pk=self.old.pk).update(archived_at=timezone.now() - timedelta(days=400))
+        Ingredient.objects.update(archived_at=timezone.now() - timedelta(days=400))
+
+        out = StringIO()
+        call_command('archive_cold_storage', '--dry-run', stdout=out)
+        self.assertIn('Рецептов для переноса: 1', out.getvalue())
+        self.assertTrue(Recipe.objects.filter(pk=self.old.pk).exists())
+
+        call_command('archive_cold_storage', stdout=StringIO())
+        self.assertFalse(Recipe.objects.filter(pk=self.old.pk).exists())
+        self.assertFalse(Comment.objects.filter(text='Как у бабушки').exists())
+        data = RecipeArchive.objects.get(pk=self.old.pk).data
+        self.assertEqual(data['categories'], ['Супы'])
+        self.assertEqual(data['ingredients'], [{'name': 'Желатин', 'quantity': 20, 'measure': 'г'}])
+        self.assertEqual(data['comments'][0]['text'], 'Как у бабушки')
+
+        # Желатин освободился вместе с рецептом, свекла еще используется
+        self.assertEqual(list(IngredientArchive.objects.values_list('name', flat=True)), ['Желатин'])
+        self.assertTrue(Ingredient.objects.filter(pk=self.beet.pk).exists())
+        self.assertTrue(Recipe.objects.filter(pk=self.live.pk).exists())
+        self.assertLess(cold_storage_cutoff(), timezone.now())
+
+
+class RateLimitTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.other = [User.objects.create_user(username=name) for name in ('cook', 'guest')]
+        cls.recipe = Recipe.objects.create(name='Борщ', description='', instructions='', cooking_time=60,
+                                           created_by=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_token_bucket(self):
+        state, wait = take_token(None, 2, 60, 0)
+        state, wait = take_token(state, 2, 60, 0)
+        self.assertEqual(wait, 0)
+        state, wait = take_token(state, 2, 60, 0)
+        self.assertEqual(wait, 30)
+        self.assertEqual(take_token(state, 2, 60, 30)[1], 0)
+
+    @override_settings(RECIPE_RATE_LIMITS={'rating': (2, 60)})
+    def test_rate_recipe_is_limited(self):
+        self.client.force_login(self.user)
+        url = reverse('recipeapp:rate_recipe', kwargs={'pk': self.recipe.pk})
+        statuses = [self.client.post(url, {'rating': 5}).status_code for _ in range(3)]
+        self.assertEqual(statuses, [302, 302, 429])
+        self.assertEqual(self.client.post(url, {'rating': 5})['Retry-After'], '30')
+        # Комментарии ограничиваются отдельно
+        response = self.client.post(reverse('recipeapp:add_comment', kwargs={'pk': self.recipe.pk}), {'text': 'Ок'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_rate_recipe_validates_value(self):
+        self.client.force_login(self.user)
+        url = reverse('recipeapp:rate_recipe', kwargs={'pk': self.recipe.pk})
+        for value in ('11', '-1', 'пять', '4.5', ''):
+            self.assertEqual(self.client.post(url, {'rating': value}).status_code, 400)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertFalse(Rating.objects.exists())
+        self.assertEqual(self.client.post(url, {'rating': 10}).status_code, 302)
+        self.assertEqual(Rating.objects.get(user=self.user).value, 10)
+
+    @override_settings(RECIPE_RATING_COALESCE_SECONDS=60)
+    def test_ratings_are_coalesced(self):
+        set_rating(self.recipe.pk, self.other, 2)
+        url = reverse('recipeapp:rate_recipe', kwargs={'pk': self.recipe.pk})
+        for user, value in ((self.user, 4), (self.other, 8), (self.user, 10)):
+            self.client.force_login(user)
+            self.client.post(url, {'rating': value})
+        self.assertEqual(Rating.objects.get(user=self.other).value, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(rating_buffer.flush(), 2)
+        self.recipe.refresh_from_db()
+        self.assertEqual((self.recipe.rating_count, self.recipe.rating_sum, self.recipe.rate), (2, 18, 9))
+
+
+class ShoppingListTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='cook')
+        flour_g, flour_kg, milk, eggs = Ingredient.objects.bulk_create([
+            Ingredient(name='Мука', measure='г'),
+            Ingredient(name='мука ', measure='кг'),
+            Ingredient(name='Молоко', measure='мл'),
+            Ingredient(name='Яйца', measure='шт.'),
+        ])
+        cls.pancakes, cls.bread = Recipe.objects.bulk_create([
+            Recipe(name=name, description='', instructions='', cooking_time=10, created_by=user)
+            for name in ('Блины', 'Хлеб')
+        ])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=cls.pancakes, ingredient=flour_g, quantity=250),
+            RecipeIngredient(recipe=cls.pancakes, ingredient=milk, quantity=500),
+            RecipeIngredient(recipe=cls.pancakes, ingredient=eggs, quantity=2),
+            RecipeIngredient(recipe=cls.bread, ingredient=flour_kg, quantity=1),
+        ])
+
+    def test_aggregates_with_unit_conversion(self):
+        plan = parse_plan([str(self.pancakes.pk), str(self.bread.pk)], ['2'])
+        with self.assertNumQueries(1):
+            shopping_list = build_shopping_list(plan)
+        self.assertEqual(
+            [(item.name, str(item.quantity), item.unit, len(item.recipe_ids)) for item in shopping_list.items],
+            [('Молоко', '1', 'л', 1), ('Мука', '1.5', 'кг', 2), ('Яйца', '4', 'шт', 1)],
+        )
+        with self.assertRaises(ValueError):
+            parse_plan(['1'], ['0'])
+
+    def test_views(self):
+        url = reverse('recipeapp:shopping_list')
+        query = {'recipe': [self.pancakes.pk, self.bread.pk], 'servings': ['0.5', '1']}
+        self.assertContains(self.client.get(url, query), '1.13 кг')
+
+        response = self.client.get(url, {**query, 'format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('Мука,1.13,кг,2', response.content.decode())
+        self.assertContains(self.client.get(url, {**query, 'format': 'text'}), '- Молоко: 250 мл')
+        self.assertEqual(self.client.get(url, {'recipe': 'x', 'format': 'csv'}).status_code, 400)
+
+        response = self.client.get(reverse('recipeapp:api_shopping_list'), query)
+        self.assertEqual(response.json()['items'][1]['quantity'], 1.13)
+        self.assertEqual(self.client.get(reverse('recipeapp:api_shopping_list')).status_code, 400)
+
+
+@override_settings(RECIPE_DB_REPLICAS=['replica1', 'replica2'])
+class ReplicaRoutingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def route(self, request, write=False):
+        """
+        Пропускает запрос через ReplicaMiddleware и возвращает базы для чтения до и после записи.
+        """
+        seen = []
+
+        def view(request):
+            seen.append((router.db_for_read(Recipe), router.db_for_read(User)))
+            if write:
+                router.db_for_write(Comment)
+                seen.append((router.db_for_read(Recipe), router.db_for_read(User)))
+            return HttpResponse()
+
+        response = ReplicaMiddleware(view)(request)
+        return seen, response
+
+    def test_reads_go_to_replica(self):
+        seen, response = self.route(self.factory.get('/'))
+        recipe_db, user_db = seen[0]
+        self.assertIn(recipe_db, ('replica1', 'replica2'))
+        self.assertEqual(user_db, 'default')
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+        def read_in_transaction(request):
+            with transaction.atomic():
+                return HttpResponse(router.db_for_read(Recipe))
+
+        self.assertEqual(ReplicaMiddleware(read_in_transaction)(self.factory.get('/')).content, b'default')
+        # Вне запроса (команды, фоновые задачи) чтение идет в основную базу
+        self.assertEqual(router.db_for_read(Recipe), 'default')
+
+    def test_writes_pin_to_primary(self):
+        seen, response = self.route(self.factory.post('/'))
+        self.assertEqual(seen, [('default', 'default')])
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+        seen, response = self.route(self.factory.get('/'), write=True)
+        self.assertEqual(seen[1], ('default', 'default'))
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+        request = self.factory.get('/')
+        request.COOKIES[STICKY_COOKIE] = '1'
+        self.assertEqual(self.route(request)[0], [('default', 'default')])
+
+    def test_recent_change_reads_primary(self):
+        recipe_cache.bump(recipe_cache.RECIPES)
+        self.assertEqual(self.route(self.factory.get('/'))[0], [('default', 'default')])
+        with override_settings(RECIPE_DB_REPLICA_LAG=0):
+            self.assertIn(self.route(self.factory.get('/'))[0][0][0], ('replica1', 'replica2'))
+
+
+class ImportRecipesTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='stasy', password='secret')
+        cls.soups = Category.objects.create(name='Супы')
+        cls.beet = Ingredient.objects.create(name='Свекла', measure='г')
+        for index in range(3):
+            recipe = Recipe.objects.create(name=f'Борщ {index}', description='Красный', instructions='Варить',
+                                           cooking_time=60 + index, created_by=cls.user)
+            recipe.categories.add(cls.soups)
+            RecipeIngredient.objects.create(recipe=recipe, ingredient=cls.beet, quantity=300 + index)
+
+    def setUp(self):
+        cache.clear()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def snapshot(self):
+        return [
+            (record['id'], record['name'], record['cooking_time'], record['categories'], record['ingredients'])
+            for record in iter_recipe_records(Recipe.objects.all())
+        ]
+
+    def round_trip(self, file_format):
+        path = f'{self.tmpdir}/recipes.{file_format}'
+        before = self.snapshot()
+        call_command('export_recipes', '--format', file_format, '--output', path, stdout=StringIO(),
+                     stderr=StringIO())
+        # Повторный импорт выгрузки обновляет те же рецепты, а не добавляет копии
+        stale = timezone.now() - timedelta(days=1)
+        Recipe.objects.update(name='Изменен', cooking_time=1, updated_at=stale)
+        out = StringIO()
+        call_command('import_recipes', path, '--format', file_format, stdout=out)
+        self.assertIn('Успешно импортировано рецептов: 3, пропущено строк: 0', out.getvalue())
+        self.assertEqual(self.snapshot(), before)
+        self.assertFalse(Recipe.objects.filter(updated_at__lte=stale).exists())
+        self.assertEqual(RecipeIngredient.objects.count(), 3)
+
+    def test_jsonl_round_trip(self):
+        self.round_trip('jsonl')
+
+    def test_csv_round_trip(self):
+        self.round_trip('csv')
+
+    def test_bad_rows_are_reported(self):
+        path = f'{self.tmpdir}/recipes.jsonl'
+        with open(path, 'w', encoding='utf-8') as output:
+            output.write('{"name": "Окрошка", "categories": ["Супы"]}\n')
+            output.write('{"description": "x"}\n')
+            output.write('не JSON\n')
+            output.write('{"name": "Щи", "cooking_time": "долго"}\n')
+            output.write('{"name": "Уха", "ingredients": [{"name": "Рыба", "quantity": 1}]}\n')
+        out = StringIO()
+        call_command('import_recipes', path, stdout=out)
+        self.assertIn('Строка 2 пропущена: нет названия рецепта', out.getvalue())
+        self.assertIn('Строка 3 пропущена', out.getvalue())
+        self.assertIn('Строка 4 пропущена: cooking_time', out.getvalue())
+        self.assertIn('пропущено строк: 3', out.getvalue())
+        self.assertEqual(sorted(Recipe.objects.filter(name__in=['Окрошка', 'Уха']).values_list('name', flat=True)),
+                         ['Окрошка', 'Уха'])
+        self.assertEqual(Recipe.objects.count(), 5)
+
+    def test_batch_boundaries(self):
+        path = f'{self.tmpdir}/recipes.jsonl'
+        with open(path, 'w', encoding='utf-8') as output:
+            for index in range(5):
+                output.write(f'{{"name": "Салат {index}", "categories": ["Салаты"], '
+                             f'"ingredients": [{{"name": "Огурец", "quantity": {index + 1}}}]}}\n')
+        call_command('import_recipes', path, '--batch-size', '2', stdout=StringIO())
+        salads = Recipe.objects.filter(categories__name='Салаты')
+        self.assertEqual(salads.count(), 5)
+        self.assertEqual(Category.objects.filter(name='Салаты').count(), 1)
+        self.assertEqual(Ingredient.objects.filter(name='Огурец').count(), 1)
+        self.assertEqual(sorted(RecipeIngredient.objects.filter(ingredient__name='Огурец')
+                                .values_list('quantity', flat=True)), [1, 2, 3, 4, 5])
+        self.assertEqual(CategoryRecipeCount.objects.get(category__name='Салаты').count, 5)
+
+
+class ExportRecipesTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='stasy', password='secret')
+        cls.soups = Category.objects.create(name='Супы')
+        cls.beet = Ingredient.objects.create(name='Свекла', measure='г')
+        cls.recipe = Recipe.objects.create(name='Борщ', description='Красный', instructions='Варить',
+                                           cooking_time=60, created_by=cls.user)
+        cls.recipe.categories.add(cls.soups)
+        RecipeIngredient.objects.create(recipe=cls.recipe, ingredient=cls.beet, quantity=300)
+        Recipe.objects.create(name='Холодец', description='', instructions='', cooking_time=300,
+                              created_by=cls.user, archived=True)
+
+    def export(self, *args):
+        out = StringIO()
+        call_command('export_recipes', *args, stdout=out)
+        return out.getvalue().splitlines()
+
+    def test_rows(self):
+        lines = self.export()
+        self.assertEqual(len(lines), 1)
+        record = json.loads(lines[0])
+        self.assertEqual(record['id'], self.recipe.pk)
+        self.assertEqual(record['name'], 'Борщ')
+        self.assertEqual(record['created_by'], 'stasy')
+        self.assertEqual(record['categories'], ['Супы'])
+        self.assertEqual(record['ingredients'], [{'name': 'Свекла', 'quantity': 300, 'measure': 'г'}])
+
+        header, row = self.export('--format', 'csv')
+        self.assertEqual(header.split(';'), RECIPE_FIELDS)
+        self.assertIn(';Супы;Свекла:300:г', row)
+        self.assertEqual(len(self.export('--include-archived')), 2)
+
+    def test_query_count_does_not_grow(self):
+        # Запрос рецептов и по одному запросу категорий и ингредиентов на порцию
+        with self.assertNumQueries(3):
+            self.export('--chunk-size', '100')
+        for index in range(10):
+            recipe = Recipe.objects.create(name=f'Суп {index}', description='', instructions='', cooking_time=30,
+                                           created_by=self.user)
+            recipe.categories.add(self.soups)
+            RecipeIngredient.objects.create(recipe=recipe, ingredient=self.beet, quantity=index + 1)
+        with self.assertNumQueries(3):
+            self.assertEqual(len(self.export('--chunk-size', '100')), 11)
+        # 11 рецептов порциями по 5 - три порции
+        with self.assertNumQueries(1 + 2 * 3):
+            self.export('--chunk-size', '5')
+
+    def test_admin_actions(self):
+        self.client.force_login(self.user)
+        url = reverse('admin:recipeapp_recipe_changelist')
+        for action, content_type in (('export_csv', 'text/csv'), ('export_jsonl', 'application/x-ndjson')):
+            response = self.client.post(url, {'action': action, '_selected_action': [self.recipe.pk]})
+            self.assertEqual(response['Content-Type'], content_type)
+            content = b''.join(response.streaming_content).decode()
+            self.assertIn('Свекла:300:г' if action == 'export_csv' else '"quantity": 300', content)
+            self.assertIn('Борщ', content)
+            self.assertNotIn('Холодец', content)
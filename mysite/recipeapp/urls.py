@@ -1,5 +1,5 @@
 from django.urls import path
-from recipeapp import views
+from recipeapp import api, views
 
 app_name = 'recipeapp'
 
@@ -14,7 +14,10 @@ urlpatterns = [
     path('recipes/<int:pk>/update/', views.RecipeUpdateView.as_view(), name='recipe_update'),
     path('recipes/<int:pk>/delete/', views.RecipeDeleteView.as_view(), name='recipe_delete'),
     path('recipe/<int:pk>/comment/', views.add_comment, name='add_comment'),
+    path('recipes/<int:pk>/comments/', views.RecipeCommentsView.as_view(), name='recipe_comments'),
     path('recipes/<int:pk>/rate/', views.rate_recipe, name='rate_recipe'),
+    path('pantry/', views.PantryView.as_view(), name='pantry'),
+    path('shopping-list/', views.ShoppingListView.as_view(), name='shopping_list'),
 
     # Ингредиенты
     path('ingredients/', views.IngredientListView.as_view(), name='ingredient_list'),
@@ -22,5 +25,21 @@ urlpatterns = [
     path('ingredients/create/', views.IngredientCreateView.as_view(), name='ingredient_create'),
     path('ingredients/<int:pk>/update/', views.IngredientUpdateView.as_view(), name='ingredient_update'),
     path('ingredients/delete/', views.IngredientDeleteView.as_view(), name='ingredient_delete'),
+
+    # Асинхронные варианты страниц для чтения (ASGI)
+    path('async/', views.AsyncRecipeIndexView.as_view(), name='recipe_index_async'),
+    path('async/recipes/<int:pk>/', views.AsyncRecipeDetailView.as_view(), name='recipe_detail_async'),
+    path('async/ingredients/', views.AsyncIngredientListView.as_view(), name='ingredient_list_async'),
+
+    # JSON API для чтения
+    path('api/recipes/', api.RecipeListAPIView.as_view(), name='api_recipe_list'),
+    path('api/recipes/<int:pk>/', api.RecipeDetailAPIView.as_view(), name='api_recipe_detail'),
+    path('api/ingredients/', api.IngredientListAPIView.as_view(), name='api_ingredient_list'),
+    path('api/ingredients/search/', api.IngredientSearchAPIView.as_view(), name='api_ingredient_search'),
+    path('api/pantry/', api.PantryAPIView.as_view(), name='api_pantry'),
+    path('api/shopping-list/', api.ShoppingListAPIView.as_view(), name='api_shopping_list'),
+
+    # Метрики профилирования (RECIPE_PROFILING)
+    path('metrics/', views.profiling_metrics, name='profiling_metrics'),
 ]
 
@@ -1,86 +1,117 @@
+import asyncio
+import csv
+
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpResponse, HttpRequest, HttpResponseRedirect
+from django.core.exceptions import BadRequest
+from django.http import Http404, HttpResponse, HttpRequest, HttpResponseBadRequest, HttpResponseRedirect, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.response import TemplateResponse
+from django.db import transaction
+from django.db.models import Prefetch
 from django.urls import reverse, reverse_lazy
+from django.utils.functional import SimpleLazyObject
 from django.views import View
-from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
-
-from recipeapp.forms import UserBioForm, IngredientForm, RecipeForm, RecipeIngredient
-from recipeapp.models import Ingredient, Recipe, Category, Comment, Rating
-
+from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, TemplateView
+
+from recipeapp import cache as recipe_cache
+from recipeapp import comments as recipe_comments
+from recipeapp import facets, pantry, shopping
+from recipeapp.cache import CachedPageMixin
+from recipeapp.filters import apply_filters, parse_filters
+from recipeapp.forms import UserBioForm, IngredientForm, RecipeForm, RecipeIngredient, RecipeIngredientFormSet
+from recipeapp.models import EmptyIfNull, Ingredient, Recipe, Category
+from recipeapp.pagination import KeysetPaginationMixin, aapproximate_count, approximate_count
+from recipeapp.profiling import profiling_enabled, registry, render_prometheus
+from recipeapp.ratelimit import ratelimit
+from recipeapp.ratings import parse_rating, submit_rating
+from recipeapp.recommendations import similar_recipes
+from recipeapp.services import save_recipe_ingredients
+
+
+class RecipeFilterMixin(CachedPageMixin, KeysetPaginationMixin):
+    cache_namespaces = (recipe_cache.RECIPES, recipe_cache.CATEGORIES)
+
+    def get_filters(self):
+        if not hasattr(self, '_filters'):
+            try:
+                self._filters = parse_filters(self.request.GET)
+            except ValueError as error:
+                raise BadRequest(str(error))
+        return self._filters
+
+    def get_cache_filter_key(self):
+        # Одинаковые фильтры, записанные по-разному, попадают в одну запись кеша
+        return f'{self.get_filters().key}&cursor={self.request.GET.get(self.cursor_param, "")}'
+
+    def get_keyset_ordering(self, queryset):
+        # Результаты поиска листаются в порядке релевантности, остальные — от новых к старым
+        if 'search_rank' in queryset.query.annotations:
+            return 'search_rank', 'id'
+        return super().get_keyset_ordering(queryset)
 
-class RecipeFilterMixin:
     def get_queryset(self):
-        queryset = super().get_queryset()
-
-        # Фильтрация по категории (если передана в URL)
-        category_id = self.request.GET.get('category')
-        if category_id:
-            queryset = queryset.filter(categories__id=category_id)
-
-        # Поиск по названию (если передан в URL)
-        search_query = self.request.GET.get('search')
-        if search_query:
-            queryset = queryset.filter(name__icontains=search_query)
+        return apply_filters(super().get_queryset(), self.get_filters())
 
-        return queryset
+    def get_facet_context(self):
+        # Панель категорий считается по остальным фильтрам, ссылки категорий сохраняют их.
+        # Внутри закешированного фрагмента категории не запрашиваются
+        facet_filters = self.get_filters().without_categories()
+        return {
+            'categories': SimpleLazyObject(lambda: facets.category_facets(facet_filters)),
+            'facet_query': facet_filters.key,
+        }
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = Category.objects.all()
-        context['total_recipes'] = self.get_queryset().count()
+        context.update(self.get_facet_context())
+        context['total_recipes'] = approximate_count(self.object_list)
 
         return context
 
 
 class RecipeIndexView(RecipeFilterMixin, ListView):
     model = Recipe
+    queryset = Recipe.active.all()
     template_name = 'recipeapp/recipe/recipe-index.html'
     context_object_name = 'recipes'
     paginate_by = 30
 
-    def get_queryset(self):
-        # Получаем параметр категории из запроса (например, ?category=1)
-        category_id = self.request.GET.get('category')
-        # Получаем параметр поиска из запроса (например, ?search=название)
-        search_query = self.request.GET.get('search')
-
-        queryset = Recipe.objects.all()
-        if category_id:
-            queryset = queryset.filter(categories__id=category_id)
-
-        if search_query:
-            queryset = queryset.filter(name__icontains=search_query)
-
-        return queryset
-
 
 class IngredientDetailsView(DetailView):
     template_name = 'recipeapp/ingredient/ingredient-details.html'
     context_object_name = 'ingredient'
 
     def get_queryset(self):
-        return Ingredient.objects.filter(archived=False)
+        return Ingredient.active.all()
 
 
-class IngredientListView(ListView):
+class IngredientListView(CachedPageMixin, KeysetPaginationMixin, ListView):
     template_name = 'recipeapp/ingredient/ingredient-list.html'
     context_object_name = 'ingredients'
     paginate_by = 50
+    cache_namespaces = (recipe_cache.INGREDIENTS,)
+    valid_sort_fields = ['name', 'measure', '-name', '-measure']
 
-    def get_queryset(self):
+    def get_sort(self):
         sort_by = self.request.GET.get('sort', 'name')
-
-        valid_sort_fields = ['name', 'measure', '-name', '-measure']
-        if sort_by not in valid_sort_fields:
+        if sort_by not in self.valid_sort_fields:
             sort_by = 'name'
-        return Ingredient.objects.filter(archived=False).order_by(sort_by)
+        return sort_by
+
+    def get_keyset_ordering(self, queryset):
+        # Единица измерения может быть пустой, поэтому курсор строится по measure_key без NULL
+        sort_by = self.get_sort().replace('measure', 'measure_key')
+        return sort_by, '-id' if sort_by.startswith('-') else 'id'
+
+    def get_queryset(self):
+        return Ingredient.active.annotate(measure_key=EmptyIfNull('measure'))
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['sort'] = self.request.GET.get('sort', 'name')  # Передаем текущую сортировку в шаблон
+        context['sort'] = self.get_sort()  # Передаем текущую сортировку в шаблон
         return context
 
 
@@ -96,7 +127,7 @@ class IngredientUpdateView(UpdateView):
     template_name_suffix = '_update_form'
 
     def get_success_url(self):
-        return reverse('recipeapp:ingredient_details', kwargs={'pk': self.object.pk})
+        return reverse('recipeapp:ingredient_detail', kwargs={'pk': self.object.pk})
 
     def form_valid(self, form):
         response = super().form_valid(form)
@@ -112,7 +143,8 @@ class IngredientDeleteView(View):
 
         if ingredient_ids:
             # Архивируем выбранные ингредиенты
-            Ingredient.objects.filter(id__in=ingredient_ids).update(archived=True)
+            Ingredient.objects.filter(id__in=ingredient_ids).archive()
+            recipe_cache.bump(recipe_cache.INGREDIENTS)
             messages.success(request, 'Выбранные ингредиенты успешно архивированы.')
         else:
             messages.error(request, 'Не выбрано ни одного ингредиента для архивирования.')
@@ -120,24 +152,252 @@ class IngredientDeleteView(View):
         return HttpResponseRedirect(self.success_url)
 
 
+def recipe_ingredients_prefetch():
+    # Ингредиенты рецепта вместе с продуктами одним запросом
+    return Prefetch('recipe_ingredients', queryset=RecipeIngredient.objects.select_related('ingredient'))
+
+
 class RecipeListView(RecipeFilterMixin, ListView):
     model = Recipe
+    queryset = Recipe.active.all()
     template_name = 'recipeapp/recipe/recipe-list.html'
     context_object_name = 'recipes'
     paginate_by = 10
 
+    def get_queryset(self):
+        # Связанные данные загружаются пакетно, число запросов не зависит от числа рецептов на странице
+        return (super().get_queryset()
+                .select_related('created_by')
+                .prefetch_related('categories', recipe_ingredients_prefetch()))
+
 
-class RecipeDetailView(DetailView):
+class RecipeDetailView(CachedPageMixin, DetailView):
     model = Recipe
     template_name = 'recipeapp/recipe/recipe-detail.html'
     context_object_name = 'recipe'
 
+    def get_cache_namespaces(self):
+        return recipe_cache.recipe_namespace(self.kwargs['pk']), recipe_cache.CATEGORIES, recipe_cache.NEIGHBORS
+
+    def get_queryset(self):
+        return Recipe.active.select_related('created_by').prefetch_related('categories', recipe_ingredients_prefetch())
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['average_rating'] = self.object.average_rating()
+        context['similar_recipes'] = similar_recipes(self.object.pk)
+        context['comments_page'] = lazy_comment_page(self.object.pk)
+        return context
+
+
+def lazy_comment_page(recipe_id):
+    # Первая страница комментариев загружается при рендеринге, то есть только если фрагмент не закеширован
+    return SimpleLazyObject(lambda: recipe_comments.comment_page(recipe_id))
+
+
+class RecipeCommentsView(CachedPageMixin, TemplateView):
+    """
+    Фрагмент со следующей страницей комментариев рецепта (?cursor=) для кнопки «Показать еще».
+    """
+    template_name = 'recipeapp/recipe/comment-list.html'
+
+    def get_cache_namespaces(self):
+        return (recipe_cache.recipe_namespace(self.kwargs['pk']),)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(
+            recipe_id=self.kwargs['pk'],
+            comments_page=recipe_comments.comment_page(self.kwargs['pk'], self.request.GET.get('cursor')),
+        )
+        return context
+
+
+async def _alist(queryset):
+    return [obj async for obj in queryset]
+
+
+def _set_prefetched(instance, name, objects):
+    # Связанные записи, загруженные отдельно, подставляются так же, как это делает prefetch_related
+    queryset = getattr(instance, name).all()
+    queryset._result_cache = objects
+    queryset._prefetch_done = True
+    instance.__dict__.setdefault('_prefetched_objects_cache', {})[name] = queryset
+
+
+class AsyncRecipeIndexView(RecipeIndexView):
+    """
+    Асинхронный вариант главной страницы: рецепты, категории с числом рецептов и общее количество
+    запрашиваются одновременно.
+    """
+    async def get(self, request, *args, **kwargs):
+        # Полнотекстовый поиск выполняется синхронным курсором
+        queryset = await sync_to_async(self.get_queryset)()
+        facet_filters = self.get_filters().without_categories()
+        (paginator, page, recipes, is_paginated), categories, total, cache_context = await asyncio.gather(
+            self.apaginate_queryset(queryset, self.paginate_by),
+            sync_to_async(facets.category_facets)(facet_filters),
+            aapproximate_count(queryset),
+            sync_to_async(self.get_cache_context)(),
+        )
+        self.object_list = recipes
+        return TemplateResponse(request, self.get_template_names(), {
+            'view': self,
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': is_paginated,
+            'object_list': recipes,
+            'recipes': recipes,
+            'categories': categories,
+            'facet_query': facet_filters.key,
+            'total_recipes': total,
+            **cache_context,
+        })
+
+
+class AsyncIngredientListView(IngredientListView):
+    """
+    Асинхронный вариант списка ингредиентов.
+    """
+    async def get(self, request, *args, **kwargs):
+        (paginator, page, ingredients, is_paginated), cache_context = await asyncio.gather(
+            self.apaginate_queryset(self.get_queryset(), self.paginate_by),
+            sync_to_async(self.get_cache_context)(),
+        )
+        self.object_list = ingredients
+        return TemplateResponse(request, self.get_template_names(), {
+            'view': self,
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': is_paginated,
+            'object_list': ingredients,
+            'ingredients': ingredients,
+            'sort': self.get_sort(),
+            **cache_context,
+        })
+
+
+class AsyncRecipeDetailView(RecipeDetailView):
+    """
+    Асинхронный вариант страницы рецепта: рецепт, категории и ингредиенты
+    запрашиваются одновременно, а не друг за другом.
+    """
+    async def aget_object(self):
+        try:
+            return await Recipe.active.select_related('created_by').aget(pk=self.kwargs['pk'])
+        except Recipe.DoesNotExist:
+            raise Http404('Рецепт не найден')
+
+    async def get(self, request, *args, **kwargs):
+        pk = self.kwargs['pk']
+        recipe, categories, recipe_ingredients, cache_context = await asyncio.gather(
+            self.aget_object(),
+            _alist(Category.objects.filter(recipes=pk)),
+            _alist(RecipeIngredient.objects.filter(recipe=pk).select_related('ingredient')),
+            sync_to_async(self.get_cache_context)(),
+        )
+        _set_prefetched(recipe, 'categories', categories)
+        _set_prefetched(recipe, 'recipe_ingredients', recipe_ingredients)
+
+        self.object = recipe
+        return TemplateResponse(request, self.get_template_names(), {
+            'view': self,
+            'object': recipe,
+            'recipe': recipe,
+            'average_rating': recipe.average_rating(),
+            'similar_recipes': similar_recipes(pk),
+            'comments_page': lazy_comment_page(pk),
+            **cache_context,
+        })
+
+
+class PantryView(TemplateView):
+    """
+    «Что приготовить»: рецепты по имеющимся ингредиентам (?ingredient=…), без исключенных
+    (?exclude=…), с долей покрытия не меньше ?coverage= процентов.
+    """
+    template_name = 'recipeapp/recipe/recipe-pantry.html'
+    default_coverage = 50
+    limit = 30
+
+    def get_ids(self, name):
+        return [int(value) for value in self.request.GET.getlist(name) if value.isdigit()]
+
+    def get_coverage(self):
+        try:
+            return min(max(int(self.request.GET.get('coverage', self.default_coverage)), 1), 100)
+        except ValueError:
+            return self.default_coverage
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        selected, excluded, coverage = self.get_ids('ingredient'), self.get_ids('exclude'), self.get_coverage()
+        names = dict(Ingredient.objects.filter(pk__in=selected + excluded).values_list('pk', 'name'))
+        matches = pantry.find_recipes(selected, excluded, coverage / 100, self.limit) if selected else []
+        context.update({
+            'selected': [(pk, names[pk]) for pk in selected if pk in names],
+            'excluded': [(pk, names[pk]) for pk in excluded if pk in names],
+            'coverage': coverage,
+            'results': pantry.describe(matches),
+        })
         return context
 
 
+class ShoppingListView(TemplateView):
+    """
+    Список покупок по плану меню: ?recipe=…&servings=… (см. recipeapp.shopping).
+    С ?format=csv или ?format=text список отдается файлом.
+    """
+    template_name = 'recipeapp/recipe/recipe-shopping-list.html'
+    export_formats = ('csv', 'text')
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get('format')
+        try:
+            plan = shopping.parse_plan(request.GET.getlist('recipe'), request.GET.getlist('servings'))
+        except ValueError as error:
+            if export_format in self.export_formats:
+                return HttpResponseBadRequest(str(error), content_type='text/plain; charset=utf-8')
+            return self.render_to_response(self.get_context_data(error=str(error)))
+
+        shopping_list = shopping.build_shopping_list(plan)
+        if export_format == 'csv':
+            return self.render_csv(shopping_list)
+        if export_format == 'text':
+            return self.render_text(shopping_list)
+        return self.render_to_response(self.get_context_data(
+            recipes=[
+                {'id': recipe_id, 'name': name, 'servings': shopping.format_quantity(servings)}
+                for recipe_id, name, servings in shopping_list.recipes
+            ],
+            items=[
+                {'name': item.name, 'quantity': shopping.format_quantity(item.quantity), 'unit': item.unit,
+                 'recipe_count': len(item.recipe_ids)}
+                for item in shopping_list.items
+            ],
+            query=request.GET.urlencode(),
+        ))
+
+    def render_csv(self, shopping_list):
+        response = HttpResponse(content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="shopping-list.csv"'
+        writer = csv.writer(response)
+        writer.writerow(['Продукт', 'Количество', 'Единица', 'Рецептов'])
+        for item in shopping_list.items:
+            writer.writerow([item.name, shopping.format_quantity(item.quantity), item.unit, len(item.recipe_ids)])
+        return response
+
+    def render_text(self, shopping_list):
+        lines = ['Список покупок', '']
+        lines += [
+            f'- {item.name}: {shopping.format_quantity(item.quantity)} {item.unit}'.rstrip()
+            for item in shopping_list.items
+        ]
+        lines += ['', 'Рецепты:']
+        lines += [f'- {name} x {shopping.format_quantity(servings)}' for _, name, servings in shopping_list.recipes]
+        return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; charset=utf-8')
+
+
 def user_form(request: HttpRequest) -> HttpResponse:
     if request.method == 'POST':
         form = UserBioForm(request.POST)
@@ -153,45 +413,49 @@ def user_form(request: HttpRequest) -> HttpResponse:
     return render(request, 'recipeapp/user-bio-form.html', context=context)
 
 
-class RecipeCreateView(LoginRequiredMixin, CreateView):
-    model = Recipe
-    form_class = RecipeForm
-    template_name = 'recipeapp/recipe/recipe-create.html'
-    success_url = reverse_lazy('recipeapp:recipe_index')  # Перенаправление на список рецептов
+class RecipeIngredientsMixin:
+    """
+    Форма рецепта вместе с набором строк ингредиентов (RecipeIngredientFormSet).
+    Ингредиенты выбираются через поиск api_ingredient_search, поэтому страница не
+    содержит весь каталог.
+    """
+    ingredient_prefix = 'ingredients'
+
+    def get_ingredient_initial(self):
+        return []
+
+    def get_ingredient_formset(self):
+        if self.request.method == 'POST':
+            return RecipeIngredientFormSet(self.request.POST, prefix=self.ingredient_prefix)
+        return RecipeIngredientFormSet(initial=self.get_ingredient_initial(), prefix=self.ingredient_prefix)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['ingredients'] = Ingredient.objects.filter(archived=False)
+        context.setdefault('ingredient_formset', self.get_ingredient_formset())
         return context
 
     def form_valid(self, form):
-        recipe = form.save(commit=False)
-        recipe.created_by = self.request.user
-        recipe.save()
-
-        selected_categories = form.cleaned_data['categories']
-        recipe.categories.set(selected_categories)
-
-        ingredients = Ingredient.objects.filter(archived=False)
-        selected_ingredient_ids = []
+        formset = self.get_ingredient_formset()
+        if not formset.is_valid():
+            return self.render_to_response(self.get_context_data(form=form, ingredient_formset=formset))
+        with transaction.atomic():
+            self.object = form.save()
+            save_recipe_ingredients(self.object, formset.rows())
+        return HttpResponseRedirect(self.get_success_url())
 
-        for ingredient in ingredients:
-            ingredient_id = ingredient.id
-            is_selected = self.request.POST.get(f'ingredient_{ingredient_id}') == 'on'
-            quantity = self.request.POST.get(f'quantity_{ingredient_id}', 1)
 
-            if is_selected:
-                RecipeIngredient.objects.create(
-                    recipe=recipe,
-                    ingredient=ingredient,
-                    quantity=quantity
-                )
-                selected_ingredient_ids.append(ingredient_id)  # Сохраняем ID выбранных ингредиентов
+class RecipeCreateView(LoginRequiredMixin, RecipeIngredientsMixin, CreateView):
+    model = Recipe
+    form_class = RecipeForm
+    template_name = 'recipeapp/recipe/recipe-create.html'
+    success_url = reverse_lazy('recipeapp:recipe_index')  # Перенаправление на список рецептов
 
+    def form_valid(self, form):
+        form.instance.created_by = self.request.user
         return super().form_valid(form)
 
 
-class RecipeUpdateView(UpdateView):
+class RecipeUpdateView(RecipeIngredientsMixin, UpdateView):
     model = Recipe
     form_class = RecipeForm
     template_name = 'recipeapp/recipe/recipe-update.html'
@@ -199,51 +463,20 @@ class RecipeUpdateView(UpdateView):
     def get_success_url(self):
         return reverse_lazy('recipeapp:recipe_detail', kwargs={'pk': self.object.pk})
 
+    def get_ingredient_initial(self):
+        # Ингредиенты из архива в форму не попадают и при сохранении удаляются из рецепта
+        rows = (self.object.recipe_ingredients.filter(ingredient__archived=False).order_by('ingredient__name')
+                .values_list('ingredient_id', 'quantity', 'ingredient__name', 'ingredient__measure'))
+        return [
+            {'ingredient': ingredient_id, 'quantity': quantity, 'name': name, 'measure': measure}
+            for ingredient_id, quantity, name, measure in rows
+        ]
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        ingredients = Ingredient.objects.filter(archived=False)
-        existing_ingredients = {ri.ingredient.id: ri.quantity for ri in self.object.recipe_ingredients.all()}
-        context['ingredients'] = ingredients
-        context['existing_ingredients'] = existing_ingredients
         context['selected_categories'] = self.object.categories.all()  # Передаем выбранные категории в контекст
         return context
 
-    def post(self, request, *args, **kwargs):
-        self.object = self.get_object()
-        form = self.get_form()
-        if form.is_valid():
-            self.object = form.save()
-
-            # Обновляем категории
-            selected_categories = form.cleaned_data['categories']
-            self.object.categories.set(selected_categories)
-
-            # Получаем все ингредиенты
-            ingredients = Ingredient.objects.filter(archived=False)
-            selected_ingredient_ids = []
-
-            for ingredient in ingredients:
-                ingredient_id = ingredient.id
-                is_selected = request.POST.get(f'ingredient_{ingredient_id}') == 'on'
-                quantity = request.POST.get(f'quantity_{ingredient_id}', 1)
-
-                if is_selected:
-                    # Если ингредиент выбран, обновляем или создаем его
-                    RecipeIngredient.objects.update_or_create(
-                        recipe=self.object,
-                        ingredient=ingredient,
-                        defaults={'quantity': quantity}
-                    )
-                    selected_ingredient_ids.append(ingredient_id)  # Сохраняем ID выбранных ингредиентов
-
-            # Удаляем только те ингредиенты, которые не были выбраны
-            RecipeIngredient.objects.filter(recipe=self.object).exclude(
-                ingredient__id__in=selected_ingredient_ids).delete()
-
-            return self.form_valid(form)
-        else:
-            return self.form_invalid(form)
-
 
 class RecipeDeleteView(LoginRequiredMixin, DeleteView):
     model = Recipe
@@ -251,23 +484,38 @@ class RecipeDeleteView(LoginRequiredMixin, DeleteView):
 
 
 @login_required
+@ratelimit('comment')
 def add_comment(request, pk):
     recipe = get_object_or_404(Recipe, pk=pk)
     if request.method == 'POST':
         text = request.POST.get('text')
-        Comment.objects.create(recipe=recipe, user=request.user, text=text)
+        # Комментарий и счетчик комментариев рецепта сохраняются в одной транзакции
+        recipe_comments.add_comment(recipe.pk, request.user, text)
     return redirect('recipeapp:recipe_detail', pk=pk)
 
 
 @login_required
+@ratelimit('rating')
 def rate_recipe(request, pk):
     recipe = get_object_or_404(Recipe, pk=pk)
     if request.method == 'POST':
-        rating = int(request.POST.get('rating', 0))
-        Rating.objects.update_or_create(
-            recipe=recipe,
-            user=request.user,
-            defaults={'value': rating}
-        )
+        try:
+            rating = parse_rating(request.POST.get('rating'))
+        except ValueError as error:
+            return HttpResponseBadRequest(str(error), content_type='text/plain; charset=utf-8')
+        # Оценка и агрегаты рейтинга рецепта обновляются в одной транзакции,
+        # при RECIPE_RATING_COALESCE_SECONDS - пакетом вместе с другими оценками
+        submit_rating(recipe.pk, request.user, rating)
     return redirect('recipeapp:recipe_detail', pk=pk)
 
+
+def profiling_metrics(request):
+    """
+    Агрегаты ProfilingMiddleware по именам URL: JSON или ?format=prometheus. Доступно только персоналу.
+    """
+    if not profiling_enabled() or not request.user.is_staff:
+        raise Http404
+    snapshot = registry.snapshot()
+    if request.GET.get('format') == 'prometheus':
+        return HttpResponse(render_prometheus(snapshot), content_type='text/plain; version=0.0.4; charset=utf-8')
+    return JsonResponse(snapshot, json_dumps_params={'ensure_ascii': False})